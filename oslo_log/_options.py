@@ -167,6 +167,67 @@ generic_log_opts = [
         ignore_case=True,
         help='Log rotation type.',
     ),
+    cfg.StrOpt(
+        'log_rotation_compression',
+        choices=[
+            ('gzip', 'Compress the rotated log files with gzip.'),
+            ('zstd', 'Compress the rotated log files with zstandard.'),
+        ],
+        help='Compress the rotated log files in the background. zstd '
+        'requires Python 3.14 or the zstandard library. The backups are '
+        'still counted by max_logfile_count. This option is ignored unless '
+        'log_rotation_type is set.',
+    ),
+    cfg.IntOpt(
+        'log_file_buffer_size',
+        default=0,
+        min=0,
+        help='Number of bytes of log records to buffer in memory before '
+        'writing them to the log file together. The buffered records are '
+        'also written after log_file_flush_interval and as soon as an '
+        'ERROR or CRITICAL record is logged. 0 disables the buffering.',
+    ),
+    cfg.IntOpt(
+        'log_file_flush_interval',
+        default=50,
+        min=1,
+        help='Maximum number of milliseconds a log record stays in the '
+        'buffer of the log file. This option is ignored unless '
+        'log_file_buffer_size is set.',
+    ),
+    cfg.IntOpt(
+        'log_file_watch_interval',
+        default=0,
+        min=0,
+        help='Minimum number of milliseconds between two checks of whether '
+        'the log file was moved or deleted, for example by logrotate. The '
+        'records logged in the meantime still go to the moved file. 0 '
+        'checks the log file for every record. The log file is also '
+        'reopened when the configuration is reloaded, on SIGHUP. This '
+        'option is ignored if log_rotation_type is set.',
+    ),
+    cfg.BoolOpt(
+        'log_file_inotify',
+        default=False,
+        help='Use inotify to learn when the log file is moved or deleted, '
+        'rather than checking it. This is only available on Linux, '
+        'log_file_watch_interval applies otherwise. This option is ignored '
+        'if log_rotation_type is set.',
+    ),
+    cfg.StrOpt(
+        'syslog_address',
+        help='Path of the local syslog socket, for example /dev/log, to '
+        'write RFC 5424 messages to, carrying the request ID and project ID '
+        'as structured data. By default the messages are sent through the '
+        'syslog function of the C library. This option is ignored unless '
+        'use_syslog is set.',
+    ),
+    cfg.BoolOpt(
+        'syslog_batch',
+        default=False,
+        help='Write the syslog messages from a background thread, in '
+        'batches. This option is ignored unless syslog_address is set.',
+    ),
 ]
 
 log_opts = [
@@ -233,6 +294,82 @@ log_opts = [
         help='The format for an instance UUID that is passed with the '
         'log message.',
     ),
+    cfg.StrOpt(
+        'json_encoder',
+        default='stdlib',
+        choices=[
+            ('stdlib', 'The json module of the standard library.'),
+            ('orjson', 'The orjson library, which must be installed.'),
+            ('ujson', 'The ujson library, which must be installed.'),
+        ],
+        help='Library used to serialize the log records when use_json is '
+        'set. orjson and ujson are faster but produce compact output '
+        'without escaping non-ASCII characters, and orjson writes NaN '
+        'and infinite floats as null.',
+    ),
+    cfg.ListOpt(
+        'json_fields',
+        default=[],
+        help='Keys of the JSON log records to emit when use_json is set, '
+        'e.g. "asctime,levelname,name,message,context,traceback". All of '
+        'them are emitted when empty.',
+    ),
+    cfg.BoolOpt(
+        'json_static_fields',
+        default=False,
+        help='Serialize the hostname, process and process_name keys of the '
+        'JSON log records once per process rather than for every record '
+        'when use_json is set. These keys then come first in every '
+        'record.',
+    ),
+    cfg.BoolOpt(
+        'json_traceback_frames',
+        default=False,
+        help='Add the frames of the traceback of the logged exception to '
+        'the JSON log records, under the traceback_frames key, when '
+        'use_json is set.',
+    ),
+    cfg.BoolOpt(
+        'json_context_delta',
+        default=False,
+        help='Emit the context of a request in full only in its first JSON '
+        'log record, and as a reference to its request_id in the next ones '
+        'until it changes, when use_json is set. The convert-json command '
+        'restores the referenced contexts, provided it reads the records '
+        'from the start of the request. The contexts are emitted in full '
+        'again in every new log file.',
+    ),
+    cfg.BoolOpt(
+        'log_async',
+        default=False,
+        help='Pass the log records to the log handlers through a bounded '
+        'queue emptied by a dedicated writer thread, so that logging does '
+        'not wait for the handlers to write the records out. The messages '
+        'are rendered when they are logged, so the "args" field of the JSON '
+        'format is empty.',
+    ),
+    cfg.IntOpt(
+        'log_async_queue_size',
+        default=10000,
+        min=1,
+        help='Maximum number of log records waiting in the queue when '
+        'log_async is set.',
+    ),
+    cfg.StrOpt(
+        'log_async_overflow',
+        default='block',
+        choices=[
+            ('block', 'Wait for room in the queue.'),
+            (
+                'drop-debug',
+                'Drop the DEBUG records, queued ones included, to make room '
+                'for the others.',
+            ),
+            ('drop-newest', 'Drop the records logged while it is full.'),
+        ],
+        help='What to do with a log record when the queue of log_async is '
+        'full. The number of dropped records is logged as a warning.',
+    ),
     cfg.IntOpt(
         'rate_limit_interval',
         default=0,
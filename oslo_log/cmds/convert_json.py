@@ -13,16 +13,19 @@
 
 import argparse
 import collections
-from collections.abc import Callable, Iterator, Sequence
+from collections.abc import Callable, Iterable, Iterator, Sequence
 import functools
 import io
+import itertools
 import sys
 import time
-from typing import cast
+from typing import Any, BinaryIO, cast
 
+import msgpack
 from oslo_serialization import jsonutils
 from oslo_utils import importutils
 
+from oslo_log import formatters
 from oslo_log.formatters import JSONLogRecord
 from oslo_log import log
 
@@ -32,6 +35,8 @@ termcolor = importutils.try_import('termcolor')
 _USE_COLOR = False
 DEFAULT_LEVEL_KEY = 'levelname'
 DEFAULT_TRACEBACK_KEY = 'traceback'
+# The number of request contexts kept to resolve the context references
+_CONTEXTS_SIZE = 65536
 
 
 def main() -> None:
@@ -47,6 +52,17 @@ def main() -> None:
         level_key=args.levelkey,
         traceback_key=args.tbkey,
     )
+    if args.msgpack:
+        # argparse opens the file in text mode
+        fh = args.file.buffer
+        try:
+            for line in reformat_msgpack(
+                fh, formatter, args.follow, args.lines
+            ):
+                print(line)
+        except KeyboardInterrupt:
+            sys.exit(0)
+        return
     if args.lines:
         # Read backward until we find all of our newline characters
         # or reach the beginning of the file
@@ -118,6 +134,13 @@ def parse_args() -> argparse.Namespace:
         " (May show less than N records when used"
         " in conjuction with --loggers or --levels)",
     )
+    parser.add_argument(
+        "--msgpack",
+        action='store_true',
+        default=False,
+        help="Read the length-prefixed MessagePack records written by"
+        " oslo_log.formatters.MsgpackFormatter",
+    )
     parser.add_argument(
         "--loggers",
         nargs='*',
@@ -161,11 +184,41 @@ def warn(prefix: str, msg: object) -> str:
     return "{}: {}".format(colorise('exc', prefix), msg)
 
 
+def inflate_context(
+    record: dict[str, Any],
+    contexts: collections.OrderedDict[str, dict[str, Any]],
+) -> dict[str, Any]:
+    """Resolve the context reference of a record.
+
+    JSONFormatter emits the context of a request in full only in its first
+    record with context_delta, and as ``{"$ref": <request_id>}`` in the
+    next ones. The full contexts are remembered in contexts, the references
+    to the contexts which were not read are left as they are.
+    """
+    context = record.get('context')
+    if not isinstance(context, dict):
+        return record
+    request_id = context.get(formatters._CONTEXT_REF)
+    if len(context) == 1 and isinstance(request_id, str):
+        if request_id in contexts:
+            record['context'] = contexts[request_id]
+        return record
+    request_id = context.get('request_id')
+    if isinstance(request_id, str):
+        contexts[request_id] = context
+        contexts.move_to_end(request_id)
+        if len(contexts) > _CONTEXTS_SIZE:
+            contexts.popitem(last=False)
+    return record
+
+
 def reformat_json(
     fh: io.StringIO,
     formatter: Callable[..., Iterator[str]],
     follow: bool = False,
 ) -> Iterator[str]:
+    contexts: collections.OrderedDict[str, dict[str, Any]]
+    contexts = collections.OrderedDict()
     # using readline allows interactive stdin to respond to every line
     while True:
         line = fh.readline()
@@ -183,9 +236,72 @@ def reformat_json(
         except ValueError:
             yield warn("Not JSON", line)
             continue
+        if isinstance(record, dict):
+            record = inflate_context(record, contexts)
         yield from formatter(record)
 
 
+def _read(fh: BinaryIO, size: int, follow: bool) -> bytes:
+    data = fh.read(size)
+    while follow and len(data) < size:
+        time.sleep(0.1)
+        data += fh.read(size - len(data))
+    return data
+
+
+def read_msgpack(
+    fh: BinaryIO, follow: bool = False
+) -> Iterator[dict[str, Any] | bytes]:
+    """Yield the records of a MsgpackFormatter stream.
+
+    The undecodable data found is yielded as bytes, after which the
+    stream cannot be read further.
+    """
+    while True:
+        header = _read(fh, 4, follow)
+        if not header:
+            return
+        payload = b''
+        if len(header) == 4:
+            size = int.from_bytes(header, 'big')
+            payload = _read(fh, size, follow)
+            if len(payload) == size:
+                try:
+                    record = msgpack.unpackb(
+                        payload, raw=False, strict_map_key=False
+                    )
+                except ValueError:
+                    record = None
+                if isinstance(record, dict):
+                    yield record
+                    continue
+        yield header + payload
+        return
+
+
+def reformat_msgpack(
+    fh: BinaryIO,
+    formatter: Callable[..., Iterator[str]],
+    follow: bool = False,
+    lines: int | None = None,
+) -> Iterator[str]:
+    records: Iterable[dict[str, Any] | bytes] = read_msgpack(fh, follow)
+    if lines:
+        # The frames can only be read forward, so read them all and keep
+        # the last ones before following the stream.
+        tail = collections.deque(read_msgpack(fh), maxlen=lines)
+        records = itertools.chain(
+            tail, read_msgpack(fh, follow) if follow else ()
+        )
+    contexts: collections.OrderedDict[str, dict[str, Any]]
+    contexts = collections.OrderedDict()
+    for record in records:
+        if isinstance(record, bytes):
+            yield warn("Not MessagePack", record[:80])
+            return
+        yield from formatter(inflate_context(record, contexts))
+
+
 def console_format(
     prefix: str,
     locator: str,
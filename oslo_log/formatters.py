@@ -10,26 +10,44 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
+import bisect
+import collections
+from collections.abc import Callable
+from collections.abc import Iterable
 import datetime
 import functools
-import io
 import itertools
+import json
+import linecache
 import logging
 import logging.config
 import logging.handlers
+import math
+import operator
+import os
 import re
 import socket
 import sys
+import threading
+import time
 import traceback
-from types import TracebackType
-from typing import Any, TypeAlias, TypedDict
+from types import CodeType, TracebackType
+from typing import Any, NamedTuple, NotRequired, TypeAlias, TypedDict
+import weakref
 
 from dateutil import tz
+import msgpack
 
 from oslo_config import cfg
 from oslo_context import context as context_utils
 from oslo_serialization import jsonutils
 from oslo_utils import encodeutils
+from oslo_utils import importutils
+
+orjson = importutils.try_import('orjson')
+ujson = importutils.try_import('ujson')
+otel_trace = importutils.try_import('opentelemetry.trace')
 
 _SysExcInfoType: TypeAlias = (
     tuple[type[BaseException], BaseException, TracebackType | None]
@@ -37,11 +55,46 @@ _SysExcInfoType: TypeAlias = (
 )
 
 
+class _ContextValues(NamedTuple):
+    stamp: tuple[Any, ...]
+    values: dict[str, Any]
+    user_identity: dict[str, str]
+
+
+# The logging values of a context do not change for the duration of a
+# request, so compute them once per context rather than once per record and
+# handler. Contexts are mutable though, so the cached values are stamped
+# with the attributes they were computed from.
+_CONTEXT_CACHE: weakref.WeakKeyDictionary[
+    context_utils.RequestContext, _ContextValues
+] = weakref.WeakKeyDictionary()
+
+
+def _get_context_values(
+    context: context_utils.RequestContext,
+) -> _ContextValues:
+    stamp = tuple(vars(context).values())
+    try:
+        entry = _CONTEXT_CACHE.get(context)
+    except TypeError:
+        # unhashable context subclass
+        return _ContextValues(stamp, context.get_logging_values(), {})
+
+    if entry is None or entry.stamp != stamp:
+        entry = _ContextValues(stamp, context.get_logging_values(), {})
+        _CONTEXT_CACHE[context] = entry
+    return entry
+
+
 def _dictify_context(
     context: context_utils.RequestContext | dict[str, Any],
 ) -> dict[str, Any]:
+    """Return the logging values of a context.
+
+    The returned dictionary may be shared and must not be modified.
+    """
     if isinstance(context, context_utils.RequestContext):
-        return context.get_logging_values()
+        return _get_context_values(context).values
     # This dict only style logging format will become deprecated
     # when projects using a dictionary object for context are updated
     elif isinstance(context, dict):
@@ -50,6 +103,21 @@ def _dictify_context(
     return {}
 
 
+def _get_user_identity(
+    context: context_utils.RequestContext | dict[str, Any], fmt: str
+) -> str:
+    """Render the logging_user_identity_format for a context."""
+    if not isinstance(context, context_utils.RequestContext):
+        return fmt % _ReplaceFalseValue(_dictify_context(context))
+
+    entry = _get_context_values(context)
+    user_identity = entry.user_identity.get(fmt)
+    if user_identity is None:
+        user_identity = fmt % _ReplaceFalseValue(entry.values)
+        entry.user_identity[fmt] = user_identity
+    return user_identity
+
+
 # A configuration object is given to us when the application registers
 # the logging options.
 _CONF = None
@@ -60,6 +128,13 @@ def _store_global_conf(conf: cfg.ConfigOpts) -> None:
     _CONF = conf
 
 
+# The context each record was updated with by _update_record_with_context().
+# NOTE: The context is kept out of the record, which handlers may serialize.
+_record_contexts: weakref.WeakKeyDictionary[
+    logging.LogRecord, context_utils.RequestContext | None
+] = weakref.WeakKeyDictionary()
+
+
 def _update_record_with_context(
     record: logging.LogRecord,
 ) -> context_utils.RequestContext | None:
@@ -67,15 +142,22 @@ def _update_record_with_context(
 
     The request context, if there is one, will either be passed with the
     incoming record or in the global thread-local store.
+
+    A record is only updated once, no matter how many formatters see it.
     """
+    try:
+        return _record_contexts[record]
+    except KeyError:
+        pass
+
     context = record.__dict__.get('context', context_utils.get_current())
     if context:
         d = _dictify_context(context)
         # Copy the context values directly onto the record so they can be
         # used by the formatting strings.
-        for k, v in d.items():
-            setattr(record, k, v)
+        record.__dict__.update(d)
 
+    _record_contexts[record] = context
     return context
 
 
@@ -90,6 +172,44 @@ def _ensure_unicode(msg: Any) -> str:
     )
 
 
+# Name of the record attribute holding the error summary computed by
+# _get_error_summary().
+_ERROR_SUMMARY_MARKER = '_oslo_log_error_summary'
+
+# The summaries of the exceptions seen recently. The same exception is
+# often logged more than once, at different levels of the stack or by
+# several handlers.
+_EXCEPTION_SUMMARIES: weakref.WeakKeyDictionary[BaseException, str] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _summarize_exception(
+    exc_type: type[BaseException], exc: BaseException
+) -> str:
+    """Return the last line of the traceback of an exception.
+
+    The TypeError raised for exceptions which cannot be rendered is left
+    to the caller.
+    """
+    cacheable = type(exc) is exc_type
+    if cacheable:
+        try:
+            summary = _EXCEPTION_SUMMARIES.get(exc)
+        except TypeError:
+            # unhashable exception, or a builtin one which cannot be weakly
+            # referenced
+            summary = None
+            cacheable = False
+        if summary is not None:
+            return summary
+
+    summary = traceback.format_exception_only(exc_type, exc)[0].rstrip()
+    if cacheable:
+        _EXCEPTION_SUMMARIES[exc] = summary
+    return summary
+
+
 def _get_error_summary(record: logging.LogRecord) -> str:
     """Return the error summary
 
@@ -101,7 +221,14 @@ def _get_error_summary(record: logging.LogRecord) -> str:
     If there is an active exception, format it and return the
     resulting string.
 
+    The summary is computed once per record, no matter how many formatters
+    see it.
     """
+    try:
+        return record.__dict__[_ERROR_SUMMARY_MARKER]  # type: ignore[no-any-return]
+    except KeyError:
+        pass
+
     error_summary = ''
     if record.levelno < logging.WARNING:
         return ''
@@ -144,10 +271,13 @@ def _get_error_summary(record: logging.LogRecord) -> str:
             # Build the exception summary in the line with the
             # primary log message, to serve as a mnemonic for error
             # and warning cases.
-            error_summary = traceback.format_exception_only(
-                exc_info[0],
-                exc_info[1],
-            )[0].rstrip()
+            if exc_info[1] is None:
+                error_summary = traceback.format_exception_only(
+                    exc_info[0],
+                    exc_info[1],
+                )[0].rstrip()
+            else:
+                error_summary = _summarize_exception(exc_info[0], exc_info[1])
             # If the exc_info wasn't explicitly passed to us, take only the
             # first line of it. _Remote exceptions from oslo.messaging append
             # the full traceback to the exception message, so we want to avoid
@@ -164,9 +294,251 @@ def _get_error_summary(record: logging.LogRecord) -> str:
             # references.
             del exc_info
 
+    record.__dict__[_ERROR_SUMMARY_MARKER] = error_summary
     return error_summary
 
 
+class TracebackCacheInfo(NamedTuple):
+    """Statistics of the formatted traceback cache."""
+
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+def _exception_key(
+    exc: BaseException,
+    tb: TracebackType | None,
+    seen: set[int],
+) -> tuple[Any, ...] | None:
+    """Return what the formatted traceback of an exception depends on.
+
+    None is returned for exceptions whose rendering depends on more than
+    their type, message, notes and frames.
+    """
+    if isinstance(exc, SyntaxError | BaseExceptionGroup):
+        return None
+
+    notes = getattr(exc, '__notes__', None)
+    if notes is not None:
+        if not isinstance(notes, list | tuple):
+            return None
+        notes = tuple(notes)
+
+    seen.add(id(exc))
+    frames = []
+    while tb is not None:
+        # NOTE: The last instruction locates the error markers rendered
+        # under the source lines.
+        frames.append((tb.tb_frame.f_code, tb.tb_lineno, tb.tb_lasti))
+        tb = tb.tb_next
+
+    chained: tuple[Any, ...] | None = None
+    if exc.__cause__ is not None:
+        chained = (True, exc.__cause__)
+    elif exc.__context__ is not None and not exc.__suppress_context__:
+        chained = (False, exc.__context__)
+    if chained is not None:
+        explicit, chained_exc = chained
+        if id(chained_exc) in seen:
+            chained = None
+        else:
+            chained_key = _exception_key(
+                chained_exc, chained_exc.__traceback__, seen
+            )
+            if chained_key is None:
+                return None
+            chained = (explicit, chained_key)
+
+    return (type(exc), str(exc), notes, tuple(frames), chained)
+
+
+class _TracebackCache:
+    """A bounded LRU of formatted tracebacks.
+
+    Retry loops log the same exception raised from the same frames over and
+    over, so keep the result of traceback.format_exception() rather than
+    walking the frames and reading the source lines every time.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._cache: collections.OrderedDict[
+            tuple[Any, ...], tuple[str, ...]
+        ] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def format_exception(self, ei: _SysExcInfoType) -> tuple[str, ...]:
+        """Return what traceback.format_exception() would, as a tuple."""
+        key = None
+        if ei[1] is not None:
+            try:
+                key = _exception_key(ei[1], ei[2], set())
+            except Exception:
+                # e.g. an exception whose __str__ is broken, leave it to
+                # the traceback module to deal with
+                key = None
+
+        if key is not None:
+            with self._lock:
+                lines = self._cache.get(key)
+                if lines is not None:
+                    self._cache.move_to_end(key)
+                    self._hits += 1
+                    return lines
+                self._misses += 1
+
+        lines = tuple(traceback.format_exception(*ei))
+
+        if key is not None:
+            with self._lock:
+                self._cache[key] = lines
+                if len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+        return lines
+
+    def info(self) -> TracebackCacheInfo:
+        with self._lock:
+            return TracebackCacheInfo(
+                self._hits, self._misses, self.maxsize, len(self._cache)
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._hits = self._misses = 0
+
+
+_TRACEBACK_CACHE = _TracebackCache(256)
+
+
+def get_traceback_cache_info() -> TracebackCacheInfo:
+    """Return the hits, misses and size of the formatted traceback cache.
+
+    The cache is shared by all the formatters of the process.
+    """
+    return _TRACEBACK_CACHE.info()
+
+
+class _TimestampCache:
+    """Render the second-resolution part of timestamps once per second.
+
+    Most records logged within the same second share everything but the
+    sub-second part of their timestamps, so keep the last rendered second
+    for every date format and splice the milliseconds or microseconds in.
+    """
+
+    def __init__(self) -> None:
+        self._asctime: dict[tuple[Any, ...], tuple[int, Any, str]] = {}
+        self._isotime: tuple[int, Any, str, str] | None = None
+
+    def asctime(
+        self,
+        formatter: logging.Formatter,
+        record: logging.LogRecord,
+        datefmt: str | None,
+    ) -> str:
+        """Return what logging.Formatter.formatTime() would."""
+        second = int(record.created)
+        # NOTE: time.tzset() replaces time.tzname, which lets us notice
+        # when the local timezone has been changed.
+        tzname = time.tzname
+        key = (datefmt, formatter.converter, formatter.default_time_format)
+        entry = self._asctime.get(key)
+        if entry is None or entry[0] != second or entry[1] is not tzname:
+            ct = formatter.converter(record.created)
+            entry = (
+                second,
+                tzname,
+                time.strftime(datefmt or formatter.default_time_format, ct),
+            )
+            self._asctime[key] = entry
+
+        if datefmt or not formatter.default_msec_format:
+            return entry[2]
+        return formatter.default_msec_format % (entry[2], record.msecs)
+
+    def isotime(self, created: float) -> str:
+        """Return the local ISO 8601 timestamp with microseconds."""
+        # NOTE: Round the same way datetime.fromtimestamp() does.
+        second = int(created)
+        microsecond = round((created - second) * 1e6)
+        if microsecond >= 1000000:
+            second += 1
+            microsecond -= 1000000
+
+        tzname = time.tzname
+        entry = self._isotime
+        if entry is None or entry[0] != second or entry[1] is not tzname:
+            # The UTC offset is computed for every second so DST
+            # transitions are honored.
+            isotime = (
+                datetime.datetime.fromtimestamp(second)
+                .replace(microsecond=0, tzinfo=tz.tzlocal())
+                .isoformat()
+            )
+            entry = (second, tzname, isotime[:19], isotime[19:])
+            self._isotime = entry
+
+        return f'{entry[2]}.{microsecond:06d}{entry[3]}'
+
+
+_TIMESTAMP_CACHE = _TimestampCache()
+
+
+class _RenderedRecord(threading.local):
+    """The record last rendered by a formatter in the current thread.
+
+    The handlers of a logger are called one after the other for a given
+    record, so handlers sharing a formatter can reuse the text rendered for
+    the first one. The 'color' attribute set by ColorHandler, the message,
+    its arguments and the level name are part of the key, for the handlers
+    changing them before formatting the record, e.g. with a filter.
+
+    This is only enabled by _reuse_rendered_text().
+    """
+
+    def __init__(self) -> None:
+        self.record: weakref.ref[logging.LogRecord] | None = None
+        self.key: tuple[Any, ...] = ()
+        self.text = ''
+
+    @staticmethod
+    def _key(record: logging.LogRecord) -> tuple[Any, ...]:
+        return (
+            record.__dict__.get('color'),
+            record.msg,
+            record.args,
+            record.levelname,
+        )
+
+    def get(self, record: logging.LogRecord) -> str | None:
+        if self.record is None or self.record() is not record:
+            return None
+        key = self._key(record)
+        if any(a is not b for a, b in zip(key, self.key)):
+            return None
+        return self.text
+
+    def set(self, record: logging.LogRecord, text: str) -> None:
+        self.record = weakref.ref(record)
+        self.key = self._key(record)
+        self.text = text
+
+
+def _reuse_rendered_text(formatter: logging.Formatter) -> None:
+    """Let the handlers sharing formatter reuse the text of a record.
+
+    This is for the handlers configured by oslo.log, which do not change
+    the records they are given.
+    """
+    if isinstance(formatter, (ContextFormatter, JSONFormatter)):
+        formatter._rendered = _RenderedRecord()
+
+
 class _ReplaceFalseValue(dict[str, Any]):
     def __getitem__(self, key: str) -> Any:
         return dict.get(self, key, None) or '-'
@@ -175,14 +547,91 @@ class _ReplaceFalseValue(dict[str, Any]):
 _MSG_KEY_REGEX = re.compile(r'(%+)\((\w+)\)')
 
 
+@functools.lru_cache(maxsize=4096)
+def _parse_message_keys(msg: str) -> frozenset[str]:
+    msg_keys = _MSG_KEY_REGEX.findall(msg)
+    # NOTE(bnemec): The logic around skipping escaped placeholders is
+    # tricky and error-prone to include in the regex.  Much easier to
+    # just grab them all and filter after the fact. An odd number of '%'
+    # is an escaped '%' followed by a placeholder.
+    return frozenset(m[1] for m in msg_keys if len(m[0]) % 2 == 1)
+
+
+def _get_message_keys(msg: Any) -> frozenset[str]:
+    """Return the mapping keys referenced by a log message template.
+
+    Messages are mostly a limited set of string literals, so the result is
+    cached for strings.
+    """
+    if isinstance(msg, str):
+        return _parse_message_keys(msg)
+    return _parse_message_keys.__wrapped__(msg)
+
+
+# Bug #1593641: If an object cannot be serialized to JSON, convert
+# it using repr() to prevent serialization errors. Using repr() is
+# not ideal, but serialization errors are unexpected on logs,
+# especially when the code using logs is not aware that the
+# JSONFormatter will be used.
+_to_primitive_with_fallback = functools.partial(
+    jsonutils.to_primitive, fallback=repr
+)
+
+# What jsonutils.dumps() builds for every call.
+_JSON_ENCODER = json.JSONEncoder(default=_to_primitive_with_fallback)
+
+
 def _json_dumps_with_fallback(obj: Any) -> str:
-    # Bug #1593641: If an object cannot be serialized to JSON, convert
-    # it using repr() to prevent serialization errors. Using repr() is
-    # not ideal, but serialization errors are unexpected on logs,
-    # especially when the code using logs is not aware that the
-    # JSONFormatter will be used.
-    convert = functools.partial(jsonutils.to_primitive, fallback=repr)
-    return jsonutils.dumps(obj, default=convert)
+    return _JSON_ENCODER.encode(obj)
+
+
+# Leave the types handled by to_primitive() to it, so the values are the
+# same as with the standard library encoder.
+_ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS
+    | orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+    if orjson
+    else 0
+)
+
+
+def _orjson_dumps_with_fallback(obj: Any) -> str:
+    try:
+        result: bytes = orjson.dumps(
+            obj, default=_to_primitive_with_fallback, option=_ORJSON_OPTIONS
+        )
+    except orjson.JSONEncodeError:
+        # e.g. integers larger than 64 bits
+        return _json_dumps_with_fallback(obj)
+    return result.decode('utf-8')
+
+
+def _ujson_dumps_with_fallback(obj: Any) -> str:
+    try:
+        result: str = ujson.dumps(
+            obj,
+            default=_to_primitive_with_fallback,
+            escape_forward_slashes=False,
+        )
+    except (TypeError, ValueError, OverflowError):
+        return _json_dumps_with_fallback(obj)
+    return result
+
+
+def _get_json_encoder(name: str) -> Callable[[Any], str]:
+    """Return the function serializing records with the named library."""
+    if name == 'stdlib':
+        return _json_dumps_with_fallback
+    if name == 'orjson':
+        if not orjson:
+            raise RuntimeError('orjson is not available')
+        return _orjson_dumps_with_fallback
+    if name == 'ujson':
+        if not ujson:
+            raise RuntimeError('ujson is not available')
+        return _ujson_dumps_with_fallback
+    raise ValueError(f'Unknown JSON encoder: {name}')
 
 
 class JSONLogRecord(TypedDict):
@@ -206,33 +655,193 @@ class JSONLogRecord(TypedDict):
     process_name: str | None
     process: int | None
     traceback: str | None
+    traceback_frames: NotRequired[list['TracebackFrame'] | None]
     hostname: str | None
     error_summary: str
     context: dict[str, Any]
     extra: dict[str, Any]
 
 
+class TracebackFrame(TypedDict):
+    filename: str
+    lineno: int | None
+    name: str
+    line: str
+
+
+# The JSONLogRecord keys which are only emitted on request.
+_JSON_OPTIONAL_FIELDS = frozenset(('traceback_frames',))
+
+
+@functools.lru_cache(maxsize=1024)
+def _get_traceback_frame(code: CodeType, lineno: int | None) -> TracebackFrame:
+    """Describe a frame of a traceback.
+
+    The result is shared and must not be modified.
+    """
+    line = ''
+    if lineno is not None:
+        line = linecache.getline(code.co_filename, lineno).strip()
+    return {
+        'filename': code.co_filename,
+        'lineno': lineno,
+        'name': code.co_name,
+        'line': line,
+    }
+
+
+# The separators between the items of the objects serialized by each
+# encoder.
+_JSON_ITEM_SEPARATORS = {'stdlib': ', ', 'orjson': ',', 'ujson': ','}
+
+# The JSONLogRecord keys whose values only change when the process does.
+_JSON_STATIC_FIELDS = frozenset(('hostname', 'process', 'process_name'))
+
+# The JSONLogRecord keys which are copied from a record attribute.
+_JSON_RECORD_ATTRIBUTES = {
+    'name': 'name',
+    'msg': 'msg',
+    'levelname': 'levelname',
+    'levelno': 'levelno',
+    'pathname': 'pathname',
+    'filename': 'filename',
+    'module': 'module',
+    'lineno': 'lineno',
+    'funcname': 'funcName',
+    'created': 'created',
+    'msecs': 'msecs',
+    'relative_created': 'relativeCreated',
+    'thread': 'thread',
+    'thread_name': 'threadName',
+    'process_name': 'processName',
+    'process': 'process',
+}
+
+
+def _get_traceback_frames(
+    record: logging.LogRecord,
+) -> list[TracebackFrame] | None:
+    if not record.exc_info:
+        return None
+    frames = []
+    tb = record.exc_info[2]
+    while tb is not None:
+        frames.append(_get_traceback_frame(tb.tb_frame.f_code, tb.tb_lineno))
+        tb = tb.tb_next
+    return frames
+
+
+# The key of the context references emitted by JSONFormatter with
+# context_delta, and the number of contexts it remembers.
+_CONTEXT_REF = '$ref'
+_CONTEXT_DELTA_SIZE = 1024
+
+
 class JSONFormatter(logging.Formatter):
     def __init__(
         self,
         fmt: str | None = None,
         datefmt: str | None = None,
         style: str = '%',
+        encoder: str = 'stdlib',
+        fields: Iterable[str] | None = None,
+        static_fields: bool = False,
+        traceback_frames: bool = False,
+        context_delta: bool = False,
     ):
+        """Initialize JSONFormatter instance
+
+        :param encoder: The library serializing the records, one of
+            ``stdlib``, ``orjson`` or ``ujson``. The latter two produce
+            compact output and do not escape non-ASCII characters, and
+            orjson writes NaN and infinite floats as null.
+        :param fields: The keys of :class:`JSONLogRecord` to emit, all of
+            them but ``traceback_frames`` by default. The keys are always
+            emitted in the order of :class:`JSONLogRecord`, and the values of
+            the others are not computed. ``traceback_frames`` is the list of
+            the frames of the traceback of the logged exception, as
+            :class:`TracebackFrame` dictionaries.
+        :param traceback_frames: Emit ``traceback_frames`` as well.
+        :param static_fields: Serialize the keys whose values are the same
+            for every record of a process (``hostname``, ``process`` and
+            ``process_name``) once, and put them first in every record.
+        :param context_delta: Emit the ``context`` of a request in full only
+            in its first record, and as ``{"$ref": <request_id>}`` in the
+            next ones until it changes. The contexts of the last 1024
+            requests are remembered. As the references are only meaningful
+            in the output holding the full contexts, such a formatter must
+            not be shared by several handlers, and the oslo.log file
+            handlers call forget_contexts() when they start a new file.
+        """
         # NOTE(stephenfin) we ignore the fmt and style arguments, but they're
         # still there since logging.config.fileConfig passes the former in
         # Python < 3.2 and both in Python >= 3.2
         self.datefmt = datefmt
+        self._dumps = _get_json_encoder(encoder)
+        self._separator = _JSON_ITEM_SEPARATORS[encoder]
         try:
             self.hostname: str | None = socket.gethostname()
         except OSError:
             self.hostname = None
+        self._rendered: _RenderedRecord | None = None
+
+        all_fields = JSONLogRecord.__annotations__
+        if fields is None:
+            selected = set(all_fields).difference(_JSON_OPTIONAL_FIELDS)
+        else:
+            selected = set(fields)
+            unknown = selected.difference(all_fields)
+            if unknown:
+                raise ValueError(
+                    f'Unknown JSON fields: {", ".join(sorted(unknown))}'
+                )
+        if traceback_frames:
+            selected.add('traceback_frames')
+        getters: dict[str, Callable[[logging.LogRecord], Any]] = {
+            'message': logging.LogRecord.getMessage,
+            'asctime': lambda record: self.formatTime(record, self.datefmt),
+            'args': self._get_args,
+            'traceback': self._get_traceback,
+            'traceback_frames': _get_traceback_frames,
+            'hostname': lambda record: self.hostname,
+            'error_summary': _get_error_summary,
+        }
+        for key, attribute in _JSON_RECORD_ATTRIBUTES.items():
+            getters[key] = operator.attrgetter(attribute)
+        self._static_keys: list[str] = []
+        if static_fields:
+            self._static_keys = [
+                key
+                for key in all_fields
+                if key in selected and key in _JSON_STATIC_FIELDS
+            ]
+            selected.difference_update(_JSON_STATIC_FIELDS)
+        # The process, process name and serialized static fields
+        self._static: tuple[int | None, str | None, str] | None = None
+        # The context and the extra values are built together, last.
+        self._getters = [
+            (key, getters[key])
+            for key in all_fields
+            if key in selected and key in getters
+        ]
+        self._context_field = 'context' in selected
+        self._extra_field = 'extra' in selected
+        self.context_delta = context_delta
+        # The last contexts emitted in full, by request id
+        self._contexts: collections.OrderedDict[str, dict[str, Any]] | None
+        self._contexts = collections.OrderedDict() if context_delta else None
+        self._contexts_lock = threading.Lock()
+
+    def formatTime(
+        self, record: logging.LogRecord, datefmt: str | None = None
+    ) -> str:
+        return _TIMESTAMP_CACHE.asctime(self, record, datefmt)
 
     def formatException(
         self, ei: _SysExcInfoType, *, strip_newlines: bool = True
     ) -> str:
         try:
-            lines = traceback.format_exception(*ei)
+            lines = list(_TRACEBACK_CACHE.format_exception(ei))
         except TypeError as type_error:
             # Work around https://bugs.python.org/issue28603
             msg = str(type_error)
@@ -246,48 +855,65 @@ class JSONFormatter(logging.Formatter):
         return '\n'.join(lines)
 
     def format(self, record: logging.LogRecord) -> str:
+        if self._rendered is None:
+            return self._render(record)
+        text = self._rendered.get(record)
+        if text is None:
+            text = self._render(record)
+            self._rendered.set(record, text)
+        return text
+
+    def _get_args(self, record: logging.LogRecord) -> Any:
         args = record.args
         if isinstance(args, dict):
-            msg_keys = _MSG_KEY_REGEX.findall(record.msg)
-            # NOTE(bnemec): The logic around skipping escaped placeholders is
-            # tricky and error-prone to include in the regex.  Much easier to
-            # just grab them all and filter after the fact.
-            msg_keys = [m[1] for m in msg_keys if len(m[0]) == 1]
+            msg_keys = _get_message_keys(record.msg)
             # If no named keys were found, then the entire dict must have been
             # the value to be formatted.  Don't filter anything.
             if msg_keys:
                 args = {k: v for k, v in args.items() if k in msg_keys}
+        return args
 
-        message: JSONLogRecord = {
-            'message': record.getMessage(),
-            'asctime': self.formatTime(record, self.datefmt),
-            'name': record.name,
-            'msg': record.msg,
-            'args': args,
-            'levelname': record.levelname,
-            'levelno': record.levelno,
-            'pathname': record.pathname,
-            'filename': record.filename,
-            'module': record.module,
-            'lineno': record.lineno,
-            'funcname': record.funcName,
-            'created': record.created,
-            'msecs': record.msecs,
-            'relative_created': record.relativeCreated,
-            'thread': record.thread,
-            'thread_name': record.threadName,
-            'process_name': record.processName,
-            'process': record.process,
-            'traceback': None,
-            'hostname': self.hostname,
-            'error_summary': _get_error_summary(record),
-            'context': {},
-            'extra': {},
+    def _get_traceback(self, record: logging.LogRecord) -> str | None:
+        if record.exc_info:
+            return self.formatException(record.exc_info)
+        return None
+
+    def _render(self, record: logging.LogRecord) -> str:
+        text = self._dumps(self._build(record))
+        if not self._static_keys:
+            return text
+
+        static = self._static
+        if (
+            static is None
+            or static[0] != record.process
+            or static[1] != record.processName
+        ):
+            # First record, or first one after a fork
+            values = {
+                'hostname': self.hostname,
+                'process': record.process,
+                'process_name': record.processName,
+            }
+            chunk = self._dumps(
+                {key: values[key] for key in self._static_keys}
+            )
+            static = (record.process, record.processName, chunk[1:-1])
+            self._static = static
+
+        if text == '{}':
+            return '{' + static[2] + '}'
+        return '{' + static[2] + self._separator + text[1:]
+
+    def _build(self, record: logging.LogRecord) -> dict[str, Any]:
+        message: dict[str, Any] = {
+            key: getter(record) for key, getter in self._getters
         }
+        if not (self._context_field or self._extra_field):
+            return message
 
         # Build the extra values that were given to us, including
         # the context.
-        context = _update_record_with_context(record)
         if hasattr(record, 'extra'):
             extra = record.extra.copy()
         else:
@@ -295,23 +921,110 @@ class JSONFormatter(logging.Formatter):
         for key in getattr(record, 'extra_keys', []):
             if key not in extra:
                 extra[key] = getattr(record, key)
-        # The context object might have been given from the logging call. if
-        # that was the case, it'll come in the 'extra' entry already. If not,
-        # lets use the context we fetched above. In either case, we explode it
-        # into the 'context' entry because the values are more useful than the
-        # object reference.
-        if 'context' in extra and extra['context']:
-            message['context'] = _dictify_context(extra['context'])
-        elif context:
-            message['context'] = _dictify_context(context)
 
-        extra.pop('context', None)
-        message['extra'] = extra
+        if self._context_field:
+            # The context object might have been given from the logging
+            # call. if that was the case, it'll come in the 'extra' entry
+            # already. If not, lets use the context we fetched from the
+            # record. In either case, we explode it into the 'context' entry
+            # because the values are more useful than the object reference.
+            if 'context' in extra and extra['context']:
+                values = _dictify_context(extra['context'])
+            else:
+                context = _update_record_with_context(record)
+                values = _dictify_context(context) if context else {}
+            if self._contexts is not None:
+                values = self._get_context_delta(values)
+            message['context'] = values
+
+        if self._extra_field:
+            extra.pop('context', None)
+            message['extra'] = extra
+
+        return message
+
+    def forget_contexts(self) -> None:
+        """Emit the next context of every request in full again."""
+        if self._contexts is not None:
+            with self._contexts_lock:
+                self._contexts.clear()
+
+    def _get_context_delta(self, values: dict[str, Any]) -> dict[str, Any]:
+        """Return a reference to the context if it was emitted already."""
+        request_id = values.get('request_id')
+        if not request_id or not isinstance(request_id, str):
+            return values
+        assert self._contexts is not None
+        with self._contexts_lock:
+            if self._contexts.get(request_id) == values:
+                self._contexts.move_to_end(request_id)
+                return {_CONTEXT_REF: request_id}
+            # NOTE: dict contexts may be modified in place, so keep a copy.
+            self._contexts[request_id] = dict(values)
+            self._contexts.move_to_end(request_id)
+            if len(self._contexts) > _CONTEXT_DELTA_SIZE:
+                self._contexts.popitem(last=False)
+        return values
+
+
+class MsgpackFormatter(JSONFormatter):
+    """A formatter producing length-prefixed MessagePack frames.
+
+    Every frame holds the record the JSONFormatter would produce, as a
+    MessagePack map, preceded by its size as a 4 bytes big-endian unsigned
+    integer.
+
+    format() returns bytes, so the handler must write to a binary stream
+    without appending a terminator, e.g.::
+
+        handler = logging.FileHandler(path, mode='ab')
+        handler.terminator = b''
+        handler.setFormatter(MsgpackFormatter())
+
+    The files can be read with ``convert-json --msgpack``.
+    """
+
+    def __init__(
+        self,
+        fmt: str | None = None,
+        datefmt: str | None = None,
+        style: str = '%',
+        fields: Iterable[str] | None = None,
+        traceback_frames: bool = False,
+    ):
+        super().__init__(
+            fmt,
+            datefmt,
+            style,
+            fields=fields,
+            traceback_frames=traceback_frames,
+        )
+
+    def format(self, record: logging.LogRecord) -> Any:
+        payload: bytes = msgpack.packb(
+            self._build(record), default=_to_primitive_with_fallback
+        )
+        return len(payload).to_bytes(4, 'big') + payload
+
+
+# The extra values FluentFormatter passes through as they are.
+_FLUENT_PRIMITIVE_TYPES = (str, int, bool, type(None), float, list, dict)
 
-        if record.exc_info:
-            message['traceback'] = self.formatException(record.exc_info)
 
-        return _json_dumps_with_fallback(message)
+@functools.lru_cache(maxsize=256)
+def _strip_traceback_lines(lines: tuple[str, ...]) -> str:
+    """Join the traceback lines without their trailing whitespace.
+
+    A repeated traceback is only joined once. Looking it up hashes the
+    tuple, which combines the cached hashes of its lines, and the lookup
+    then finds the very tuple the traceback cache returned, so it is not
+    compared line by line.
+    """
+    return '\n'.join(
+        itertools.chain.from_iterable(
+            line.rstrip().splitlines() for line in lines
+        )
+    )
 
 
 class FluentFormatter(logging.Formatter):
@@ -329,10 +1042,17 @@ class FluentFormatter(logging.Formatter):
         fmt: str | None = None,
         datefmt: str | None = None,
         style: str = '%',
+        encoder: str = 'stdlib',
     ):
+        """Initialize the formatter.
+
+        :param encoder: The library serializing the extra values which are
+            not JSON primitives, one of ``stdlib``, ``orjson`` or ``ujson``.
+        """
         # NOTE(sfinucan) we ignore the fmt and style arguments for the same
         # reason as JSONFormatter.
         self.datefmt = datefmt
+        self._dumps = _get_json_encoder(encoder)
         try:
             self.hostname: str | None = socket.gethostname()
         except OSError:
@@ -347,19 +1067,22 @@ class FluentFormatter(logging.Formatter):
         except Exception:
             self.uwsgi_name = None
 
+    def formatTime(
+        self, record: logging.LogRecord, datefmt: str | None = None
+    ) -> str:
+        return _TIMESTAMP_CACHE.asctime(self, record, datefmt)
+
     def formatException(
         self, ei: _SysExcInfoType, *, strip_newlines: bool = True
     ) -> str:
         try:
-            lines = traceback.format_exception(*ei)
+            lines = _TRACEBACK_CACHE.format_exception(ei)
         except TypeError as type_error:
             # Work around https://bugs.python.org/issue28603
             msg = str(type_error)
-            lines = [f'<Unprintable exception due to {msg}>\n']
+            lines = (f'<Unprintable exception due to {msg}>\n',)
         if strip_newlines:
-            lines = functools.reduce(
-                lambda a, line: a + line.rstrip().splitlines(), lines, []
-            )
+            return _strip_traceback_lines(lines)
         return '\n'.join(lines)
 
     def format(self, record: logging.LogRecord) -> Any:
@@ -394,19 +1117,23 @@ class FluentFormatter(logging.Formatter):
         # lets use the context we fetched above. In either case, we explode it
         # into the extra dictionary because the values are more useful than the
         # object reference.
+        # The message is handed over to the handler, so do not give it the
+        # cached context values.
         if 'context' in extra and extra['context']:
-            message['context'] = _dictify_context(extra['context'])
+            message['context'] = dict(_dictify_context(extra['context']))
         elif context:
-            message['context'] = _dictify_context(context)
+            message['context'] = dict(_dictify_context(context))
         else:
             message['context'] = {}
         extra.pop('context', None)
         # NOTE(vdrok): try to dump complex objects
-        primitive_types = (str, int, bool, type(None), float, list, dict)
-        for key, value in extra.items():
-            if not isinstance(value, primitive_types):
-                extra[key] = _json_dumps_with_fallback(value)
-        message['extra'] = extra
+        dumps = self._dumps
+        message['extra'] = {
+            key: value
+            if isinstance(value, _FLUENT_PRIMITIVE_TYPES)
+            else dumps(value)
+            for key, value in extra.items()
+        }
 
         if record.exc_info:
             message['traceback'] = self.formatException(record.exc_info)
@@ -417,6 +1144,323 @@ class FluentFormatter(logging.Formatter):
         return message
 
 
+# The lowest logging level of each severity range of the OpenTelemetry log
+# data model after TRACE: DEBUG, INFO, WARN, ERROR and FATAL. Every range
+# has four severity numbers.
+_OTEL_SEVERITY_LEVELS = (
+    logging.DEBUG,
+    logging.INFO,
+    logging.WARNING,
+    logging.ERROR,
+    logging.CRITICAL,
+)
+
+
+@functools.cache
+def _otel_severity_number(levelno: int) -> int:
+    """Return the OpenTelemetry severity number of a logging level."""
+    index = bisect.bisect_right(_OTEL_SEVERITY_LEVELS, levelno)
+    if not index:
+        return 1
+    return 1 + 4 * index + min(levelno - _OTEL_SEVERITY_LEVELS[index - 1], 3)
+
+
+def _otel_value(value: Any) -> dict[str, Any]:
+    """Return the OTLP/JSON AnyValue of a value."""
+    if isinstance(value, str):
+        return {'stringValue': value}
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        # 64 bits integers are written as strings in OTLP/JSON
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return {
+                'doubleValue': 'NaN'
+                if math.isnan(value)
+                else ('Infinity' if value > 0 else '-Infinity')
+            }
+        return {'doubleValue': value}
+    if value is None:
+        return {}
+    if isinstance(value, bytes):
+        return {'bytesValue': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, dict):
+        return {'kvlistValue': {'values': _otel_attributes(value.items())}}
+    if isinstance(value, list | tuple | set | frozenset):
+        return {'arrayValue': {'values': [_otel_value(v) for v in value]}}
+    return {'stringValue': str(value)}
+
+
+def _otel_attributes(items: Iterable[tuple[Any, Any]]) -> list[dict[str, Any]]:
+    """Return the OTLP/JSON KeyValue list of the given items."""
+    return [
+        {'key': str(key), 'value': _otel_value(value)} for key, value in items
+    ]
+
+
+class OTelFormatter(logging.Formatter):
+    """A formatter for the OpenTelemetry log data model.
+
+    Every record is written as an OTLP/JSON ExportLogsServiceRequest, on a
+    single line, as read by the OTLP JSON file receiver of the OpenTelemetry
+    collector. The logger name is the instrumentation scope and the
+    resource attributes are only serialized once per process. The values of
+    the context are the attributes prefixed with ``openstack.``, the extra
+    values are attributes as they are. The ids of the current span are set
+    when the ``opentelemetry-api`` library is installed.
+
+    Use :class:`oslo_log.handlers.OTLPHandler` to send the records to a
+    collector in batches.
+    """
+
+    def __init__(
+        self,
+        fmt: str | None = None,
+        datefmt: str | None = None,
+        style: str = '%',
+        service_name: str | None = None,
+        resource_attributes: dict[str, Any] | None = None,
+        encoder: str = 'stdlib',
+    ) -> None:
+        """Initialize the formatter.
+
+        :param service_name: The ``service.name`` resource attribute, the
+            name of the program by default.
+        :param resource_attributes: Additional resource attributes.
+        :param encoder: The library serializing the records, one of
+            ``stdlib``, ``orjson`` or ``ujson``.
+        """
+        # NOTE: fmt, datefmt and style are ignored for the same reason as
+        # in JSONFormatter.
+        self.datefmt = datefmt
+        self.service_name = (
+            service_name
+            or os.path.basename(sys.argv[0] if sys.argv else '')
+            or 'unknown_service'
+        )
+        self.resource_attributes = dict(resource_attributes or {})
+        self._dumps = _get_json_encoder(encoder)
+        try:
+            self.hostname: str | None = socket.gethostname()
+        except OSError:
+            self.hostname = None
+        # The process id and the serialized resource
+        self._resource: tuple[int | None, str] | None = None
+        # The logging values of the last context and their attributes
+        self._context_attributes: (
+            tuple[dict[str, Any], list[dict[str, Any]]] | None
+        ) = None
+
+    def formatException(self, ei: _SysExcInfoType) -> str:
+        try:
+            return ''.join(_TRACEBACK_CACHE.format_exception(ei))
+        except TypeError as type_error:
+            # Work around https://bugs.python.org/issue28603
+            return f'<Unprintable exception due to {type_error}>\n'
+
+    def format(self, record: logging.LogRecord) -> str:
+        return (
+            '{"resourceLogs":[{"resource":'
+            + self._format_resource(record.process)
+            + ',"scopeLogs":['
+            + self._format_scope_logs(record)
+            + ']}]}'
+        )
+
+    def _format_resource(self, pid: int | None) -> str:
+        """Return the serialized resource of the process."""
+        resource = self._resource
+        if resource is None or resource[0] != pid:
+            # First record, or first one after a fork
+            attributes = {
+                'service.name': self.service_name,
+                'host.name': self.hostname,
+                'process.pid': pid,
+                'process.command_line': ' '.join(sys.argv),
+            }
+            attributes.update(self.resource_attributes)
+            resource = (
+                pid,
+                self._dumps(
+                    {'attributes': _otel_attributes(attributes.items())}
+                ),
+            )
+            self._resource = resource
+        return resource[1]
+
+    def _format_scope_logs(self, record: logging.LogRecord) -> str:
+        """Return the serialized ScopeLogs holding the record."""
+        return self._dumps(
+            {
+                'scope': {'name': record.name},
+                'logRecords': [self._log_record(record)],
+            }
+        )
+
+    def _get_context_attributes(
+        self, context: context_utils.RequestContext | dict[str, Any]
+    ) -> list[dict[str, Any]]:
+        values = _dictify_context(context)
+        last = self._context_attributes
+        if last is not None and last[0] is values:
+            return last[1]
+        attributes = _otel_attributes(
+            (f'openstack.{key}', value)
+            for key, value in values.items()
+            if value is not None
+        )
+        # NOTE: The values of a RequestContext are cached, so the attributes
+        # are reused until the context changes.
+        self._context_attributes = (values, attributes)
+        return attributes
+
+    def _log_record(self, record: logging.LogRecord) -> dict[str, Any]:
+        timestamp = str(int(record.created * 1e9))
+        log_record: dict[str, Any] = {
+            'timeUnixNano': timestamp,
+            'observedTimeUnixNano': timestamp,
+            'severityNumber': _otel_severity_number(record.levelno),
+            'severityText': record.levelname,
+            'body': {'stringValue': record.getMessage()},
+        }
+        attributes = _otel_attributes(
+            (
+                ('code.filepath', record.pathname),
+                ('code.lineno', record.lineno),
+                ('code.function', record.funcName),
+                ('thread.id', record.thread),
+                ('thread.name', record.threadName),
+            )
+        )
+
+        if record.exc_info and record.exc_info[0] is not None:
+            exc_type, exc = record.exc_info[:2]
+            # the fully-qualified name, as the semantic conventions require
+            exc_name = exc_type.__qualname__
+            if exc_type.__module__ != 'builtins':
+                exc_name = f'{exc_type.__module__}.{exc_name}'
+            attributes += _otel_attributes(
+                (
+                    ('exception.type', exc_name),
+                    ('exception.message', _ensure_unicode(exc)),
+                    (
+                        'exception.stacktrace',
+                        self.formatException(record.exc_info),
+                    ),
+                )
+            )
+
+        if hasattr(record, 'extra'):
+            extra = record.extra.copy()
+        else:
+            extra = {}
+        for key in getattr(record, 'extra_keys', []):
+            if key not in extra:
+                extra[key] = getattr(record, key)
+        # The context object might have been given from the logging call,
+        # as in JSONFormatter.
+        context = extra.pop('context', None) or _update_record_with_context(
+            record
+        )
+        if context:
+            attributes += self._get_context_attributes(context)
+        attributes += _otel_attributes(extra.items())
+        log_record['attributes'] = attributes
+
+        if otel_trace is not None:
+            span_context = otel_trace.get_current_span().get_span_context()
+            if span_context.is_valid:
+                # OTLP/JSON writes the ids in hexadecimal, not base64
+                log_record['traceId'] = format(span_context.trace_id, '032x')
+                log_record['spanId'] = format(span_context.span_id, '016x')
+                log_record['flags'] = int(span_context.trace_flags)
+        return log_record
+
+
+# Matches the escaped '%' and the mapping key conversion specifiers of
+# printf-style format strings.
+_PERCENT_FIELD_REGEX = re.compile(
+    r'%(?:%|\((?P<key>[^()]*)\)'
+    r'(?P<spec>[#0 +-]*\d*(?:\.\d*)?[hlL]?[diouxXeEfFgGcrsa]))'
+)
+
+
+class _PercentRenderer:
+    """A printf-style format string compiled for mapping lookups.
+
+    The format string is parsed once into a positional format string and
+    the keys it references, so rendering a record only looks up those keys
+    rather than going through the whole record dictionary.
+    """
+
+    def __init__(self, fmt: str, keys: tuple[str, ...]) -> None:
+        self.fields = frozenset(keys)
+        self._fmt = fmt
+        self._getter: Callable[[dict[str, Any]], tuple[Any, ...]]
+        if not keys:
+            self._getter = lambda values: ()
+        elif len(keys) == 1:
+            key = keys[0]
+            # NOTE: itemgetter() returns the value itself for a single key,
+            # which would be taken for the arguments if it were a tuple.
+            self._getter = lambda values: (values[key],)
+        else:
+            self._getter = operator.itemgetter(*keys)
+
+    def render(self, values: dict[str, Any]) -> str:
+        """Return what logging.PercentStyle.format() would."""
+        try:
+            return self._fmt % self._getter(values)
+        except KeyError as e:
+            raise ValueError(f'Formatting field not found in record: {e}')
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_percent_format(fmt: str) -> _PercentRenderer | None:
+    """Compile a printf-style format string using mapping keys.
+
+    None is returned for the format strings which cannot be compiled, e.g.
+    because they use positional specifiers, and must be formatted as usual.
+    """
+    keys = []
+    parts = []
+    pos = 0
+    for match in _PERCENT_FIELD_REGEX.finditer(fmt):
+        literal = fmt[pos : match.start()]
+        if '%' in literal:
+            return None
+        parts.append(literal)
+        key = match.group('key')
+        if key is None:
+            parts.append('%%')
+        else:
+            keys.append(key)
+            parts.append('%' + match.group('spec'))
+        pos = match.end()
+    literal = fmt[pos:]
+    if '%' in literal:
+        return None
+    parts.append(literal)
+    return _PercentRenderer(''.join(parts), tuple(keys))
+
+
+# The number of format variants a ContextFormatter keeps
+_FORMAT_CACHE_SIZE = 64
+
+
+class _FormatVariant(NamedTuple):
+    style: logging.PercentStyle
+    renderer: _PercentRenderer | None
+    uses_time: bool
+    has_error_summary: bool
+
+    def uses(self, field: str) -> bool:
+        """Whether the format string may reference a record attribute."""
+        return self.renderer is None or field in self.renderer.fields
+
+
 class ContextFormatter(logging.Formatter):
     """A context.RequestContext aware formatter configured through flags.
 
@@ -456,8 +1500,69 @@ class ContextFormatter(logging.Formatter):
 
         logging.Formatter.__init__(self, *args, **kwargs)
 
+        # The format string only depends on the options and a handful of
+        # properties of the record, so build each variant once instead of
+        # once per record.
+        self._format_cache: dict[
+            tuple[str, bool, str | None], _FormatVariant
+        ] = {}
+        self._rendered: _RenderedRecord | None = None
+
+    def formatTime(
+        self, record: logging.LogRecord, datefmt: str | None = None
+    ) -> str:
+        return _TIMESTAMP_CACHE.asctime(self, record, datefmt)
+
+    def _get_format_variant(
+        self, use_context: bool, error_summary: bool, debug: bool
+    ) -> _FormatVariant:
+        # NOTE: The options are read for every record, so that the changes
+        # made with set_override() are seen, and are part of the key.
+        if use_context:
+            fmt = self.conf.logging_context_format_string
+        else:
+            fmt = self.conf.logging_default_format_string
+        suffix = self.conf.logging_debug_format_suffix if debug else None
+
+        key = (fmt, error_summary, suffix)
+        variant = self._format_cache.get(key)
+        if variant is not None:
+            return variant
+
+        has_error_summary = '%(error_summary)s' in fmt
+        if error_summary and not has_error_summary:
+            # If we have not been told how to format the error and
+            # there is an error to summarize, make sure the format
+            # string includes the bits we need to include it.
+            fmt += ': %(error_summary)s'
+
+        if suffix:
+            fmt += " " + suffix
+
+        style = logging.PercentStyle(fmt)
+        renderer = _compile_percent_format(
+            fmt or logging.PercentStyle.default_format
+        )
+        variant = _FormatVariant(
+            style, renderer, style.usesTime(), has_error_summary
+        )
+        if len(self._format_cache) >= _FORMAT_CACHE_SIZE:
+            # the options changed many times, drop the stale variants
+            self._format_cache = {}
+        self._format_cache[key] = variant
+        return variant
+
     def format(self, record: logging.LogRecord) -> str:
         """Uses contextstring if request_id is set, otherwise default."""
+        if self._rendered is None:
+            return self._render(record)
+        text = self._rendered.get(record)
+        if text is None:
+            text = self._render(record)
+            self._rendered.set(record, text)
+        return text
+
+    def _render(self, record: logging.LogRecord) -> str:
         # store project info
         record.project = self.project
         record.version = self.version
@@ -517,20 +1622,24 @@ class ContextFormatter(logging.Formatter):
             if key not in record.__dict__:
                 record.__dict__[key] = ''
 
+        error_summary = _get_error_summary(record)
+        variant = self._get_format_variant(
+            bool(record.__dict__.get('request_id')),
+            bool(error_summary),
+            record.levelno == logging.DEBUG,
+        )
+
         # Set the "user_identity" value of "logging_context_format_string"
         # by using "logging_user_identity_format" and
         # get_logging_values of oslo.context.
-        if context:
-            record.user_identity = (
-                self.conf.logging_user_identity_format
-                % _ReplaceFalseValue(_dictify_context(context))
+        if context and (
+            variant.uses('user_identity')
+            or (record.exc_info and self._prefix_uses('user_identity'))
+        ):
+            record.user_identity = _get_user_identity(
+                context, self.conf.logging_user_identity_format
             )
 
-        if record.__dict__.get('request_id'):
-            fmt = self.conf.logging_context_format_string
-        else:
-            fmt = self.conf.logging_default_format_string
-
         # Cache the formatted traceback on the record, Logger will
         # respect our formatted copy
         if record.exc_info:
@@ -538,89 +1647,86 @@ class ContextFormatter(logging.Formatter):
                 record.exc_info, record=record
             )
 
-        record.error_summary = _get_error_summary(record)
-        if '%(error_summary)s' in fmt:
+        if variant.has_error_summary:
             # If we have been told explicitly how to format the error
             # summary, make sure there is always a default value for
             # it.
-            record.error_summary = getattr(record, 'error_summary') or '-'
-        elif getattr(record, 'error_summary'):
-            # If we have not been told how to format the error and
-            # there is an error to summarize, make sure the format
-            # string includes the bits we need to include it.
-            fmt += ': %(error_summary)s'
+            error_summary = error_summary or '-'
+        record.error_summary = error_summary
 
-        if (
-            record.levelno == logging.DEBUG
-            and self.conf.logging_debug_format_suffix
-        ):
-            fmt += " " + self.conf.logging_debug_format_suffix
-
-        self._compute_iso_time(record)
-
-        self._style = logging.PercentStyle(fmt)
-        self._fmt = self._style._fmt
+        if variant.uses('isotime'):
+            self._compute_iso_time(record)
 
         try:
-            return logging.Formatter.format(self, record)
+            return self._format_variant(record, variant)
         except TypeError as err:
             # Something went wrong, report that instead so we at least
             # get the error message.
             record.msg = (
                 f'Error formatting log line msg={record.msg!r} err={err!r}'
             ).replace('%', '*')
-            return logging.Formatter.format(self, record)
+            return self._format_variant(record, variant)
+
+    def _prefix_uses(self, field: str) -> bool:
+        renderer = _compile_percent_format(self.conf.logging_exception_prefix)
+        return renderer is None or field in renderer.fields
+
+    def _format_variant(
+        self, record: logging.LogRecord, variant: _FormatVariant
+    ) -> str:
+        # NOTE: This mirrors logging.Formatter.format() but uses the given
+        # style rather than self._style, which is shared by every thread
+        # using this formatter.
+        record.message = record.getMessage()
+        if variant.uses_time:
+            record.asctime = self.formatTime(record, self.datefmt)
+        if variant.renderer is not None:
+            s = variant.renderer.render(record.__dict__)
+        else:
+            s = variant.style.format(record)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            if s[-1:] != "\n":
+                s = s + "\n"
+            s = s + record.exc_text
+        if record.stack_info:
+            if s[-1:] != "\n":
+                s = s + "\n"
+            s = s + self.formatStack(record.stack_info)
+        return s
 
     def formatException(
         self, ei: _SysExcInfoType, *, record: logging.LogRecord | None = None
     ) -> str:
         """Format exception output with CONF.logging_exception_prefix."""
-        if not record:
-            try:
-                return logging.Formatter.formatException(self, ei)
-            except TypeError as type_error:
-                # Work around https://bugs.python.org/issue28603
-                msg = str(type_error)
-                return f'<Unprintable exception due to {msg}>\n'
-
-        stringbuffer = io.StringIO()
         try:
-            traceback.print_exception(ei[0], ei[1], ei[2], None, stringbuffer)
+            text = ''.join(_TRACEBACK_CACHE.format_exception(ei))
         except TypeError as type_error:
             # Work around https://bugs.python.org/issue28603
             msg = str(type_error)
-            stringbuffer.write(f'<Unprintable exception due to {msg}>\n')
+            text = f'<Unprintable exception due to {msg}>\n'
+            if not record:
+                return text
 
-        lines = stringbuffer.getvalue().split('\n')
-        stringbuffer.close()
+        if not record:
+            # Mirror logging.Formatter.formatException()
+            return text[:-1] if text[-1:] == '\n' else text
+
+        lines = text.split('\n')
 
-        if self.conf.logging_exception_prefix.find('%(asctime)') != -1:
+        # The prefix is the same for every line of the traceback, so render
+        # it once.
+        prefix: str = self.conf.logging_exception_prefix
+        if prefix.find('%(asctime)') != -1:
             record.asctime = self.formatTime(record, self.datefmt)
 
         self._compute_iso_time(record)
 
-        formatted_lines = []
-        for line in lines:
-            pl = self.conf.logging_exception_prefix % record.__dict__
-            fl = f'{pl}{line}'
-            formatted_lines.append(fl)
-        return '\n'.join(formatted_lines)
+        prefix = prefix % record.__dict__
+        return prefix + ('\n' + prefix).join(lines)
 
     def _compute_iso_time(self, record: logging.LogRecord) -> None:
         # set iso8601 timestamp
-        localtz = tz.tzlocal()
-        record.isotime = (
-            datetime.datetime.fromtimestamp(record.created)
-            .replace(tzinfo=localtz)
-            .isoformat()
-        )
-        if record.created == int(record.created):
-            # NOTE(stpierre): when the timestamp includes no
-            # microseconds -- e.g., 1450274066.000000 -- then the
-            # microseconds aren't included in the isoformat() time. As
-            # a result, in literally one in a million cases
-            # isoformat() looks different. This adds microseconds when
-            # that happens.
-            record.isotime = (
-                f"{record.isotime[:-6]}.000000{record.isotime[-6:]}"  # type: ignore
-            )
+        record.isotime = _TIMESTAMP_CACHE.isotime(record.created)
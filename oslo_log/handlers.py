@@ -12,12 +12,39 @@
 
 from __future__ import annotations
 
+import collections
+from collections.abc import Callable
+from collections.abc import Iterable
+import copy
+import ctypes
+import errno
+import functools
+import gzip
+import http.client
 import inspect
+import io
 import logging
 import logging.config
 import logging.handlers
 import os
-from typing import TYPE_CHECKING
+import queue
+import select
+import shutil
+import socket
+import stat
+import struct
+import sys
+import threading
+import time
+import traceback
+from typing import Any, BinaryIO, TYPE_CHECKING
+import urllib.parse
+import weakref
+
+import msgpack
+from oslo_utils import importutils
+
+from oslo_log import formatters
 
 try:
     from systemd import journal  # type: ignore [import-not-found]
@@ -28,6 +55,10 @@ try:
 except ImportError:
     syslog = None  # type: ignore
 
+# Python >= 3.14 provides zstd, the zstandard library otherwise
+stdlib_zstd = importutils.try_import('compression.zstd')
+zstandard = importutils.try_import('zstandard')
+
 if TYPE_CHECKING:
     # Needed until we bump our minimum to Python 3.11
     #
@@ -35,8 +66,10 @@ if TYPE_CHECKING:
     from _typeshed import SupportsWrite
 
     _StreamHandler = logging.StreamHandler[SupportsWrite[str]]
+    _FileHandler = logging.FileHandler
 else:
     _StreamHandler = logging.StreamHandler
+    _FileHandler = object
 
 NullHandler = logging.NullHandler
 
@@ -162,3 +195,1466 @@ class ColorHandler(_StreamHandler):
     def format(self, record: logging.LogRecord) -> str:
         record.color = self.LEVEL_COLORS[record.levelno]
         return logging.StreamHandler.format(self, record) + '\033[00m'
+
+
+class _BatchingHandler(logging.Handler):
+    """Base class of the handlers shipping encoded records in batches.
+
+    emit() encodes the record in the calling thread and puts it in a bounded
+    queue. A background thread takes the records off the queue and hands them
+    to _write_batch() once they add up to max_batch_bytes or flush_interval
+    seconds after the first one was queued. A failed write is retried with an
+    exponential backoff, up to max_retry_interval seconds, after _reset() was
+    called to drop the broken transport. Records are dropped and counted in
+    the ``dropped`` attribute when the queue is full or the handler is closed
+    while the transport is down.
+
+    Subclasses implement _encode(), _write_batch() and _reset().
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 10000,
+        max_batch_bytes: int = 256 * 1024,
+        flush_interval: float = 0.1,
+        retry_interval: float = 0.1,
+        max_retry_interval: float = 30.0,
+        timeout: float = 5.0,
+    ) -> None:
+        super().__init__()
+        self.queue_size = queue_size
+        self.max_batch_bytes = max_batch_bytes
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.timeout = timeout
+        self.dropped = 0
+        self._queue: queue.Queue[bytes | threading.Event | None]
+        self._queue = queue.Queue(queue_size)
+        self._closing = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+
+    def _encode(self, record: logging.LogRecord) -> bytes:
+        raise NotImplementedError()
+
+    def _write_batch(self, batch: list[bytes]) -> None:
+        raise NotImplementedError()
+
+    def _reset(self) -> None:
+        raise NotImplementedError()
+
+    def _start(self) -> None:
+        # NOTE: The thread is started on the first record rather than in
+        # __init__ so that a handler created before a fork works in the
+        # child, which does not inherit the thread nor the queued records
+        # of its parent.
+        if self._pid == os.getpid():
+            return
+        if self._pid is not None:
+            self._queue = queue.Queue(self.queue_size)
+            self._reset()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name=type(self).__name__, daemon=True
+        )
+        self._thread.start()
+
+    def _running(self) -> bool:
+        return (
+            self._pid == os.getpid()
+            and self._thread is not None
+            and self._thread.is_alive()
+        )
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._closing.is_set():
+            return
+        try:
+            data = self._encode(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self._start()
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """Wait until the records queued so far were handed over.
+
+        Gives up after timeout seconds, e.g. while the transport is down.
+        """
+        if not self._running():
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=self.timeout)
+        except queue.Full:
+            return
+        done.wait(self.timeout)
+
+    def close(self) -> None:
+        if self._running() and not self._closing.is_set():
+            self._closing.set()
+            try:
+                self._queue.put(None, timeout=self.timeout)
+            except queue.Full:
+                pass
+            assert self._thread is not None
+            self._thread.join(self.timeout)
+        self._closing.set()
+        super().close()
+
+    def _run(self) -> None:
+        batch: list[bytes] = []
+        size = 0
+        deadline = 0.0
+        stop = False
+        while not stop:
+            done = None
+            try:
+                item = self._queue.get(
+                    timeout=max(deadline - time.monotonic(), 0)
+                    if batch
+                    else None
+                )
+            except queue.Empty:
+                # the flush interval has elapsed
+                pass
+            else:
+                if isinstance(item, bytes):
+                    if not batch:
+                        deadline = time.monotonic() + self.flush_interval
+                    batch.append(item)
+                    size += len(item)
+                    if size < self.max_batch_bytes:
+                        continue
+                elif item is None:
+                    stop = True
+                else:
+                    done = item
+            if batch:
+                self._deliver(batch)
+                batch = []
+                size = 0
+            if done is not None:
+                done.set()
+        self._reset()
+
+    def _deliver(self, batch: list[bytes]) -> None:
+        delay = self.retry_interval
+        while True:
+            try:
+                self._write_batch(batch)
+                return
+            except OSError:
+                self._reset()
+                if self._closing.is_set():
+                    self.dropped += len(batch)
+                    return
+            self._closing.wait(delay)
+            delay = min(delay * 2, self.max_retry_interval)
+
+
+class FluentHandler(_BatchingHandler):
+    """Handler sending records to fluentd with the forward protocol.
+
+    The records are sent in batches in the PackedForward mode of the
+    protocol, to a unix socket if address is a path or to a TCP socket if it
+    is a ``(host, port)`` tuple. The formatter defaults to a
+    :class:`oslo_log.formatters.FluentFormatter`. Formatters returning a
+    string are supported, their output is sent as the ``message`` key.
+
+    A batch is sent once it holds max_batch_bytes of records or
+    flush_interval seconds after its first record was logged. Up to
+    queue_size records are buffered while fluentd cannot be reached, the
+    connection being retried every retry_interval seconds, doubling up to
+    max_retry_interval seconds. Records logged while the queue is full are
+    counted in the ``dropped`` attribute.
+    """
+
+    def __init__(
+        self,
+        tag: str,
+        address: str | tuple[str, int] = ('localhost', 24224),
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.tag = tag
+        self.address = address
+        self._sock: socket.socket | None = None
+        self.setFormatter(formatters.FluentFormatter())
+
+    def _encode(self, record: logging.LogRecord) -> bytes:
+        # NOTE: FluentFormatter.format() returns a dict, not a string
+        payload: Any = self.format(record)
+        if not isinstance(payload, dict):
+            payload = {'message': payload}
+        seconds = int(record.created)
+        nanoseconds = int((record.created - seconds) * 1e9)
+        event_time = msgpack.ExtType(
+            0, struct.pack('>II', seconds, nanoseconds)
+        )
+        data: bytes = msgpack.packb(
+            [event_time, payload],
+            default=formatters._to_primitive_with_fallback,
+        )
+        return data
+
+    def _connect(self) -> socket.socket:
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.settimeout(self.timeout)
+                sock.connect(self.address)
+            except OSError:
+                sock.close()
+                raise
+        else:
+            sock = socket.create_connection(self.address, self.timeout)
+        return sock
+
+    def _write_batch(self, batch: list[bytes]) -> None:
+        if self._sock is None:
+            self._sock = self._connect()
+        self._sock.sendall(
+            msgpack.packb(
+                [self.tag, b''.join(batch), {'size': len(batch)}],
+                use_bin_type=True,
+            )
+        )
+
+    def _reset(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class OTLPHandler(_BatchingHandler):
+    """Handler exporting records in the OTLP/JSON format.
+
+    The records are formatted by a :class:`oslo_log.formatters.OTelFormatter`
+    and exported in batches, each batch being a single
+    ExportLogsServiceRequest. If endpoint is an ``http`` or ``https`` URL,
+    e.g. ``http://localhost:4318/v1/logs``, the batches are posted to the
+    OTLP/HTTP receiver of a collector with the given extra headers.
+    Otherwise endpoint is the path of a file the batches are appended to, one
+    per line, as read by the OTLP JSON file receiver.
+
+    Batches rejected by the collector with a client error are dropped, other
+    failures are retried. See :class:`FluentHandler` for the batching and
+    retry arguments.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        headers: dict[str, str] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.endpoint = endpoint
+        self.headers = {'Content-Type': 'application/json'}
+        self.headers.update(headers or {})
+        url = urllib.parse.urlsplit(endpoint)
+        self._url = url if url.scheme in ('http', 'https') else None
+        self._connection: http.client.HTTPConnection | None = None
+        self._file: BinaryIO | None = None
+        # The serialized resource, as text and bytes
+        self._resource: tuple[str, bytes] | None = None
+        self.setFormatter(formatters.OTelFormatter())
+
+    def _encode(self, record: logging.LogRecord) -> bytes:
+        formatter = self.formatter
+        if not isinstance(formatter, formatters.OTelFormatter):
+            raise TypeError('OTLPHandler requires an OTelFormatter')
+        # NOTE: The records queued together come from the same process, see
+        # _BatchingHandler._start(), so they share the resource.
+        resource = formatter._format_resource(record.process)
+        if self._resource is None or self._resource[0] is not resource:
+            self._resource = (resource, resource.encode('utf-8'))
+        return formatter._format_scope_logs(record).encode('utf-8')
+
+    def _write_batch(self, batch: list[bytes]) -> None:
+        assert self._resource is not None
+        body = b''.join(
+            (
+                b'{"resourceLogs":[{"resource":',
+                self._resource[1],
+                b',"scopeLogs":[',
+                b','.join(batch),
+                b']}]}',
+            )
+        )
+        if self._url is None:
+            if self._file is None:
+                self._file = open(self.endpoint, 'ab')
+            self._file.write(body + b'\n')
+            self._file.flush()
+        else:
+            self._post(body, len(batch))
+
+    def _post(self, body: bytes, count: int) -> None:
+        assert self._url is not None
+        if self._connection is None:
+            if self._url.scheme == 'https':
+                connection_class: type[http.client.HTTPConnection] = (
+                    http.client.HTTPSConnection
+                )
+            else:
+                connection_class = http.client.HTTPConnection
+            self._connection = connection_class(
+                self._url.hostname or 'localhost',
+                self._url.port,
+                timeout=self.timeout,
+            )
+        try:
+            self._connection.request(
+                'POST', self._url.path or '/v1/logs', body, self.headers
+            )
+            response = self._connection.getresponse()
+            response.read()
+        except http.client.HTTPException as e:
+            raise OSError(f'OTLP export failed: {e}') from e
+        if response.status == 429 or response.status >= 500:
+            raise OSError(f'OTLP export failed with status {response.status}')
+        if response.status >= 400:
+            # retrying would be rejected again
+            self.dropped += count
+
+    def _reset(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# The escapes of the PARAM-VALUEs of the RFC 5424 structured data
+_SD_ESCAPES = str.maketrans({'"': '\\"', '\\': '\\\\', ']': '\\]'})
+_UTF8_BOM = b'\xef\xbb\xbf'
+# The end of the messages truncated to fit in a datagram
+_TRUNCATED = b'... (truncated)'
+
+
+def _syslog_name(value: str, max_length: int) -> bytes:
+    """Return an RFC 5424 header field, made of printable ASCII."""
+    name = ''.join(c if '!' <= c <= '~' else '_' for c in value)
+    return name[:max_length].encode('ascii') or b'-'
+
+
+class SysLogSocketHandler(_BatchingHandler):
+    """Handler writing RFC 5424 messages to the local syslog socket.
+
+    Unlike :class:`OSSysLogHandler`, the messages are written to the socket
+    directly rather than through the C library, so they are not truncated
+    and carry the ``request_id``, ``global_request_id`` and ``project_id`` of
+    the request context as RFC 5424 structured data, with the sd_id SD-ID.
+    The default SD-ID uses the enterprise number RFC 5612 reserves for
+    documentation.
+
+    The facility is one of the ``syslog.LOG_*`` constants, ``LOG_USER`` by
+    default. The socket is a datagram socket, or a stream socket framed with
+    octet counting (RFC 6587) if the syslog daemon does not accept
+    datagrams, unless socktype is given. The messages too long for a
+    datagram are truncated and end with ``... (truncated)``. The messages
+    are written by emit(), or by a background thread if batch is true, see
+    :class:`FluentHandler` for the batching arguments.
+    """
+
+    sd_fields = ('request_id', 'global_request_id', 'project_id')
+
+    def __init__(
+        self,
+        address: str = '/dev/log',
+        facility: int | None = None,
+        sd_id: str = 'openstack@32473',
+        socktype: socket.SocketKind | None = None,
+        batch: bool = False,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.address = address
+        # LOG_USER, as the syslog constants, include the shift of the
+        # facility in the PRI value.
+        self.facility = facility if facility is not None else 1 << 3
+        self.sd_id = sd_id
+        self.batch = batch
+        self.socktype = socktype
+        self._sock: socket.socket | None = None
+        self._sock_pid: int | None = None
+        self._priorities = {
+            name: b'<%d>1 ' % (self.facility | severity)
+            for name, severity in SYSLOG_MAP.items()
+        }
+        self._debug_priority = b'<%d>1 ' % (self.facility | 7)
+        # The HOSTNAME, APP-NAME, PROCID and MSGID fields, for a process
+        self._fields: tuple[int | None, bytes] = (None, b'')
+        # The timestamp of the last record, up to the second
+        self._timestamp: tuple[int, bytes] = (-1, b'')
+
+    def _header_fields(self, pid: int) -> bytes:
+        if self._fields[0] != pid:
+            fields = b' '.join(
+                (
+                    b'',
+                    _syslog_name(socket.gethostname(), 255),
+                    _syslog_name(_get_binary_name(), 48),
+                    str(pid).encode('ascii'),
+                    b'- ',
+                )
+            )
+            self._fields = (pid, fields)
+        return self._fields[1]
+
+    def _format_timestamp(self, created: float) -> bytes:
+        seconds = int(created)
+        if self._timestamp[0] != seconds:
+            self._timestamp = (
+                seconds,
+                time.strftime(
+                    '%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)
+                ).encode('ascii'),
+            )
+        return self._timestamp[1] + b'.%06dZ' % ((created - seconds) * 1e6)
+
+    def _structured_data(self, record: logging.LogRecord) -> bytes:
+        formatters._update_record_with_context(record)
+        params = [
+            f' {field}="{str(value).translate(_SD_ESCAPES)}"'
+            for field in self.sd_fields
+            if (value := record.__dict__.get(field))
+        ]
+        if not params:
+            return b'-'
+        return f'[{self.sd_id}{"".join(params)}]'.encode()
+
+    def _encode(self, record: logging.LogRecord) -> bytes:
+        return b''.join(
+            (
+                self._priorities.get(record.levelname, self._debug_priority),
+                self._format_timestamp(record.created),
+                self._header_fields(record.process or os.getpid()),
+                self._structured_data(record),
+                b' ',
+                _UTF8_BOM,
+                self.format(record).encode('utf-8', 'backslashreplace'),
+            )
+        )
+
+    def _connect(self) -> socket.socket:
+        socktypes = [socket.SOCK_DGRAM, socket.SOCK_STREAM]
+        if self.socktype is not None:
+            socktypes = [self.socktype]
+        for socktype in socktypes:
+            sock = socket.socket(socket.AF_UNIX, socktype)
+            try:
+                sock.settimeout(self.timeout)
+                sock.connect(self.address)
+            except OSError as e:
+                sock.close()
+                # EPROTOTYPE if the daemon listens on a stream socket
+                if e.errno != errno.EPROTOTYPE or socktype == socktypes[-1]:
+                    raise
+                continue
+            self.socktype = socktype
+            return sock
+        raise AssertionError('unreachable')
+
+    def _write_batch(self, batch: list[bytes]) -> None:
+        if self._sock is None or self._sock_pid != os.getpid():
+            self._sock = self._connect()
+            self._sock_pid = os.getpid()
+        if self.socktype == socket.SOCK_STREAM:
+            self._sock.sendall(
+                b''.join(
+                    b'%d %s' % (len(message), message) for message in batch
+                )
+            )
+            return
+        for message in batch:
+            try:
+                self._sock.send(message)
+            except OSError as e:
+                if e.errno != errno.EMSGSIZE:
+                    raise
+                self._send_truncated(self._sock, message)
+
+    def _send_truncated(self, sock: socket.socket, message: bytes) -> None:
+        """Send the start of a message too long for a datagram."""
+        limit = min(
+            len(message), sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        )
+        while True:
+            # the overhead of a datagram is not known, shrink until it fits
+            limit = limit * 3 // 4
+            if limit <= len(_TRUNCATED):
+                raise OSError(errno.EMSGSIZE, 'Message too long')
+            head = message[: limit - len(_TRUNCATED)]
+            # do not cut a character of the message in two
+            head = head.decode('utf-8', 'ignore').encode('utf-8')
+            try:
+                sock.send(head + _TRUNCATED)
+            except OSError as e:
+                if e.errno != errno.EMSGSIZE:
+                    raise
+            else:
+                return
+
+    def _reset(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.batch:
+            super().emit(record)
+            return
+        try:
+            message = self._encode(record)
+            try:
+                self._write_batch([message])
+            except OSError:
+                # e.g. the syslog daemon was restarted
+                self._reset()
+                self._write_batch([message])
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        super().close()
+        if not self.batch:
+            with self.lock:  # type: ignore[union-attr]
+                self._reset()
+
+
+# The overflow policies of AsyncHandler
+ASYNC_OVERFLOW_POLICIES = ('block', 'drop-debug', 'drop-newest')
+
+
+class _RecordQueue:
+    """The bounded FIFO queue of AsyncHandler.
+
+    Unlike queue.Queue, it lets a queued DEBUG record be replaced.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._items: collections.deque[
+            logging.LogRecord | threading.Event | None
+        ] = collections.deque()
+        lock = threading.Lock()
+        self._not_empty = threading.Condition(lock)
+        self._not_full = threading.Condition(lock)
+
+    def put(
+        self,
+        item: logging.LogRecord | threading.Event | None,
+        block: bool = True,
+        timeout: float | None = None,
+    ) -> None:
+        with self._not_full:
+            if not self._not_full.wait_for(
+                lambda: len(self._items) < self.maxsize,
+                timeout if block else 0,
+            ):
+                raise queue.Full
+            self._items.append(item)
+            self._not_empty.notify()
+
+    def put_nowait(
+        self, item: logging.LogRecord | threading.Event | None
+    ) -> None:
+        self.put(item, block=False)
+
+    def get(self) -> logging.LogRecord | threading.Event | None:
+        with self._not_empty:
+            self._not_empty.wait_for(lambda: self._items)
+            item = self._items.popleft()
+            self._not_full.notify()
+            return item
+
+    def replace_debug(
+        self, record: logging.LogRecord
+    ) -> logging.LogRecord | None:
+        """Replace the oldest queued DEBUG record with record, if any."""
+        with self._not_full:
+            for item in self._items:
+                if (
+                    isinstance(item, logging.LogRecord)
+                    and item.levelno <= logging.DEBUG
+                ):
+                    self._items.remove(item)
+                    self._items.append(record)
+                    self._not_empty.notify()
+                    return item
+        return None
+
+
+class AsyncHandler(logging.handlers.QueueHandler):
+    """Handler passing the records to other handlers from a writer thread.
+
+    The records are put in a bounded queue and handled by the target
+    handlers in a dedicated thread, so that logging does not block on their
+    I/O. The message, the request context and the error summary, which
+    depend on the logging thread and the arguments at the time of the call,
+    are captured in a copy of the record before it is queued, the message
+    replacing ``msg`` and ``args`` as with QueueHandler. The rest of the
+    record is formatted in the writer thread.
+
+    When the queue is full, the overflow policy is one of:
+
+    * ``block``: wait for room in the queue.
+    * ``drop-debug``: drop the DEBUG records, the queued ones first to make
+      room for the others, which wait for room when none is queued.
+    * ``drop-newest``: drop the record.
+
+    The dropped records are counted by level name in the ``dropped``
+    attribute and reported by a warning once the queue has room again.
+    flush() and close() wait for the queued records to be handled, up to
+    timeout seconds.
+    """
+
+    def __init__(
+        self,
+        handlers: Iterable[logging.Handler],
+        queue_size: int = 10000,
+        overflow: str = 'block',
+        timeout: float = 5.0,
+    ) -> None:
+        if overflow not in ASYNC_OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy: {overflow}')
+        self.queue: _RecordQueue
+        super().__init__(_RecordQueue(queue_size))
+        self.handlers = list(handlers)
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.timeout = timeout
+        self.dropped: collections.Counter[str] = collections.Counter()
+        self._dropped_count = 0
+        self._reported_count = 0
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+
+    def _start(self) -> None:
+        # NOTE: As for _BatchingHandler, the thread is started with the
+        # first record so that the children of a fork get their own.
+        if self._pid == os.getpid():
+            return
+        with self.lock:  # type: ignore[union-attr]
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self.queue = _RecordQueue(self.queue_size)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='AsyncHandler', daemon=True
+            )
+            self._thread.start()
+
+    def _running(self) -> bool:
+        return (
+            self._pid == os.getpid()
+            and self._thread is not None
+            and self._thread.is_alive()
+        )
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # NOTE: Unlike Handler.handle(), the handler lock is not held while
+        # waiting for room in the queue: a target handler logging from the
+        # writer thread would otherwise wait for that lock while the logging
+        # thread holding it waits for the writer thread.
+        rv: Any = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return bool(rv)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Capture the state of the logging thread the formatters need, the
+        # formatting itself is left to the writer thread. The other handlers
+        # of the logger get the record unchanged.
+        record = copy.copy(record)
+        formatters._update_record_with_context(record)
+        formatters._get_error_summary(record)
+        # the arguments might change once the call returns
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self._start()
+        if self.overflow == 'drop-debug' and record.levelno > logging.DEBUG:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                evicted = self.queue.replace_debug(record)
+            if evicted is not None:
+                self._count_dropped(evicted)
+                return
+        # NOTE: The writer thread never waits for room in its own queue, e.g.
+        # when a target handler logs.
+        wait = threading.current_thread() is not self._thread and (
+            self.overflow == 'block'
+            or (
+                self.overflow == 'drop-debug'
+                and record.levelno > logging.DEBUG
+            )
+        )
+        try:
+            self.queue.put(record, block=wait)
+        except queue.Full:
+            self._count_dropped(record)
+
+    def _count_dropped(self, record: logging.LogRecord) -> None:
+        with self.lock:  # type: ignore[union-attr]
+            self.dropped[record.levelname] += 1
+            self._dropped_count += 1
+
+    def flush(self) -> None:
+        if self._running():
+            done = threading.Event()
+            try:
+                self.queue.put(done, timeout=self.timeout)
+            except queue.Full:
+                pass
+            else:
+                done.wait(self.timeout)
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self) -> None:
+        if self._running():
+            try:
+                self.queue.put(None, timeout=self.timeout)
+            except queue.Full:
+                pass
+            assert self._thread is not None
+            self._thread.join(self.timeout)
+        self._pid = None
+        super().close()
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            self._handle(item)
+            if self._dropped_count != self._reported_count:
+                self._report_dropped()
+
+    def _handle(self, record: logging.LogRecord) -> None:
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _report_dropped(self) -> None:
+        count = self._dropped_count
+        record = logging.LogRecord(
+            __name__,
+            logging.WARNING,
+            __file__,
+            0,
+            'Dropped %d log records because the logging queue was full',
+            (count - self._reported_count,),
+            None,
+        )
+        self._reported_count = count
+        self._handle(self.prepare(record))
+
+
+# The inotify(7) events flagging that the watched log file was moved or
+# deleted, IN_ATTRIB being sent when its link count changes
+_IN_ATTRIB = 0x00000004
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_IGNORED = 0x00008000
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+
+@functools.cache
+def _load_inotify() -> Any:
+    """Return the C library if it provides inotify, None otherwise."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class _InotifyWatch:
+    """Call back when the watched file is moved or deleted.
+
+    The events are read by a daemon thread, which close() stops. If the
+    thread fails, failed is set and the callback is called a last time.
+    """
+
+    def __init__(self, libc: Any, callback: Callable[[], None]) -> None:
+        self._libc = libc
+        self._callback = callback
+        self._wd = -1
+        self._fd = libc.inotify_init1(_IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._wake_r, self._wake_w = os.pipe()
+        self.failed = False
+        self._thread = threading.Thread(
+            target=self._run, name='WatchedFileHandler-inotify', daemon=True
+        )
+        self._thread.start()
+
+    def watch(self, path: str) -> None:
+        """Watch the file at path instead of the previous one."""
+        if self._wd >= 0:
+            self._libc.inotify_rm_watch(self._fd, self._wd)
+        self._wd = self._libc.inotify_add_watch(
+            self._fd,
+            os.fsencode(path),
+            _IN_ATTRIB | _IN_DELETE_SELF | _IN_MOVE_SELF,
+        )
+        if self._wd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed', path)
+
+    def _wait(self) -> bool:
+        """Wait for events, return False once close() was called."""
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            poller.register(self._fd, select.POLLIN)
+            poller.register(self._wake_r, select.POLLIN)
+            ready = {fd for fd, _ in poller.poll()}
+        else:
+            # eventlet's green select module has no poll
+            ready = set(select.select([self._fd, self._wake_r], [], [])[0])
+        return self._wake_r not in ready
+
+    def _read_events(self) -> None:
+        while self._wait():
+            data = os.read(self._fd, 4096)
+            offset = 0
+            changed = False
+            while offset < len(data):
+                _, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+                offset += _INOTIFY_EVENT.size + length
+                # the previous file is no longer watched
+                changed = changed or not mask & _IN_IGNORED
+            if changed:
+                self._callback()
+
+    def _run(self) -> None:
+        try:
+            self._read_events()
+        except Exception:
+            # the handler goes back to checking the file with stat
+            self.failed = True
+            self._callback()
+        finally:
+            for fd in (self._fd, self._wake_r):
+                os.close(fd)
+
+    def close(self) -> None:
+        if not self.failed:
+            try:
+                os.write(self._wake_w, b'x')
+            except OSError:
+                # the thread failed and closed the other end meanwhile
+                pass
+        os.close(self._wake_w)
+
+    def discard(self) -> None:
+        """Close the file descriptors inherited by a forked child."""
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            os.close(fd)
+
+
+# The WatchedFileHandlers using inotify, to restart their watch after a fork
+_inotify_handlers: weakref.WeakSet[WatchedFileHandler] = weakref.WeakSet()
+
+
+def _after_fork_in_child() -> None:
+    for handler in _inotify_handlers:
+        handler._forked = True
+        handler._changed = True
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _context_delta(handler: logging.Handler) -> bool:
+    """Check whether the records the handler formats may refer to the
+    request contexts of the previous records.
+    """
+    formatter = handler.formatter
+    return (
+        isinstance(formatter, formatters.JSONFormatter)
+        and formatter.context_delta
+    )
+
+
+def _forget_contexts(handler: logging.Handler) -> None:
+    """Have the formatter of a handler starting a new file emit the request
+    contexts in full again.
+    """
+    if isinstance(handler.formatter, formatters.JSONFormatter):
+        handler.formatter.forget_contexts()
+
+
+class WatchedFileHandler(logging.handlers.WatchedFileHandler):
+    """WatchedFileHandler checking for the rotation of the file cheaply.
+
+    The standard library handler calls stat on the log file for every
+    record, to reopen it once logrotate has moved or deleted it.
+
+    :param check_interval: Minimum number of seconds between two checks of
+        the log file. The records logged in the meantime still go to the
+        moved file. 0, the default, checks the file for every record.
+    :param inotify: Use inotify to learn when the log file is moved or
+        deleted, and only check it then. This is only available on Linux,
+        check_interval applies otherwise.
+
+    reopen() makes the handler reopen the log file with the next record,
+    as when it was moved.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        check_interval: float = 0.0,
+        inotify: bool = False,
+        **kwargs: Any,
+    ) -> None:
+        self.check_interval = check_interval
+        self._next_check = 0.0
+        self._changed = False
+        self._forked = False
+        self._watch: _InotifyWatch | None = None
+        libc = _load_inotify() if inotify else None
+        if libc is not None:
+            self._watch = _InotifyWatch(libc, self._set_changed)
+            _inotify_handlers.add(self)
+        super().__init__(*args, **kwargs)
+
+    def _set_changed(self) -> None:
+        self._changed = True
+
+    def _statstream(self) -> None:
+        super()._statstream()
+        if self._watch is not None and self.stream is not None:
+            try:
+                self._watch.watch(self.baseFilename)
+            except OSError:
+                # e.g. out of inotify watches, check the file every time
+                self._watch.close()
+                self._watch = None
+
+    def reopen(self) -> None:
+        """Reopen the log file with the next record."""
+        with self.lock:  # type: ignore[union-attr]
+            self.dev = -1
+            self._changed = True
+
+    def reopenIfNeeded(self) -> None:
+        if self._watch is not None:
+            if not self._changed:
+                return
+            if self._watch.failed:
+                self._watch.close()
+                self._watch = None
+            elif self._forked:
+                # the thread reading the events stayed in the parent
+                self._forked = False
+                self._watch.discard()
+                self._watch = _InotifyWatch(
+                    self._watch._libc, self._set_changed
+                )
+                self.dev = -1
+        elif self.check_interval and not self._changed:
+            now = time.monotonic()
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+        self._changed = False
+        # As the standard library handler, stat the file by path once.
+        try:
+            sres: os.stat_result | None = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            sres = None
+        if sres is None or (sres.st_dev, sres.st_ino) != (self.dev, self.ino):
+            if self.stream is not None:
+                self._reopen_stream()
+
+    def _reopen_stream(self) -> None:
+        """Close the moved file and open the new one."""
+        assert self.stream is not None
+        self.stream.flush()
+        self.stream.close()
+        # See bpo-21742: _open() might fail
+        self.stream = None
+        self.stream = self._open()
+        self._statstream()
+        _forget_contexts(self)
+
+    def close(self) -> None:
+        with self.lock:  # type: ignore[union-attr]
+            if self._watch is not None:
+                self._watch.close()
+                self._watch = None
+            super().close()
+
+
+# The extensions of the rotated log files, by compression
+_COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def _open_compressed(compression: str, path: str) -> io.BufferedIOBase:
+    if compression == 'gzip':
+        return gzip.GzipFile(path, 'wb', compresslevel=6)
+    elif stdlib_zstd is not None:
+        return stdlib_zstd.open(path, 'wb')  # type: ignore[no-any-return]
+    return zstandard.open(path, 'wb')  # type: ignore[no-any-return]
+
+
+def _compress_file(source: str, dest: str, compression: str) -> None:
+    """Compress the source file into dest, then remove it."""
+    tmp = dest + '.tmp'
+    try:
+        with open(source, 'rb') as src:
+            with _open_compressed(compression, tmp) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp, dest)
+        os.remove(source)
+    except OSError:
+        # the rotated file is left uncompressed
+        if logging.raiseExceptions:
+            traceback.print_exc()
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def _strip_compression(name: str) -> str:
+    for extension in _COMPRESSION_EXTENSIONS.values():
+        if name.endswith(extension):
+            return name[: -len(extension)]
+    return name
+
+
+class _CompressingMixin(_FileHandler):
+    """Mixin compressing the rotated files of a rotating handler.
+
+    The rotated file is compressed by a background thread, so that logging
+    only waits for it when the next rollover comes before it is done.
+    """
+
+    def __init__(
+        self, *args: Any, compression: str | None = None, **kwargs: Any
+    ) -> None:
+        if compression is not None:
+            if compression not in _COMPRESSION_EXTENSIONS:
+                raise ValueError(f'Unknown compression: {compression}')
+            if compression == 'zstd' and not (stdlib_zstd or zstandard):
+                raise RuntimeError('zstandard is not available')
+        self.compression = compression
+        self._compressor: threading.Thread | None = None
+        super().__init__(*args, **kwargs)
+
+    def _wait_compressor(self) -> None:
+        if self._compressor is not None:
+            self._compressor.join()
+            self._compressor = None
+
+    def rotate(self, source: str, dest: str) -> None:
+        super().rotate(source, dest)  # type: ignore[misc]
+        if self.compression is None or not os.path.exists(dest):
+            return
+        self._compressor = threading.Thread(
+            target=_compress_file,
+            args=(
+                dest,
+                dest + _COMPRESSION_EXTENSIONS[self.compression],
+                self.compression,
+            ),
+            name=f'{type(self).__name__}-compressor',
+            daemon=True,
+        )
+        self._compressor.start()
+
+    def close(self) -> None:
+        self._wait_compressor()
+        super().close()
+
+
+# The number of records after which RotatingFileHandler checks the size of
+# the file again, in case other processes write to it
+_SIZE_SYNC_RECORDS = 1000
+
+
+class RotatingFileHandler(
+    _CompressingMixin, logging.handlers.RotatingFileHandler
+):
+    """RotatingFileHandler optionally compressing the rotated files.
+
+    :param compression: ``gzip`` or ``zstd`` to compress the rotated files
+        in the background, adding a ``.gz`` or ``.zst`` extension to their
+        names.
+
+    The backups are numbered whether they are compressed or not, so the
+    compression can be changed without leaving old backups behind.
+
+    Unlike the standard library handler, each record is only formatted once
+    and the size of the file is tracked by a counter, checked with fstat
+    every _SIZE_SYNC_RECORDS records and before rolling over.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self._size: int = 0
+        self._unsynced = _SIZE_SYNC_RECORDS
+        self._regular_file = True
+        super().__init__(*args, **kwargs)
+
+    def _sync_size(self) -> None:
+        if self.stream is None:
+            self.stream = self._open()
+        st = os.fstat(self.stream.fileno())
+        self._size = st.st_size
+        self._unsynced = 0
+        # See bpo-45401: never roll over anything other than regular files
+        self._regular_file = stat.S_ISREG(st.st_mode)
+
+    def _should_rollover(self, length: int) -> bool:
+        """Check whether length more characters need a rollover first."""
+        if self.maxBytes <= 0:
+            return False
+        self._unsynced += 1
+        if self._unsynced >= _SIZE_SYNC_RECORDS:
+            self._sync_size()
+        if self._size + length < self.maxBytes:
+            return False
+        # the file might have been truncated since the last check
+        self._sync_size()
+        return self._regular_file and self._size + length >= self.maxBytes
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        return self._should_rollover(len(self.format(record)) + 1)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            msg = self.format(record) + self.terminator
+            if self._should_rollover(len(msg)):
+                self.doRollover()
+                if _context_delta(self):
+                    # the record may refer to contexts of the previous file
+                    msg = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg)
+            self.flush()
+            self._size += len(msg)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def doRollover(self) -> None:
+        self._wait_compressor()
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if self.backupCount > 0:
+            extensions = ('', *_COMPRESSION_EXTENSIONS.values())
+            for extension in extensions:
+                name = self.rotation_filename(
+                    f'{self.baseFilename}.{self.backupCount}'
+                )
+                if os.path.exists(name + extension):
+                    os.remove(name + extension)
+            for i in range(self.backupCount - 1, 0, -1):
+                sfn = self.rotation_filename(f'{self.baseFilename}.{i}')
+                dfn = self.rotation_filename(f'{self.baseFilename}.{i + 1}')
+                for extension in extensions:
+                    if os.path.exists(sfn + extension):
+                        os.replace(sfn + extension, dfn + extension)
+            dfn = self.rotation_filename(self.baseFilename + '.1')
+            if os.path.exists(dfn):
+                os.remove(dfn)
+            self.rotate(self.baseFilename, dfn)
+        if not self.delay:
+            self.stream = self._open()
+        self._size = 0
+        self._unsynced = _SIZE_SYNC_RECORDS
+        _forget_contexts(self)
+
+
+class TimedRotatingFileHandler(
+    _CompressingMixin, logging.handlers.TimedRotatingFileHandler
+):
+    """TimedRotatingFileHandler optionally compressing the rotated files.
+
+    See :class:`RotatingFileHandler` for the compression argument. The
+    backups to remove are found whether they are compressed or not.
+
+    The creation time of the records is compared to the precomputed time of
+    the next rollover rather than reading the clock again for each record.
+    """
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if record.created < self.rolloverAt:
+            return False
+        # See bpo-45401: never roll over anything other than regular files
+        if os.path.exists(self.baseFilename) and not os.path.isfile(
+            self.baseFilename
+        ):
+            self.rolloverAt = self.computeRollover(int(record.created))
+            return False
+        return True
+
+    def doRollover(self) -> None:
+        self._wait_compressor()
+        super().doRollover()
+        _forget_contexts(self)
+
+    def getFilesToDelete(self) -> list[str]:
+        dir_name, base_name = os.path.split(self.baseFilename)
+        prefix = base_name + '.'
+        backups: dict[str, list[str]] = collections.defaultdict(list)
+        for file_name in os.listdir(dir_name):
+            if not file_name.startswith(prefix):
+                continue
+            suffix = _strip_compression(file_name[len(prefix) :])
+            if self.extMatch.fullmatch(suffix):
+                backups[suffix].append(os.path.join(dir_name, file_name))
+        # The date suffixes sort in chronological order, keep the newest.
+        expired = sorted(backups)[: max(len(backups) - self.backupCount, 0)]
+        return [path for suffix in expired for path in backups[suffix]]
+
+
+# The maximum number of buffers os.writev() accepts on Linux
+_IOV_MAX = 1024
+
+
+def _write_all(fd: int, chunks: list[bytes]) -> None:
+    """Write the chunks to a file descriptor with as few calls as possible."""
+    if not hasattr(os, 'writev'):
+        chunks = [b''.join(chunks)]
+    index = 0
+    while index < len(chunks):
+        if len(chunks) - index == 1:
+            written = os.write(fd, chunks[index])
+        else:
+            written = os.writev(fd, chunks[index : index + _IOV_MAX])
+        # skip what was written, the write may have been partial
+        while index < len(chunks) and written >= len(chunks[index]):
+            written -= len(chunks[index])
+            index += 1
+        if written:
+            chunks[index] = chunks[index][written:]
+
+
+# The buffered file handlers, to drop the records a forked child inherits
+_buffered_handlers: weakref.WeakSet[_BufferedFileMixin] = weakref.WeakSet()
+
+
+def _drop_buffers_in_child() -> None:
+    # NOTE: The parent writes these records, the child would write them a
+    # second time.
+    for handler in _buffered_handlers:
+        handler._buffer = []
+        handler._buffered = 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_drop_buffers_in_child)
+
+
+class _BufferedFileMixin(_FileHandler):
+    """Mixin buffering the records of a file handler in memory.
+
+    The formatted records are written to the file together, with a single
+    writev call, once buffer_size bytes of them are pending, flush_interval
+    seconds after the first one was buffered, or as soon as a record of
+    level ERROR or above is logged. The pending records are written by
+    flush() and close(), which logging.shutdown() calls at exit.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        buffer_size: int = 64 * 1024,
+        flush_interval: float = 0.05,
+        **kwargs: Any,
+    ) -> None:
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer: list[bytes] = []
+        self._buffered = 0
+        self._pending = threading.Event()
+        self._closing = threading.Event()
+        self._flusher: threading.Thread | None = None
+        self._flusher_pid: int | None = None
+        super().__init__(*args, **kwargs)
+        _buffered_handlers.add(self)
+
+    def _prepare_stream(self, record: logging.LogRecord, msg: str) -> bool:
+        """Called before the formatted record is buffered, to rotate the
+        file. Return whether a new file was started.
+        """
+        return False
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            msg = self.format(record) + self.terminator
+            if self._prepare_stream(record, msg) and _context_delta(self):
+                # the record may refer to contexts of the previous file
+                msg = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            data = msg.encode(
+                self.stream.encoding, self.stream.errors or 'strict'
+            )
+            self._buffer.append(data)
+            self._buffered += len(data)
+            if (
+                record.levelno >= logging.ERROR
+                or self._buffered >= self.buffer_size
+            ):
+                self._write_buffer()
+            elif len(self._buffer) == 1:
+                self._start_flusher()
+                self._pending.set()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _write_buffer(self) -> None:
+        """Write the pending records, with the handler lock held."""
+        if not self._buffer:
+            return
+        chunks = self._buffer
+        self._buffer = []
+        self._buffered = 0
+        if self.stream is None:
+            self.stream = self._open()
+        # in case something was written to the stream itself
+        self.stream.flush()
+        _write_all(self.stream.fileno(), chunks)
+
+    def _start_flusher(self) -> None:
+        # NOTE: As for _BatchingHandler, the thread is started on demand so
+        # that the children of a fork get their own.
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        self._flusher = threading.Thread(
+            target=self._run_flusher, name=type(self).__name__, daemon=True
+        )
+        self._flusher.start()
+
+    def _run_flusher(self) -> None:
+        while True:
+            self._pending.wait()
+            if self._closing.wait(self.flush_interval):
+                return
+            self._pending.clear()
+            with self.lock:  # type: ignore[union-attr]
+                try:
+                    self._write_buffer()
+                except Exception:
+                    # the records are lost, as when emit() fails
+                    if logging.raiseExceptions:
+                        traceback.print_exc()
+
+    def flush(self) -> None:
+        with self.lock:  # type: ignore[union-attr]
+            if self.stream is not None:
+                self._write_buffer()
+        super().flush()
+
+    def doRollover(self) -> None:
+        # the pending records belong to the current file
+        self._write_buffer()
+        super().doRollover()  # type: ignore[misc]
+
+    def close(self) -> None:
+        self._closing.set()
+        self._pending.set()
+        with self.lock:  # type: ignore[union-attr]
+            try:
+                if self.stream is not None:
+                    self._write_buffer()
+            finally:
+                super().close()
+
+
+class BufferedWatchedFileHandler(_BufferedFileMixin, WatchedFileHandler):
+    """WatchedFileHandler writing the records in batches.
+
+    See :class:`BufferedRotatingFileHandler` for the buffering arguments.
+    """
+
+    def _prepare_stream(self, record: logging.LogRecord, msg: str) -> bool:
+        stream = self.stream
+        self.reopenIfNeeded()
+        return self.stream is not stream
+
+    def _reopen_stream(self) -> None:
+        # NOTE: As with the unbuffered handler, the records logged before
+        # the file was found to have been moved are written to it.
+        self._write_buffer()
+        super()._reopen_stream()
+
+
+class BufferedRotatingFileHandler(_BufferedFileMixin, RotatingFileHandler):
+    """RotatingFileHandler writing the records in batches.
+
+    The records are written to the file together once buffer_size bytes of
+    them are pending, flush_interval seconds after the first one was
+    logged, or as soon as a record of level ERROR or above is logged. The
+    pending records count toward the size of the file.
+    """
+
+    def _prepare_stream(self, record: logging.LogRecord, msg: str) -> bool:
+        rollover = self._should_rollover(len(msg))
+        if rollover:
+            self.doRollover()
+        self._size += len(msg)
+        return rollover
+
+    def _sync_size(self) -> None:
+        super()._sync_size()
+        self._size += self._buffered
+
+
+class BufferedTimedRotatingFileHandler(
+    _BufferedFileMixin, TimedRotatingFileHandler
+):
+    """TimedRotatingFileHandler writing the records in batches.
+
+    See :class:`BufferedRotatingFileHandler` for the buffering arguments.
+    """
+
+    def _prepare_stream(self, record: logging.LogRecord, msg: str) -> bool:
+        rollover = self.shouldRollover(record)
+        if rollover:
+            self.doRollover()
+        return rollover
@@ -231,6 +231,10 @@ def _create_logging_excepthook(
             'Unhandled error',
             exc_info=(exc_type, value, tb),
         )
+        # Write out the queued records before the process goes away
+        for handler in getLogger(None).logger.handlers:
+            if isinstance(handler, handlers.AsyncHandler):
+                handler.flush()
 
     return logging_excepthook
 
@@ -280,6 +284,22 @@ def _mutate_hook(conf: cfg.ConfigOpts, fresh: cfg.ConfigOpts) -> None:
     if conf.log_config_append:
         _load_log_config(conf.log_config_append)
 
+    # NOTE: The services mutate their configuration on SIGHUP, which is also
+    # how logrotate asks them to reopen their log files.
+    _reopen_log_files()
+
+
+def _reopen_log_files() -> None:
+    """Reopen the watched log files with their next record."""
+    for handler in logging.getLogger(None).handlers:
+        if isinstance(handler, handlers.AsyncHandler):
+            targets = handler.handlers
+        else:
+            targets = [handler]
+        for target in targets:
+            if isinstance(target, handlers.WatchedFileHandler):
+                target.reopen()
+
 
 def register_options(conf: cfg.ConfigOpts) -> None:
     """Register the command line and configuration options used by oslo.log."""
@@ -433,6 +453,27 @@ def _refresh_root_level(debug: bool) -> None:
         log_root.setLevel(logging.INFO)
 
 
+def _create_formatter(
+    conf: cfg.ConfigOpts, project: str, version: str
+) -> logging.Formatter:
+    datefmt = conf.log_date_format
+    if not conf.use_json:
+        return formatters.ContextFormatter(
+            project=project,
+            version=version,
+            datefmt=datefmt,
+            config=conf,
+        )
+    return formatters.JSONFormatter(
+        datefmt=datefmt,
+        encoder=conf.json_encoder,
+        fields=conf.json_fields or None,
+        static_fields=conf.json_static_fields,
+        traceback_frames=conf.json_traceback_frames,
+        context_delta=conf.json_context_delta,
+    )
+
+
 def _setup_logging_from_conf(
     conf: cfg.ConfigOpts, project: str, version: str
 ) -> None:
@@ -441,15 +482,30 @@ def _setup_logging_from_conf(
     # Remove all handlers
     for handler in list(log_root.handlers):
         log_root.removeHandler(handler)
+        if isinstance(handler, handlers.AsyncHandler):
+            # stop its writer thread
+            handler.close()
 
     logpath = _get_log_file_path(conf)
     if logpath:
-        file_handler: type[logging.Handler]
+        file_handler: Callable[..., logging.Handler]
         filelog: logging.Handler
+        buffered = conf.log_file_buffer_size > 0
+        buffer_kwargs: dict[str, Any] = {}
+        if buffered:
+            buffer_kwargs = {
+                'buffer_size': conf.log_file_buffer_size,
+                'flush_interval': conf.log_file_flush_interval / 1000,
+            }
+        rotate_kwargs = dict(buffer_kwargs)
+        if conf.log_rotation_compression:
+            rotate_kwargs['compression'] = conf.log_rotation_compression
 
         # On Windows, in-use files cannot be moved or deleted.
         if conf.log_rotation_type.lower() == "interval":
-            file_handler = logging.handlers.TimedRotatingFileHandler
+            file_handler = handlers.TimedRotatingFileHandler
+            if buffered:
+                file_handler = handlers.BufferedTimedRotatingFileHandler
             when = conf.log_rotate_interval_type.lower()
             interval_type = LOG_ROTATE_INTERVAL_MAPPING[when]
             # When weekday is configured, "when" has to be a value between
@@ -461,16 +517,31 @@ def _setup_logging_from_conf(
                 when=interval_type,
                 interval=conf.log_rotate_interval,
                 backupCount=conf.max_logfile_count,
+                **rotate_kwargs,
             )
         elif conf.log_rotation_type.lower() == "size":
-            file_handler = logging.handlers.RotatingFileHandler
+            file_handler = handlers.RotatingFileHandler
+            if buffered:
+                file_handler = handlers.BufferedRotatingFileHandler
             maxBytes = conf.max_logfile_size_mb * units.Mi
             filelog = file_handler(
-                logpath, maxBytes=maxBytes, backupCount=conf.max_logfile_count
+                logpath,
+                maxBytes=maxBytes,
+                backupCount=conf.max_logfile_count,
+                **rotate_kwargs,
             )
         else:
-            file_handler = logging.handlers.WatchedFileHandler
-            filelog = file_handler(logpath)
+            file_handler = handlers.WatchedFileHandler
+            if buffered:
+                file_handler = handlers.BufferedWatchedFileHandler
+            watch_kwargs = dict(buffer_kwargs)
+            if conf.log_file_watch_interval:
+                watch_kwargs['check_interval'] = (
+                    conf.log_file_watch_interval / 1000
+                )
+            if conf.log_file_inotify:
+                watch_kwargs['inotify'] = True
+            filelog = file_handler(logpath, **watch_kwargs)
 
         log_root.addHandler(filelog)
 
@@ -508,23 +579,42 @@ def _setup_logging_from_conf(
         if syslog is None:
             raise RuntimeError("syslog is not available on this platform")
         facility = _find_facility(conf.syslog_log_facility)
-        syslog_handler = handlers.OSSysLogHandler(facility=facility)
+        syslog_handler: logging.Handler
+        if conf.syslog_address:
+            syslog_handler = handlers.SysLogSocketHandler(
+                conf.syslog_address,
+                facility=facility,
+                batch=conf.syslog_batch,
+            )
+        else:
+            syslog_handler = handlers.OSSysLogHandler(facility=facility)
         log_root.addHandler(syslog_handler)
 
-    datefmt = conf.log_date_format
-    if not conf.use_json:
-        for handler in log_root.handlers:
-            handler.setFormatter(
-                formatters.ContextFormatter(
-                    project=project,
-                    version=version,
-                    datefmt=datefmt,
-                    config=conf,
-                )
+    # NOTE: All the handlers share one formatter, which lets them reuse the
+    # text rendered for the first one instead of formatting each record
+    # once per handler. The context references of a JSON formatter with
+    # context_delta only make sense in one output though, so each handler
+    # then gets its own.
+    shared = not (conf.use_json and conf.json_context_delta)
+    formatter = _create_formatter(conf, project, version)
+    for handler in log_root.handlers:
+        if not shared:
+            formatter = _create_formatter(conf, project, version)
+        handler.setFormatter(formatter)
+    if shared and not any(handler.filters for handler in log_root.handlers):
+        formatters._reuse_rendered_text(formatter)
+
+    if conf.log_async:
+        targets = list(log_root.handlers)
+        for handler in targets:
+            log_root.removeHandler(handler)
+        log_root.addHandler(
+            handlers.AsyncHandler(
+                targets,
+                queue_size=conf.log_async_queue_size,
+                overflow=conf.log_async_overflow,
             )
-    else:
-        for handler in log_root.handlers:
-            handler.setFormatter(formatters.JSONFormatter(datefmt=datefmt))
+        )
     _refresh_root_level(conf.debug)
 
     for pair in conf.default_log_levels:
@@ -12,6 +12,8 @@
 
 import io
 
+import msgpack
+
 from oslo_log.cmds import convert_json
 from oslo_serialization import jsonutils
 from oslotest import base as test_base
@@ -66,6 +68,19 @@ class ConvertJsonTestCase(test_base.BaseTestCase):
     def _lines(self, record, pre='pre', loc='loc', **args):
         return list(convert_json.console_format(pre, loc, record, **args))
 
+    def test_reformat_json_context_ref(self):
+        context = {'request_id': 'req-1', 'user': 'u'}
+        records = [
+            {'message': 'a', 'context': {'$ref': 'req-0'}},
+            {'message': 'b', 'context': context},
+            {'message': 'c', 'context': {'$ref': 'req-1'}},
+        ]
+        text = '\n'.join(jsonutils.dumps(record) for record in records)
+        self.assertEqual(
+            [{'$ref': 'req-0'}, context, context],
+            [record['context'] for record in self._reformat(text)],
+        )
+
     def test_console_format_trivial(self):
         lines = self._lines(TRIVIAL_RECORD)
         self.assertEqual(['pre msg'], lines)
@@ -89,3 +104,47 @@ class ConvertJsonTestCase(test_base.BaseTestCase):
     def test_console_format_exception(self):
         lines = self._lines(EXCEPTION_RECORD, traceback_key='exception')
         self.assertEqual(['pre msg', 'pre abc', 'pre def'], lines)
+
+
+def _frame(record):
+    payload = msgpack.packb(record)
+    return len(payload).to_bytes(4, 'big') + payload
+
+
+class ConvertMsgpackTestCase(test_base.BaseTestCase):
+    def _reformat(self, data, **kwargs):
+        fh = io.BytesIO(data)
+        return list(
+            convert_json.reformat_msgpack(fh, lambda x: iter([x]), **kwargs)
+        )
+
+    def test_reformat_msgpack_single(self):
+        self.assertEqual(
+            [TRIVIAL_RECORD], self._reformat(_frame(TRIVIAL_RECORD))
+        )
+
+    def test_reformat_msgpack_double(self):
+        data = _frame(TRIVIAL_RECORD) + _frame(TRACEBACK_RECORD)
+        self.assertEqual(
+            [TRIVIAL_RECORD, TRACEBACK_RECORD], self._reformat(data)
+        )
+
+    def test_reformat_msgpack_lines(self):
+        data = b''.join(_frame({'message': str(i)}) for i in range(5))
+        self.assertEqual(
+            [{'message': '3'}, {'message': '4'}],
+            self._reformat(data, lines=2),
+        )
+
+    def test_reformat_msgpack_truncated(self):
+        data = _frame(TRIVIAL_RECORD) + _frame(TRACEBACK_RECORD)[:-1]
+        records = self._reformat(data)
+        self.assertEqual(TRIVIAL_RECORD, records[0])
+        self.assertIn('Not MessagePack', records[1])
+        self.assertEqual(2, len(records))
+
+    def test_reformat_msgpack_garbage(self):
+        data = b'\x00\x00\x00\x02\xc1\xc1' + _frame(TRIVIAL_RECORD)
+        records = self._reformat(data)
+        self.assertEqual(1, len(records))
+        self.assertIn('Not MessagePack', records[0])
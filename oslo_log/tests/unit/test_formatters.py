@@ -14,12 +14,23 @@
 
 """Unit Tests for oslo.log formatter"""
 
+import dataclasses
+import datetime
+import functools
+import json
 import logging
+import os
 import sys
+import time
+import traceback
+from unittest import mock
+import uuid
 
+from dateutil import tz
 from oslo_config import cfg
 from oslo_config import fixture as config_fixture
 from oslo_context import context
+from oslo_serialization import jsonutils
 from oslotest import base as test_base
 
 from oslo_log import formatters
@@ -65,6 +76,150 @@ class FormatterTest(test_base.BaseTestCase):
             ctxt.get_logging_values(), formatters._dictify_context(ctxt)
         )
 
+    def test_dictify_context_cached(self):
+        ctxt = _fake_context()
+        with mock.patch.object(
+            ctxt, 'get_logging_values', wraps=ctxt.get_logging_values
+        ) as get_logging_values:
+            values = formatters._dictify_context(ctxt)
+            self.assertIs(values, formatters._dictify_context(ctxt))
+            self.assertEqual(1, get_logging_values.call_count)
+
+    def test_dictify_context_changed(self):
+        ctxt = _fake_context()
+        values = formatters._dictify_context(ctxt)
+        self.assertEqual('user', values['user'])
+        ctxt.user_id = 'other'
+        values = formatters._dictify_context(ctxt)
+        self.assertEqual('other', values['user'])
+        self.assertEqual(ctxt.get_logging_values(), values)
+
+    def test_user_identity(self):
+        ctxt = _fake_context()
+        self.assertEqual(
+            'user tenant - udomain',
+            formatters._get_user_identity(
+                ctxt, '%(user)s %(project)s %(domain)s %(user_domain)s'
+            ),
+        )
+        self.assertEqual(
+            'tenant', formatters._get_user_identity(ctxt, '%(project)s')
+        )
+        ctxt.project_id = 'other'
+        self.assertEqual(
+            'other', formatters._get_user_identity(ctxt, '%(project)s')
+        )
+
+    def test_user_identity_dict(self):
+        self.assertEqual(
+            'user1 -',
+            formatters._get_user_identity(
+                {'user': 'user1'}, '%(user)s %(project)s'
+            ),
+        )
+
+    def test_update_record_with_context_once(self):
+        ctxt = _fake_context()
+        record = logging.LogRecord(
+            'test', logging.INFO, 'test', 0, 'test message', {}, None
+        )
+        record.context = ctxt
+        with mock.patch.object(
+            formatters, '_dictify_context', wraps=formatters._dictify_context
+        ) as dictify:
+            self.assertIs(ctxt, formatters._update_record_with_context(record))
+            self.assertIs(ctxt, formatters._update_record_with_context(record))
+            self.assertEqual(1, dictify.call_count)
+        self.assertEqual('user', record.__dict__['user'])
+
+    def test_update_record_with_current_context(self):
+        ctxt = _fake_context()
+        record = logging.LogRecord(
+            'test', logging.INFO, 'test', 0, 'test message', {}, None
+        )
+        self.assertIs(ctxt, formatters._update_record_with_context(record))
+        self.assertIs(ctxt, formatters._update_record_with_context(record))
+        # handlers may serialize the attributes of the record
+        for value in record.__dict__.values():
+            self.assertNotIsInstance(value, context.RequestContext)
+
+    def test_message_keys(self):
+        for msg, keys in (
+            ('no keys', set()),
+            ('%(a)s %(b)d %(a)r', {'a', 'b'}),
+            ('%%(escaped)s %(a)s', {'a'}),
+            ('100%%%(a)s %%%%(escaped)s', {'a'}),
+            ('%s', set()),
+        ):
+            self.assertEqual(keys, formatters._get_message_keys(msg), msg)
+
+    def test_message_keys_cached(self):
+        msg = 'cached %(key)s'
+        formatters._get_message_keys(msg)
+        with mock.patch.object(formatters, '_MSG_KEY_REGEX') as regex:
+            self.assertEqual({'key'}, formatters._get_message_keys(msg))
+        regex.findall.assert_not_called()
+
+    def test_message_keys_not_string(self):
+        self.assertRaises(TypeError, formatters._get_message_keys, b'%(a)s')
+
+    def _error_record(self, exc_info, level=logging.ERROR):
+        return logging.LogRecord(
+            'test', level, 'test', 0, 'test message', {}, exc_info
+        )
+
+    def test_error_summary_computed_once_per_record(self):
+        try:
+            raise RuntimeError('boom\nremote traceback')
+        except RuntimeError:
+            record = self._error_record(None, logging.WARNING)
+            with mock.patch.object(
+                traceback,
+                'format_exception_only',
+                wraps=traceback.format_exception_only,
+            ) as format_exception_only:
+                for i in range(3):
+                    self.assertEqual(
+                        'RuntimeError: boom',
+                        formatters._get_error_summary(record),
+                    )
+            self.assertEqual(1, format_exception_only.call_count)
+        # the exception is no longer active, but the record is the same
+        self.assertEqual(
+            'RuntimeError: boom', formatters._get_error_summary(record)
+        )
+
+    def test_error_summary_cached_on_exception(self):
+        class RemoteError(RuntimeError):
+            pass
+
+        exc = RemoteError('boom\nremote traceback')
+        try:
+            raise exc
+        except RuntimeError:
+            exc_info = sys.exc_info()
+        summary = traceback.format_exception_only(*exc_info[:2])[0].rstrip()
+        with mock.patch.object(
+            traceback,
+            'format_exception_only',
+            wraps=traceback.format_exception_only,
+        ) as format_exception_only:
+            for i in range(2):
+                record = self._error_record(exc_info)
+                self.assertEqual(
+                    summary, formatters._get_error_summary(record)
+                )
+            # implicitly detected, only the first line is used
+            try:
+                raise exc
+            except RuntimeError:
+                record = self._error_record(None)
+                self.assertEqual(
+                    summary.split('\n')[0],
+                    formatters._get_error_summary(record),
+                )
+        self.assertEqual(1, format_exception_only.call_count)
+
 
 # Test for https://bugs.python.org/issue28603
 class FormatUnhashableExceptionTest(test_base.BaseTestCase):
@@ -119,3 +274,511 @@ class FormatUnhashableExceptionTest(test_base.BaseTestCase):
         )
         tb = formatter.format(record)
         self.assertTrue(tb)
+
+
+class TimestampCacheTest(test_base.BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = formatters._TimestampCache()
+        self.formatter = logging.Formatter()
+
+    def _set_tz(self, value):
+        orig = os.environ.get('TZ')
+
+        def restore():
+            if orig is None:
+                os.environ.pop('TZ', None)
+            else:
+                os.environ['TZ'] = orig
+            time.tzset()
+
+        self.addCleanup(restore)
+        os.environ['TZ'] = value
+        time.tzset()
+
+    def _record(self, created):
+        record = logging.LogRecord(
+            'test', logging.INFO, 'test', 0, 'test message', {}, None
+        )
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+        return record
+
+    def _isotime(self, created):
+        dt = datetime.datetime.fromtimestamp(created).replace(
+            tzinfo=tz.tzlocal()
+        )
+        return dt.isoformat(timespec='microseconds')
+
+    def test_asctime(self):
+        for datefmt in (None, '%Y-%m-%d %H:%M:%S', '%d/%b %H:%M'):
+            for created in (1450274066.0, 1450274066.5178, 1450274067.25):
+                record = self._record(created)
+                self.assertEqual(
+                    self.formatter.formatTime(record, datefmt),
+                    self.cache.asctime(self.formatter, record, datefmt),
+                )
+
+    def test_asctime_reused_within_second(self):
+        with mock.patch.object(
+            self.formatter, 'converter', wraps=time.localtime
+        ) as converter:
+            for created in (1450274066.1, 1450274066.2, 1450274066.9):
+                self.cache.asctime(self.formatter, self._record(created), None)
+            self.assertEqual(1, converter.call_count)
+            self.cache.asctime(
+                self.formatter, self._record(1450274067.0), None
+            )
+            self.assertEqual(2, converter.call_count)
+
+    def test_isotime(self):
+        for created in (1450274066.0, 1450274066.517893, 1450274066.000001):
+            self.assertEqual(
+                self._isotime(created), self.cache.isotime(created)
+            )
+
+    def test_isotime_rounding_carry(self):
+        # datetime rounds to the closest microsecond, which can carry
+        # over into the next second.
+        created = 1450274066.9999997
+        self.assertEqual(self._isotime(created), self.cache.isotime(created))
+        self.assertTrue(self.cache.isotime(created).startswith('2015'))
+        self.assertIn(':27.000000', self.cache.isotime(created))
+
+    def test_timezone_change(self):
+        self._set_tz('UTC0')
+        record = self._record(1450274066.5)
+        self.assertEqual(
+            '2015-12-16T13:54:26.500000+00:00',
+            self.cache.isotime(record.created),
+        )
+        self.assertEqual(
+            '2015-12-16 13:54:26,500',
+            self.cache.asctime(self.formatter, record, None),
+        )
+        self._set_tz('EST+5')
+        self.assertEqual(
+            '2015-12-16T08:54:26.500000-05:00',
+            self.cache.isotime(record.created),
+        )
+        self.assertEqual(
+            '2015-12-16 08:54:26,500',
+            self.cache.asctime(self.formatter, record, None),
+        )
+
+    def test_dst_transition(self):
+        self._set_tz('EST+5EDT,M3.2.0/2,M11.1.0/2')
+        # 2015-03-08 02:00 EST, when clocks moved forward to 03:00 EDT
+        transition = 1425798000
+        for created in range(transition - 2, transition + 2):
+            for fraction in (0.25, 0.75):
+                record = self._record(created + fraction)
+                self.assertEqual(
+                    self._isotime(record.created),
+                    self.cache.isotime(record.created),
+                )
+                self.assertEqual(
+                    self.formatter.formatTime(record),
+                    self.cache.asctime(self.formatter, record, None),
+                )
+
+
+def _raise(msg):
+    raise RuntimeError(msg)
+
+
+def _raise_chained(msg):
+    try:
+        _raise('cause')
+    except RuntimeError as e:
+        raise ValueError(msg) from e
+
+
+class TracebackCacheTest(test_base.BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = formatters._TracebackCache(2)
+
+    def _exc_info(self, func, msg='boom'):
+        try:
+            func(msg)
+        except Exception:
+            return sys.exc_info()
+
+    def test_format_exception(self):
+        for func in (_raise, _raise_chained):
+            ei = self._exc_info(func)
+            self.assertEqual(
+                tuple(traceback.format_exception(*ei)),
+                self.cache.format_exception(ei),
+            )
+
+    def test_repeated_exception(self):
+        for i in range(3):
+            ei = self._exc_info(_raise)
+            lines = self.cache.format_exception(ei)
+        self.assertEqual(tuple(traceback.format_exception(*ei)), lines)
+        self.assertEqual((2, 1, 2, 1), self.cache.info())
+
+    def test_message_is_part_of_key(self):
+        first = self.cache.format_exception(self._exc_info(_raise, 'one'))
+        second = self.cache.format_exception(self._exc_info(_raise, 'two'))
+        self.assertIn('RuntimeError: one\n', first)
+        self.assertIn('RuntimeError: two\n', second)
+        self.assertEqual((0, 2, 2, 2), self.cache.info())
+
+    def test_chain_is_part_of_key(self):
+        ei = self._exc_info(_raise_chained)
+        self.cache.format_exception(ei)
+        # Same frames for the outer exception, without the cause
+        ei[1].__cause__ = None
+        ei[1].__suppress_context__ = True
+        lines = self.cache.format_exception(ei)
+        self.assertEqual(tuple(traceback.format_exception(*ei)), lines)
+        self.assertEqual(0, self.cache.info().hits)
+
+    def test_notes_are_part_of_key(self):
+        ei = self._exc_info(_raise)
+        self.cache.format_exception(ei)
+        ei[1].add_note('a note')
+        lines = self.cache.format_exception(ei)
+        self.assertEqual('a note\n', lines[-1])
+        self.assertEqual(0, self.cache.info().hits)
+
+    def test_eviction(self):
+        for msg in ('one', 'two', 'three', 'one'):
+            self.cache.format_exception(self._exc_info(_raise, msg))
+        self.assertEqual((0, 4, 2, 2), self.cache.info())
+
+    def test_syntax_error_not_cached(self):
+        try:
+            compile('1 +', 'test', 'eval')
+        except SyntaxError:
+            ei = sys.exc_info()
+        for i in range(2):
+            self.assertEqual(
+                tuple(traceback.format_exception(*ei)),
+                self.cache.format_exception(ei),
+            )
+        self.assertEqual((0, 0, 2, 0), self.cache.info())
+
+    def test_unprintable_exception_not_cached(self):
+        class Unprintable(Exception):
+            def __str__(self):
+                raise TypeError('no')
+
+        try:
+            raise Unprintable()
+        except Unprintable:
+            ei = sys.exc_info()
+        lines = self.cache.format_exception(ei)
+        self.assertIn('<exception str() failed>', lines[-1])
+        self.assertEqual((0, 0, 2, 0), self.cache.info())
+
+    def test_formatters_share_cache(self):
+        formatters._TRACEBACK_CACHE.clear()
+        self.addCleanup(formatters._TRACEBACK_CACHE.clear)
+        ei = self._exc_info(_raise)
+        conf = cfg.ConfigOpts()
+        log.register_options(conf)
+        for formatter in (
+            formatters.ContextFormatter(config=conf),
+            formatters.JSONFormatter(),
+            formatters.FluentFormatter(),
+        ):
+            self.assertIn('RuntimeError: boom', formatter.formatException(ei))
+        info = formatters.get_traceback_cache_info()
+        self.assertEqual(2, info.hits)
+        self.assertEqual(1, info.misses)
+
+
+class PercentRendererTest(test_base.BaseTestCase):
+    FORMATS = (
+        '',
+        'no fields',
+        '100%% done',
+        '%(message)s',
+        '%(message)r %(message)a',
+        '%(levelname)-8s|%(levelname)8s|%(levelname).3s',
+        '%(process)d %(lineno)05d %(lineno)+d %(lineno) d %(lineno)x',
+        '%(created)f %(created).2f %(msecs)03d %(relativeCreated)e',
+        '%(lineno)#o %(lineno)#X %(lineno)c %(created)g %(created)G',
+        '%(lineno)ld %(message)s%(message)s%%(message)s',
+        '%(tuple)s %(tuple)r',
+        '%(asctime)s.%(msecs)03d %(process)d %(levelname)s %(name)s '
+        '[%(global_request_id)s %(request_id)s %(user_identity)s] '
+        '%(instance)s%(message)s',
+        '%(color)s%(levelname)s %(name)s [-] %(instance)s%(message)s',
+        '%(asctime)s %(funcName)s %(pathname)s:%(lineno)d',
+    )
+
+    def _record(self):
+        record = logging.LogRecord(
+            'test.name',
+            logging.WARNING,
+            '/path/to/test.py',
+            42,
+            'message with %s',
+            ('args',),
+            None,
+            func='func',
+        )
+        record.message = record.getMessage()
+        record.asctime = '2015-12-16 13:54:26'
+        record.tuple = (1, 2)
+        record.__dict__.update(
+            dict.fromkeys(
+                (
+                    'color',
+                    'global_request_id',
+                    'request_id',
+                    'user_identity',
+                    'instance',
+                ),
+                'value',
+            )
+        )
+        return record
+
+    def _compile(self, fmt):
+        renderer = formatters._compile_percent_format(fmt)
+        assert renderer is not None, fmt
+        return renderer
+
+    def test_same_output(self):
+        record = self._record()
+        for fmt in self.FORMATS:
+            renderer = self._compile(
+                fmt or logging.PercentStyle.default_format
+            )
+            self.assertEqual(
+                logging.PercentStyle(fmt).format(record),
+                renderer.render(record.__dict__),
+                fmt,
+            )
+
+    def test_fields(self):
+        renderer = self._compile(
+            '%(asctime)s %(lineno)d %(asctime)s %%(isotime)s'
+        )
+        self.assertEqual({'asctime', 'lineno'}, renderer.fields)
+
+    def test_missing_field(self):
+        record = self._record()
+        fmt = '%(message)s %(missing)s'
+        renderer = self._compile(fmt)
+        with self.assertRaises(ValueError) as expected:
+            logging.PercentStyle(fmt).format(record)
+        with self.assertRaises(ValueError) as actual:
+            renderer.render(record.__dict__)
+        self.assertEqual(str(expected.exception), str(actual.exception))
+
+    def test_bad_value(self):
+        record = self._record()
+        fmt = '%(message)d'
+        renderer = self._compile(fmt)
+        with self.assertRaises(TypeError) as expected:
+            logging.PercentStyle(fmt).format(record)
+        with self.assertRaises(TypeError) as actual:
+            renderer.render(record.__dict__)
+        self.assertEqual(str(expected.exception), str(actual.exception))
+
+    def test_not_compiled(self):
+        for fmt in (
+            '%s',
+            '%(message)s %s',
+            '100% done',
+            '%(lineno)*d',
+            '%(a(b))s',
+            '%(message)',
+            'trailing %',
+        ):
+            self.assertIsNone(formatters._compile_percent_format(fmt), fmt)
+
+
+class ContextFormatterRendererTest(test_base.BaseTestCase):
+    """Compare the output of the compiled and the standard format paths."""
+
+    def setUp(self):
+        super().setUp()
+        self.config_fixture = self.useFixture(
+            config_fixture.Config(cfg.ConfigOpts())
+        )
+        self.conf = self.config_fixture.conf
+        log.register_options(self.conf)
+        self.conf([])
+
+    def _format_both(self, record_factory):
+        compiled = formatters.ContextFormatter(config=self.conf)
+        standard = formatters.ContextFormatter(config=self.conf)
+        with mock.patch.object(
+            formatters, '_compile_percent_format', return_value=None
+        ):
+            expected = standard.format(record_factory())
+        actual = compiled.format(record_factory())
+        self.assertEqual(expected, actual)
+        return actual
+
+    def _record(self, level=logging.INFO, exc_info=None, **extra):
+        def factory():
+            record = logging.LogRecord(
+                'test', level, __file__, 10, 'msg %s', ('arg',), exc_info
+            )
+            record.created = 1450274066.517893
+            record.msecs = 517.893
+            record.__dict__.update(extra)
+            return record
+
+        return factory
+
+    def test_default_formats(self):
+        ctxt = _fake_context()
+        self._format_both(self._record())
+        self._format_both(self._record(logging.DEBUG))
+        self._format_both(self._record(context=ctxt))
+        self._format_both(self._record(logging.DEBUG, context=ctxt))
+        self._format_both(self._record(instance={'uuid': 'fake-uuid'}))
+
+    def test_custom_formats(self):
+        ctxt = _fake_context()
+        for fmt in (
+            '%(isotime)s %(user_identity)s %(message)s',
+            '%(asctime)s %(levelname)-8s %(error_summary)s %(message)s',
+            '%(project)s %(version)s %(message)r',
+            '100%% %(message)s',
+        ):
+            self.config_fixture.config(
+                logging_context_format_string=fmt,
+                logging_default_format_string=fmt,
+            )
+            self._format_both(self._record())
+            self._format_both(self._record(logging.WARNING, context=ctxt))
+
+    def test_exception(self):
+        try:
+            raise RuntimeError('boom')
+        except RuntimeError:
+            exc_info = sys.exc_info()
+        ctxt = _fake_context()
+        self.config_fixture.config(
+            logging_exception_prefix='%(isotime)s %(user_identity)s TRACE '
+        )
+        text = self._format_both(
+            self._record(logging.ERROR, exc_info, context=ctxt)
+        )
+        self.assertIn('RuntimeError: boom', text)
+
+    def test_unreferenced_fields_not_computed(self):
+        self.config_fixture.config(logging_context_format_string='%(message)s')
+        formatter = formatters.ContextFormatter(config=self.conf)
+        record = self._record(context=_fake_context())()
+        with mock.patch.object(
+            formatters, '_get_user_identity'
+        ) as user_identity:
+            self.assertEqual('msg arg', formatter.format(record))
+        user_identity.assert_not_called()
+        self.assertNotIn('isotime', record.__dict__)
+
+
+@dataclasses.dataclass
+class _Point:
+    x: int
+    y: int
+
+
+class _Opaque:
+    def __repr__(self):
+        return '<opaque>'
+
+
+class JSONEncoderTest(test_base.BaseTestCase):
+    """Compare the encoders with what JSONFormatter used to produce."""
+
+    VALUES = (
+        None,
+        True,
+        0,
+        -1.5,
+        float('inf'),
+        2**70,
+        'ascii',
+        'non-ascii \u00e9\u4e2d\U0001f600 / "quoted" \\ \n',
+        b'bytes',
+        [1, 'two', None],
+        (1, 2),
+        {'set'},
+        {1: 'int key', 'nested': {'list': [{'a': 1}]}},
+        datetime.datetime(2015, 12, 16, 13, 54, 26, 517893),
+        uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        _Point(1, 2),
+        _Opaque(),
+        [_Opaque(), {'obj': _Opaque()}],
+    )
+
+    def _legacy_dumps(self, obj):
+        convert = functools.partial(jsonutils.to_primitive, fallback=repr)
+        return jsonutils.dumps(obj, default=convert)
+
+    def _check(self, name, skip=()):
+        dumps = formatters._get_json_encoder(name)
+        for value in self.VALUES:
+            if value in skip:
+                continue
+            obj = {'value': value}
+            expected = self._legacy_dumps(obj)
+            actual = dumps(obj)
+            self.assertIsInstance(actual, str)
+            if name == 'stdlib':
+                self.assertEqual(expected, actual)
+            else:
+                self.assertEqual(json.loads(expected), json.loads(actual))
+
+    def test_stdlib(self):
+        self._check('stdlib')
+
+    def test_orjson(self):
+        if not formatters.orjson:
+            self.skipTest('orjson is not installed')
+        # orjson does not write the non-standard NaN and Infinity values
+        inf = float('inf')
+        self._check('orjson', skip=(inf,))
+        dumps = formatters._get_json_encoder('orjson')
+        self.assertEqual('{"value":null}', dumps({'value': inf}))
+
+    def test_ujson(self):
+        if not formatters.ujson:
+            self.skipTest('ujson is not installed')
+        self._check('ujson')
+
+    def test_unavailable(self):
+        with mock.patch.object(formatters, 'orjson', None):
+            self.assertRaises(
+                RuntimeError, formatters.JSONFormatter, encoder='orjson'
+            )
+
+    def test_unknown(self):
+        self.assertRaises(
+            ValueError, formatters.JSONFormatter, encoder='pickle'
+        )
+
+    def test_formatter(self):
+        try:
+            raise RuntimeError('boom \u00e9')
+        except RuntimeError:
+            exc_info = sys.exc_info()
+        record = logging.LogRecord(
+            'test',
+            logging.ERROR,
+            __file__,
+            1,
+            'message %(a)s %(b)s',
+            ({'a': _Opaque(), 'b': datetime.date(2015, 12, 16)},),
+            exc_info,
+        )
+        record.extra = {'obj': _Opaque(), 'id': uuid.uuid4()}
+        expected = formatters.JSONFormatter().format(record)
+        for name in ('orjson', 'ujson'):
+            if getattr(formatters, name) is None:
+                continue
+            actual = formatters.JSONFormatter(encoder=name).format(record)
+            self.assertEqual(json.loads(expected), json.loads(actual))
@@ -17,10 +17,14 @@
 from contextlib import contextmanager
 import copy
 import datetime
+import gzip
+import http.server
 import io
 import logging
 import os
 import shutil
+import socket
+import struct
 import sys
 
 try:
@@ -32,10 +36,13 @@ try:
 except ImportError:
     journal = None
 import tempfile
+import threading
 import time
+import traceback
 from unittest import mock
 
 from dateutil import tz
+import msgpack
 from oslo_config import cfg
 from oslo_config import fixture as fixture_config
 from oslo_context import context
@@ -47,6 +54,7 @@ from oslotest import base as test_base
 import testtools
 
 from oslo_log import _options
+from oslo_log.cmds import convert_json
 from oslo_log import formatters
 from oslo_log import handlers
 from oslo_log import log
@@ -143,7 +151,7 @@ class LoggerTestCase(test_base.BaseTestCase):
         ):
             self.assertRaises(AttributeError, getattr, log, func)
 
-    @mock.patch('logging.handlers.TimedRotatingFileHandler')
+    @mock.patch('oslo_log.handlers.TimedRotatingFileHandler')
     @mock.patch('oslo_log.log._get_log_file_path', return_value='test.conf')
     def test_timed_rotate_log(self, path_mock, handler_mock):
         rotation_type = 'interval'
@@ -165,7 +173,7 @@ class LoggerTestCase(test_base.BaseTestCase):
         )
         self.assertEqual(self.log_handlers[0], handler_mock.return_value)
 
-    @mock.patch('logging.handlers.RotatingFileHandler')
+    @mock.patch('oslo_log.handlers.RotatingFileHandler')
     @mock.patch('oslo_log.log._get_log_file_path', return_value='test.conf')
     def test_rotate_log(self, path_mock, handler_mock):
         rotation_type = 'size'
@@ -183,6 +191,76 @@ class LoggerTestCase(test_base.BaseTestCase):
         )
         self.assertEqual(self.log_handlers[0], handler_mock.return_value)
 
+    @mock.patch('oslo_log.handlers.BufferedRotatingFileHandler')
+    @mock.patch('oslo_log.log._get_log_file_path', return_value='test.conf')
+    def test_buffered_rotate_log(self, path_mock, handler_mock):
+        self.config(
+            log_rotation_type='size',
+            max_logfile_size_mb=100,
+            max_logfile_count=2,
+            log_file_buffer_size=4096,
+            log_file_flush_interval=20,
+        )
+        log._setup_logging_from_conf(self.CONF, 'test', 'test')
+        handler_mock.assert_called_once_with(
+            path_mock.return_value,
+            maxBytes=100 * units.Mi,
+            backupCount=2,
+            buffer_size=4096,
+            flush_interval=0.02,
+        )
+        self.assertEqual(self.log_handlers[0], handler_mock.return_value)
+
+    @mock.patch('oslo_log.handlers.RotatingFileHandler')
+    @mock.patch('oslo_log.log._get_log_file_path', return_value='test.conf')
+    def test_compressed_rotate_log(self, path_mock, handler_mock):
+        self.config(
+            log_rotation_type='size',
+            max_logfile_size_mb=100,
+            max_logfile_count=2,
+            log_rotation_compression='gzip',
+        )
+        log._setup_logging_from_conf(self.CONF, 'test', 'test')
+        handler_mock.assert_called_once_with(
+            path_mock.return_value,
+            maxBytes=100 * units.Mi,
+            backupCount=2,
+            compression='gzip',
+        )
+        self.assertEqual(self.log_handlers[0], handler_mock.return_value)
+
+    @testtools.skipIf(syslog is None, "syslog is not available")
+    @mock.patch('oslo_log.handlers.SysLogSocketHandler')
+    def test_syslog_address(self, handler_mock):
+        self.config(
+            use_syslog=True, syslog_address='/dev/log', syslog_batch=True
+        )
+        log._setup_logging_from_conf(self.CONF, 'test', 'test')
+        handler_mock.assert_called_once_with(
+            '/dev/log', facility=syslog.LOG_USER, batch=True
+        )
+        self.assertEqual(self.log_handlers[-1], handler_mock.return_value)
+
+    @mock.patch('oslo_log.handlers.WatchedFileHandler')
+    @mock.patch('oslo_log.log._get_log_file_path', return_value='test.conf')
+    def test_watched_log(self, path_mock, handler_mock):
+        self.config(log_file_watch_interval=200, log_file_inotify=True)
+        log._setup_logging_from_conf(self.CONF, 'test', 'test')
+        handler_mock.assert_called_once_with(
+            path_mock.return_value, check_interval=0.2, inotify=True
+        )
+        self.assertEqual(self.log_handlers[0], handler_mock.return_value)
+
+    @mock.patch('oslo_log.handlers.BufferedWatchedFileHandler')
+    @mock.patch('oslo_log.log._get_log_file_path', return_value='test.conf')
+    def test_buffered_log(self, path_mock, handler_mock):
+        self.config(log_file_buffer_size=4096)
+        log._setup_logging_from_conf(self.CONF, 'test', 'test')
+        handler_mock.assert_called_once_with(
+            path_mock.return_value, buffer_size=4096, flush_interval=0.05
+        )
+        self.assertEqual(self.log_handlers[0], handler_mock.return_value)
+
 
 class BaseTestCase(test_base.BaseTestCase):
     def setUp(self):
@@ -348,6 +426,131 @@ class OSSysLogHandlerTestCase(BaseTestCase):
         syslog.syslog.assert_called_once_with(syslog.LOG_INFO, msg_unicode)
 
 
+@testtools.skipIf(syslog is None, "syslog is not available")
+class SysLogSocketHandlerTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        sock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, sock_dir)
+        self.path = os.path.join(sock_dir, 'log')
+
+    def _listen(self, socktype=socket.SOCK_DGRAM):
+        server = socket.socket(socket.AF_UNIX, socktype)
+        server.bind(self.path)
+        server.settimeout(5)
+        self.addCleanup(server.close)
+        if socktype == socket.SOCK_STREAM:
+            server.listen()
+        return server
+
+    def _handler(self, **kwargs):
+        handler = handlers.SysLogSocketHandler(self.path, **kwargs)
+        self.addCleanup(handler.close)
+        return handler
+
+    def _log(self, handler, msg, level=logging.INFO, context=None):
+        record = logging.LogRecord('test', level, 'path', 1, msg, None, None)
+        if context is not None:
+            record.context = context
+        handler.handle(record)
+        return record
+
+    def _header(self, record, priority):
+        seconds = int(record.created)
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+        microseconds = int((record.created - seconds) * 1e6)
+        app_name = handlers._get_binary_name().replace(' ', '_')
+        return (
+            f'<{priority}>1 {timestamp}.{microseconds:06d}Z '
+            f'{socket.gethostname()} {app_name} {os.getpid()} - '
+        ).encode()
+
+    def test_datagram(self):
+        server = self._listen()
+        handler = self._handler()
+        ctx = context.RequestContext(request_id='req-1', project_id='p1')
+        record = self._log(handler, 'message é', context=ctx)
+        self.assertEqual(
+            self._header(record, syslog.LOG_USER | syslog.LOG_INFO)
+            + b'[openstack@32473 request_id="req-1" project_id="p1"] '
+            + b'\xef\xbb\xbfmessage \xc3\xa9',
+            server.recv(65536),
+        )
+        self.assertEqual(socket.SOCK_DGRAM, handler.socktype)
+
+    def test_structured_data(self):
+        server = self._listen()
+        handler = self._handler(facility=syslog.LOG_LOCAL0)
+        record = self._log(handler, 'no context', logging.ERROR)
+        self.assertEqual(
+            self._header(record, syslog.LOG_LOCAL0 | syslog.LOG_ERR)
+            + b'- \xef\xbb\xbfno context',
+            server.recv(65536),
+        )
+        ctx = context.RequestContext(request_id='a"b]c\\d')
+        self._log(handler, 'escaped', context=ctx)
+        self.assertIn(
+            b' [openstack@32473 request_id="a\\"b\\]c\\\\d"] ',
+            server.recv(65536),
+        )
+
+    def test_datagram_too_long(self):
+        server = self._listen()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        handler = self._handler()
+        record = self._log(handler, 'é' * (1 << 19))
+        data = server.recv(1 << 20)
+        header = self._header(record, syslog.LOG_USER | syslog.LOG_INFO)
+        self.assertTrue(data.startswith(header))
+        self.assertTrue(data.endswith('é'.encode() + b'... (truncated)'))
+        self.assertLess(len(data), 1 << 20)
+        self.assertEqual(0, handler.dropped)
+
+    def test_stream(self):
+        server = self._listen(socket.SOCK_STREAM)
+        handler = self._handler()
+        self._log(handler, 'one')
+        self._log(handler, 'two\nlines')
+        self.assertEqual(socket.SOCK_STREAM, handler.socktype)
+        conn, _ = server.accept()
+        conn.settimeout(5)
+        data = b''
+        while data.count(b'\xef\xbb\xbf') < 2 or not data.endswith(b'lines'):
+            data += conn.recv(65536)
+        conn.close()
+        messages = []
+        while data:
+            length, data = data.split(b' ', 1)
+            messages.append(data[: int(length)])
+            data = data[int(length) :]
+        self.assertEqual(2, len(messages))
+        self.assertTrue(messages[0].endswith(b'\xef\xbb\xbfone'))
+        self.assertTrue(messages[1].endswith(b'\xef\xbb\xbftwo\nlines'))
+
+    def test_batch(self):
+        server = self._listen()
+        handler = self._handler(batch=True, flush_interval=60)
+        for msg in ('one', 'two', 'three'):
+            self._log(handler, msg)
+        handler.flush()
+        messages = [server.recv(65536) for _ in range(3)]
+        self.assertEqual(
+            [b'one', b'two', b'three'],
+            [message.split(b'\xef\xbb\xbf')[1] for message in messages],
+        )
+
+    def test_reconnect(self):
+        server = self._listen()
+        handler = self._handler()
+        self._log(handler, 'one')
+        server.close()
+        os.unlink(self.path)
+        # the syslog daemon was restarted
+        server = self._listen()
+        self._log(handler, 'two')
+        self.assertTrue(server.recv(65536).endswith(b'two'))
+
+
 class OSJournalHandlerTestCase(BaseTestCase):
     """Test systemd journal logging.
 
@@ -455,6 +658,842 @@ class OSJournalHandlerTestCase(BaseTestCase):
             self.assertIsInstance(arg, (bytes, str))
 
 
+class _FluentListener:
+    """A stand-in fluentd collecting the messages sent to a unix socket."""
+
+    def __init__(self, path):
+        self.messages = []
+        self.received = threading.Condition()
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            unpacker = msgpack.Unpacker(raw=False)
+            with conn:
+                while data := conn.recv(65536):
+                    unpacker.feed(data)
+                    with self.received:
+                        self.messages.extend(unpacker)
+                        self.received.notify_all()
+
+    def wait(self, count):
+        with self.received:
+            self.received.wait_for(lambda: len(self.messages) >= count, 5)
+        return self.messages
+
+    def close(self):
+        self.server.close()
+
+
+class FluentHandlerTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        sock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, sock_dir)
+        self.path = os.path.join(sock_dir, 'fluent.sock')
+
+    def _listen(self):
+        listener = _FluentListener(self.path)
+        self.addCleanup(listener.close)
+        return listener
+
+    def _handler(self, **kwargs):
+        handler = handlers.FluentHandler('oslo.test', self.path, **kwargs)
+        self.addCleanup(handler.close)
+        return handler
+
+    def _record(self, msg):
+        return logging.LogRecord(
+            'name', logging.INFO, 'path', 123, msg, None, None
+        )
+
+    def _entries(self, message):
+        tag, entries, option = message
+        self.assertEqual('oslo.test', tag)
+        entries = list(msgpack.Unpacker(io.BytesIO(entries), raw=False))
+        self.assertEqual({'size': len(entries)}, option)
+        return entries
+
+    def test_packed_forward(self):
+        listener = self._listen()
+        handler = self._handler()
+        record = self._record('hello')
+        handler.handle(record)
+        handler.handle(self._record('world'))
+        handler.flush()
+
+        messages = listener.wait(1)
+        self.assertEqual(1, len(messages))
+        entries = self._entries(messages[0])
+        self.assertEqual(
+            ['hello', 'world'], [entry[1]['message'] for entry in entries]
+        )
+        event_time = entries[0][0]
+        self.assertEqual(0, event_time.code)
+        seconds, nanoseconds = struct.unpack('>II', event_time.data)
+        self.assertAlmostEqual(
+            record.created, seconds + nanoseconds / 1e9, places=6
+        )
+        self.assertEqual('INFO', entries[0][1]['level'])
+
+    def test_string_formatter(self):
+        listener = self._listen()
+        handler = self._handler()
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        handler.handle(self._record('hello'))
+        handler.flush()
+
+        entries = self._entries(listener.wait(1)[0])
+        self.assertEqual({'message': 'INFO hello'}, entries[0][1])
+
+    def test_batch_size(self):
+        listener = self._listen()
+        handler = self._handler(max_batch_bytes=1)
+        for i in range(3):
+            handler.handle(self._record(f'message {i}'))
+        handler.flush()
+
+        messages = listener.wait(3)
+        self.assertEqual(
+            [['message 0'], ['message 1'], ['message 2']],
+            [
+                [entry[1]['message'] for entry in self._entries(message)]
+                for message in messages
+            ],
+        )
+
+    def test_flush_interval(self):
+        listener = self._listen()
+        handler = self._handler(flush_interval=0.01)
+        handler.handle(self._record('hello'))
+
+        messages = listener.wait(1)
+        self.assertEqual(1, len(messages))
+
+    def test_reconnect(self):
+        handler = self._handler(retry_interval=0.01)
+        handler.handle(self._record('hello'))
+        # the listener is started while the handler retries
+        time.sleep(0.05)
+        listener = self._listen()
+        handler.flush()
+
+        entries = self._entries(listener.wait(1)[0])
+        self.assertEqual('hello', entries[0][1]['message'])
+        self.assertEqual(0, handler.dropped)
+
+    def test_queue_full(self):
+        handler = self._handler(queue_size=1, max_batch_bytes=1, timeout=1)
+        writing = threading.Event()
+        release = threading.Event()
+
+        def write_batch(batch):
+            writing.set()
+            release.wait(5)
+            raise OSError('fluentd is down')
+
+        handler._write_batch = write_batch
+        handler.handle(self._record('message 0'))
+        # the sender holds the first record, the queue has room for one more
+        self.assertTrue(writing.wait(5))
+        handler.handle(self._record('message 1'))
+        handler.handle(self._record('message 2'))
+        self.assertEqual(1, handler.dropped)
+
+        release.set()
+        handler.close()
+        self.assertEqual(3, handler.dropped)
+        handler.handle(self._record('closed'))
+        self.assertEqual(3, handler.dropped)
+
+
+class _OTLPServer(http.server.HTTPServer):
+    """A stand-in collector answering with the given statuses."""
+
+    def __init__(self, *statuses):
+        super().__init__(('127.0.0.1', 0), _OTLPRequestHandler)
+        self.requests = []
+        self.statuses = list(statuses)
+
+
+class _OTLPRequestHandler(http.server.BaseHTTPRequestHandler):
+    server: _OTLPServer
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, dict(self.headers), body))
+        self.send_response(self.server.statuses.pop(0))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OTLPHandlerTestCase(BaseTestCase):
+    def _record(self, msg):
+        return logging.LogRecord(
+            'test.otlp', logging.INFO, 'path', 123, msg, None, None
+        )
+
+    def _server(self, *statuses):
+        server = _OTLPServer(*statuses)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def _handler(self, endpoint, **kwargs):
+        handler = handlers.OTLPHandler(endpoint, **kwargs)
+        self.addCleanup(handler.close)
+        return handler
+
+    def _messages(self, body):
+        data = jsonutils.loads(body)
+        self.assertEqual(1, len(data['resourceLogs']))
+        return [
+            log_record['body']['stringValue']
+            for scope_logs in data['resourceLogs'][0]['scopeLogs']
+            for log_record in scope_logs['logRecords']
+        ]
+
+    def test_file(self):
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        path = os.path.join(log_dir, 'otlp.json')
+        handler = self._handler(path)
+        handler.handle(self._record('hello'))
+        handler.handle(self._record('world'))
+        handler.flush()
+        handler.handle(self._record('again'))
+        handler.close()
+
+        with open(path, 'rb') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(
+            [['hello', 'world'], ['again']],
+            [self._messages(line) for line in lines],
+        )
+
+    def test_http(self):
+        server = self._server(200)
+        handler = self._handler(
+            f'http://127.0.0.1:{server.server_port}',
+            headers={'Authorization': 'secret'},
+        )
+        handler.handle(self._record('hello'))
+        handler.handle(self._record('world'))
+        handler.flush()
+
+        self.assertEqual(1, len(server.requests))
+        path, headers, body = server.requests[0]
+        self.assertEqual('/v1/logs', path)
+        self.assertEqual('application/json', headers['Content-Type'])
+        self.assertEqual('secret', headers['Authorization'])
+        self.assertEqual(['hello', 'world'], self._messages(body))
+
+    def test_http_retry(self):
+        server = self._server(503, 200)
+        handler = self._handler(
+            f'http://127.0.0.1:{server.server_port}/custom',
+            retry_interval=0.01,
+        )
+        handler.handle(self._record('hello'))
+        handler.flush()
+
+        self.assertEqual(2, len(server.requests))
+        self.assertEqual('/custom', server.requests[1][0])
+        self.assertEqual(server.requests[0][2], server.requests[1][2])
+        self.assertEqual(0, handler.dropped)
+
+    def test_http_rejected(self):
+        server = self._server(400)
+        handler = self._handler(f'http://127.0.0.1:{server.server_port}')
+        handler.handle(self._record('hello'))
+        handler.flush()
+
+        self.assertEqual(1, len(server.requests))
+        self.assertEqual(1, handler.dropped)
+
+    def test_formatter_required(self):
+        handler = self._handler('/nonexistent')
+        handler.setFormatter(logging.Formatter())
+        with mock.patch.object(handler, 'handleError') as handle_error:
+            handler.handle(self._record('hello'))
+        handle_error.assert_called_once()
+
+
+class _RecordingHandler(logging.Handler):
+    """A handler keeping the records, optionally waiting for an event."""
+
+    def __init__(self, gate=None):
+        super().__init__()
+        self.records = []
+        self.threads = []
+        self.started = threading.Event()
+        self.gate = gate
+
+    def emit(self, record):
+        self.started.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.records.append(record)
+        self.threads.append(threading.current_thread())
+
+
+class AsyncHandlerTestCase(BaseTestCase):
+    def _handler(self, *targets, **kwargs):
+        handler = handlers.AsyncHandler(targets, **kwargs)
+        self.addCleanup(handler.close)
+        return handler
+
+    def _record(self, msg, level=logging.INFO):
+        return logging.LogRecord('test', level, 'path', 1, msg, None, None)
+
+    def _messages(self, target):
+        return [record.getMessage() for record in target.records]
+
+    def test_writer_thread(self):
+        target = _RecordingHandler()
+        debug_target = _RecordingHandler()
+        target.setLevel(logging.INFO)
+        handler = self._handler(target, debug_target)
+        handler.handle(self._record('debug', logging.DEBUG))
+        handler.handle(self._record('info'))
+        handler.flush()
+
+        self.assertEqual(['info'], self._messages(target))
+        self.assertEqual(['debug', 'info'], self._messages(debug_target))
+        self.assertNotIn(threading.current_thread(), debug_target.threads)
+
+    def test_target_handler_logs(self):
+        logger = logging.getLogger('test.async')
+        logger.propagate = False
+        self.addCleanup(setattr, logger, 'propagate', True)
+        target = _RecordingHandler()
+        handler = self._handler(target, queue_size=1)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        class _WarningHandler(logging.Handler):
+            def emit(self, record):
+                if record.levelno < logging.WARNING:
+                    logger.warning('handled %s', record.msg)
+
+        def produce():
+            for i in range(20):
+                logger.info('record %d', i)
+
+        handler.handlers.append(_WarningHandler())
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        # the writer thread must not wait for the lock of the handler
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        handler.flush()
+        self.assertIn('record 19', self._messages(target))
+
+    def test_arguments_rendered(self):
+        target = _RecordingHandler()
+        handler = self._handler(target)
+        args = ['before']
+        record = logging.LogRecord(
+            'test', logging.INFO, 'path', 1, '%s', (args,), None
+        )
+        handler.handle(record)
+        args[0] = 'after'
+        handler.flush()
+        self.assertEqual(["['before']"], self._messages(target))
+
+    def test_record_unchanged(self):
+        logger = logging.getLogger('test.async')
+        logger.propagate = False
+        self.addCleanup(setattr, logger, 'propagate', True)
+        sync_target = _RecordingHandler()
+        for handler in (self._handler(_RecordingHandler()), sync_target):
+            logger.addHandler(handler)
+            self.addCleanup(logger.removeHandler, handler)
+        logger.info('record %d', 1)
+
+        record = sync_target.records[0]
+        self.assertEqual('record %d', record.msg)
+        self.assertEqual((1,), record.args)
+
+    def test_calling_thread_state(self):
+        target = _RecordingHandler()
+        handler = self._handler(target)
+        ctxt = _fake_context()
+        try:
+            raise RuntimeError('boom')
+        except RuntimeError:
+            handler.handle(self._record('failed', logging.ERROR))
+        handler.flush()
+
+        record = target.records[0]
+        self.assertEqual(ctxt.request_id, record.request_id)
+        self.assertEqual(
+            'RuntimeError: boom', formatters._get_error_summary(record)
+        )
+
+    def _fill(self, overflow):
+        release = threading.Event()
+        target = _RecordingHandler(gate=release)
+        handler = self._handler(target, queue_size=1, overflow=overflow)
+        handler.handle(self._record('taken'))
+        # the writer thread waits in the target
+        self.assertTrue(target.started.wait(5))
+        handler.handle(self._record('queued', logging.DEBUG))
+        return handler, target, release
+
+    def test_drop_newest(self):
+        handler, target, release = self._fill('drop-newest')
+        handler.handle(self._record('dropped', logging.WARNING))
+        handler.handle(self._record('dropped'))
+        self.assertEqual({'WARNING': 1, 'INFO': 1}, handler.dropped)
+        release.set()
+        handler.flush()
+
+        self.assertEqual(
+            [
+                'taken',
+                'Dropped 2 log records because the logging queue was full',
+                'queued',
+            ],
+            self._messages(target),
+        )
+
+    def test_drop_debug(self):
+        handler, target, release = self._fill('drop-debug')
+        handler.handle(self._record('dropped', logging.DEBUG))
+        self.assertEqual({'DEBUG': 1}, handler.dropped)
+        # the queued DEBUG record makes room for the others
+        handler.handle(self._record('replaced'))
+        self.assertEqual({'DEBUG': 2}, handler.dropped)
+        # which wait for room once no DEBUG record is queued
+        threading.Timer(0.05, release.set).start()
+        handler.handle(self._record('waited'))
+        handler.flush()
+
+        self.assertEqual(
+            [
+                'taken',
+                'Dropped 2 log records because the logging queue was full',
+                'replaced',
+                'waited',
+            ],
+            self._messages(target),
+        )
+        self.assertEqual({'DEBUG': 2}, handler.dropped)
+
+    def test_close(self):
+        target = _RecordingHandler()
+        handler = handlers.AsyncHandler([target])
+        for i in range(100):
+            handler.handle(self._record(f'message {i}'))
+        handler.close()
+
+        self.assertEqual(100, len(target.records))
+
+    def test_unknown_overflow(self):
+        self.assertRaises(
+            ValueError, handlers.AsyncHandler, [], overflow='nope'
+        )
+
+
+class _FileHandlerTestCase(BaseTestCase):
+    """Base class of the tests of the handlers writing to a log file."""
+
+    handler_class: type[logging.FileHandler] = handlers.WatchedFileHandler
+    handler_kwargs: dict[str, object] = {}
+
+    def setUp(self):
+        super().setUp()
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir)
+        self.path = os.path.join(self.log_dir, 'test.log')
+
+    def _handler(self, handler_class=None, **kwargs):
+        handler_class = handler_class or self.handler_class
+        handler = handler_class(self.path, **{**self.handler_kwargs, **kwargs})
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.addCleanup(handler.close)
+        return handler
+
+    def _record(self, msg, level=logging.INFO):
+        return logging.LogRecord('test', level, 'path', 1, msg, None, None)
+
+    def _log(self, handler, msg, level=logging.INFO):
+        handler.handle(self._record(msg, level))
+
+    def _read(self, path=None):
+        with open(path or self.path) as f:
+            return f.read()
+
+
+class BufferedFileHandlerTestCase(_FileHandlerTestCase):
+    handler_class = handlers.BufferedWatchedFileHandler
+    handler_kwargs = {'flush_interval': 60}
+
+    def test_buffered(self):
+        handler = self._handler()
+        handler.handle(self._record('one'))
+        handler.handle(self._record('two'))
+        self.assertEqual('', self._read())
+
+        with mock.patch('os.writev', wraps=os.writev) as writev:
+            handler.handle(self._record('error', logging.ERROR))
+        writev.assert_called_once()
+        self.assertEqual('one\ntwo\nerror\n', self._read())
+
+    def test_moved_file(self):
+        handler = self._handler()
+        handler.setFormatter(formatters.JSONFormatter(context_delta=True))
+        ctxt = _fake_context()
+        handler.handle(self._record('one'))
+        handler.handle(self._record('two'))
+        os.rename(self.path, self.path + '.1')
+        handler.handle(self._record('three', logging.ERROR))
+
+        moved = self._read(self.path + '.1').splitlines()
+        self.assertEqual(
+            ['one', 'two'],
+            [jsonutils.loads(line)['message'] for line in moved],
+        )
+        # the contexts of the moved file are not referred to
+        data = jsonutils.loads(self._read())
+        self.assertEqual('three', data['message'])
+        self.assertEqual(ctxt.request_id, data['context']['request_id'])
+
+    def test_buffer_size(self):
+        handler = self._handler(buffer_size=8)
+        handler.handle(self._record('one'))
+        self.assertEqual('', self._read())
+        handler.handle(self._record('two'))
+        self.assertEqual('one\ntwo\n', self._read())
+
+    def test_flush_interval(self):
+        handler = self._handler(flush_interval=0.01)
+        handler.handle(self._record('one'))
+        for i in range(500):
+            if self._read():
+                break
+            time.sleep(0.01)
+        self.assertEqual('one\n', self._read())
+
+    def test_flush_and_close(self):
+        handler = self._handler()
+        handler.handle(self._record('one'))
+        handler.flush()
+        self.assertEqual('one\n', self._read())
+        handler.handle(self._record('two'))
+        handler.close()
+        self.assertEqual('one\ntwo\n', self._read())
+
+    def test_write_all(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+        chunks = [b'abc', b'de', b'f']
+        # a partial write of the first two chunks
+        with mock.patch('os.writev', side_effect=[4, 2]) as writev:
+            with mock.patch('os.write', wraps=os.write) as write:
+                handlers._write_all(write_fd, chunks)
+        self.assertEqual(
+            [
+                mock.call(write_fd, [b'abc', b'de', b'f']),
+                mock.call(write_fd, [b'e', b'f']),
+            ],
+            writev.call_args_list,
+        )
+        write.assert_not_called()
+
+    def test_rotating(self):
+        handler = self._handler(
+            handlers.BufferedRotatingFileHandler, maxBytes=10, backupCount=1
+        )
+        for msg in ('one', 'two', 'three'):
+            handler.handle(self._record(msg))
+        handler.flush()
+        # the pending records count toward the size of the file
+        self.assertEqual('one\ntwo\n', self._read(self.path + '.1'))
+        self.assertEqual('three\n', self._read())
+
+    @testtools.skipUnless(hasattr(os, 'fork'), 'fork is not available')
+    def test_fork(self):
+        handler = self._handler()
+        handler.handle(self._record('parent'))
+        pid = os.fork()
+        if pid == 0:
+            try:
+                handler.handle(self._record('child'))
+                handler.flush()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        handler.flush()
+        # the child does not write the records its parent buffered
+        self.assertEqual(['child', 'parent'], sorted(self._read().split()))
+
+    def test_timed_rotating(self):
+        handler = self._handler(
+            handlers.BufferedTimedRotatingFileHandler, when='S', backupCount=1
+        )
+        handler.handle(self._record('one'))
+        handler.rolloverAt = 0
+        handler.handle(self._record('two'))
+        handler.flush()
+        backups = [
+            name
+            for name in os.listdir(os.path.dirname(self.path))
+            if name != 'test.log'
+        ]
+        self.assertEqual(1, len(backups))
+        self.assertEqual(
+            'one\n',
+            self._read(os.path.join(os.path.dirname(self.path), backups[0])),
+        )
+        self.assertEqual('two\n', self._read())
+
+
+class WatchedFileHandlerTestCase(_FileHandlerTestCase):
+    def test_check_every_record(self):
+        handler = self._handler()
+        with mock.patch('os.stat', wraps=os.stat) as stat:
+            self._log(handler, 'one')
+            self._log(handler, 'two')
+        self.assertEqual(2, stat.call_count)
+
+    def test_check_interval(self):
+        handler = self._handler(check_interval=60)
+        with mock.patch('os.stat', wraps=os.stat) as stat:
+            self._log(handler, 'one')
+            self._log(handler, 'two')
+        self.assertEqual(1, stat.call_count)
+
+        os.rename(self.path, self.path + '.1')
+        # the file is only checked again after the interval
+        self._log(handler, 'three')
+        handler.reopen()
+        self._log(handler, 'four')
+        self.assertEqual('one\ntwo\nthree\n', self._read(self.path + '.1'))
+        self.assertEqual('four\n', self._read(self.path))
+
+    def test_inotify(self):
+        if handlers._load_inotify() is None:
+            self.skipTest('inotify is not available')
+        handler = self._handler(inotify=True)
+        with mock.patch('os.stat', wraps=os.stat) as stat:
+            self._log(handler, 'one')
+            self._log(handler, 'two')
+        stat.assert_not_called()
+
+        os.rename(self.path, self.path + '.1')
+        for _ in range(500):
+            if handler._changed:
+                break
+            time.sleep(0.01)
+        self._log(handler, 'three')
+        self.assertEqual('one\ntwo\n', self._read(self.path + '.1'))
+        self.assertEqual('three\n', self._read(self.path))
+
+    def test_inotify_thread_failure(self):
+        if handlers._load_inotify() is None:
+            self.skipTest('inotify is not available')
+        with mock.patch.object(
+            handlers._InotifyWatch,
+            '_read_events',
+            side_effect=OSError('broken'),
+        ):
+            handler = self._handler(inotify=True)
+            watch = handler._watch
+            if watch is not None:
+                watch._thread.join()
+                self.assertTrue(handler._changed)
+
+        self._log(handler, 'one')
+        self.assertIsNone(handler._watch)
+        os.rename(self.path, self.path + '.1')
+        self._log(handler, 'two')
+        self.assertEqual('one\n', self._read(self.path + '.1'))
+        self.assertEqual('two\n', self._read(self.path))
+
+    def test_context_delta(self):
+        handler = self._handler()
+        handler.setFormatter(formatters.JSONFormatter(context_delta=True))
+        ctxt = _fake_context()
+        self._log(handler, 'one')
+        os.rename(self.path, self.path + '.1')
+        self._log(handler, 'two')
+        data = jsonutils.loads(self._read())
+        self.assertEqual(ctxt.request_id, data['context']['request_id'])
+
+    def test_reopen_on_mutate(self):
+        handler = self._handler(check_interval=60)
+        root = logging.getLogger(None)
+        root.addHandler(handler)
+        self.addCleanup(root.removeHandler, handler)
+        with mock.patch.object(handler, 'reopen') as reopen:
+            log._mutate_hook(self.CONF, {})  # type: ignore[arg-type]
+        reopen.assert_called_once_with()
+
+
+class RotatingFileHandlerTestCase(_FileHandlerTestCase):
+    handler_class = handlers.RotatingFileHandler
+
+    def test_format_once(self):
+        handler = self._handler(maxBytes=100, backupCount=1)
+        with mock.patch.object(
+            handler.formatter, 'format', wraps=handler.formatter.format
+        ) as format_mock:
+            handler.handle(self._record('one'))
+        format_mock.assert_called_once()
+
+    def test_context_delta(self):
+        handler = self._handler(maxBytes=100, backupCount=1)
+        handler.setFormatter(formatters.JSONFormatter(context_delta=True))
+        ctxt = _fake_context()
+        handler.handle(self._record('one'))
+        handler.handle(self._record('two'))
+        for path in (self.path + '.1', self.path):
+            data = jsonutils.loads(self._read(path))
+            self.assertEqual(ctxt.request_id, data['context']['request_id'])
+
+    def test_size_counter(self):
+        handler = self._handler(maxBytes=10, backupCount=1)
+        with mock.patch('os.fstat', wraps=os.fstat) as fstat:
+            for msg in ('one', 'two', 'three'):
+                handler.handle(self._record(msg))
+        # once for the first record and once before the rollover
+        self.assertEqual(2, fstat.call_count)
+        self.assertEqual('one\ntwo\n', self._read(self.path + '.1'))
+        self.assertEqual('three\n', self._read(self.path))
+
+    def test_truncated_file(self):
+        handler = self._handler(maxBytes=10, backupCount=1)
+        handler.handle(self._record('one'))
+        handler.handle(self._record('two'))
+        # copytruncate
+        os.truncate(self.path, 0)
+        handler.handle(self._record('three'))
+        self.assertFalse(os.path.exists(self.path + '.1'))
+        self.assertEqual('three\n', self._read(self.path))
+
+    def test_timed_record_created(self):
+        handler = self._handler(
+            handlers.TimedRotatingFileHandler, when='S', backupCount=1
+        )
+        record = self._record('one')
+        handler.rolloverAt = record.created + 1
+        with mock.patch('time.time', return_value=record.created + 2):
+            self.assertFalse(handler.shouldRollover(record))
+        handler.rolloverAt = record.created
+        self.assertTrue(handler.shouldRollover(record))
+
+
+class CompressingFileHandlerTestCase(_FileHandlerTestCase):
+    handler_class = handlers.RotatingFileHandler
+    handler_kwargs = {'compression': 'gzip'}
+
+    def _read_gzip(self, path):
+        with gzip.open(path, 'rt') as f:
+            return f.read()
+
+    def test_rotating(self):
+        handler = self._handler(maxBytes=5, backupCount=2)
+        for msg in ('one', 'two', 'three', 'four'):
+            self._log(handler, msg)
+        handler.close()
+        self.assertEqual(
+            ['test.log', 'test.log.1.gz', 'test.log.2.gz'],
+            sorted(os.listdir(self.log_dir)),
+        )
+        self.assertEqual('three\n', self._read_gzip(self.path + '.1.gz'))
+        self.assertEqual('two\n', self._read_gzip(self.path + '.2.gz'))
+
+    def test_rotating_mixed_backups(self):
+        # backups left by a previous configuration without compression
+        for i in (1, 2):
+            with open(f'{self.path}.{i}', 'w') as f:
+                f.write(f'plain{i}\n')
+        handler = self._handler(maxBytes=5, backupCount=2)
+        self._log(handler, 'one')
+        self._log(handler, 'two')
+        handler.close()
+        self.assertEqual(
+            ['test.log', 'test.log.1.gz', 'test.log.2'],
+            sorted(os.listdir(self.log_dir)),
+        )
+        self.assertEqual('one\n', self._read_gzip(self.path + '.1.gz'))
+
+    def test_compress_in_background(self):
+        handler = self._handler(maxBytes=7, backupCount=2)
+        compressing = threading.Event()
+        done = threading.Event()
+
+        def compress(*args):
+            compressing.set()
+            done.wait(5)
+
+        with mock.patch.object(handlers, '_compress_file', compress):
+            self._log(handler, 'one')
+            self._log(handler, 'two')
+            self.assertTrue(compressing.wait(5))
+            # logging goes on while the backup is compressed
+            self._log(handler, 'a')
+            done.set()
+            handler.close()
+        with open(self.path) as f:
+            self.assertEqual('two\na\n', f.read())
+
+    def test_timed_files_to_delete(self):
+        handler = self._handler(
+            handlers.TimedRotatingFileHandler, when='S', backupCount=2
+        )
+        suffixes = [f'2024-01-01_00-00-0{i}' for i in range(4)]
+        for suffix, extension in zip(suffixes, ('.gz', '', '.gz', '')):
+            open(f'{self.path}.{suffix}{extension}', 'w').close()
+        # an uncompressed copy left by an interrupted compression
+        open(f'{self.path}.{suffixes[0]}', 'w').close()
+        open(os.path.join(self.log_dir, 'other.log.gz'), 'w').close()
+        self.assertEqual(
+            sorted(
+                [
+                    f'{self.path}.{suffixes[0]}',
+                    f'{self.path}.{suffixes[0]}.gz',
+                    f'{self.path}.{suffixes[1]}',
+                ]
+            ),
+            sorted(handler.getFilesToDelete()),
+        )
+
+    def test_unknown_compression(self):
+        self.assertRaises(
+            ValueError,
+            handlers.RotatingFileHandler,
+            self.path,
+            compression='bz2',
+        )
+
+    @mock.patch.object(handlers, 'stdlib_zstd', None)
+    @mock.patch.object(handlers, 'zstandard', None)
+    def test_zstd_unavailable(self):
+        self.assertRaises(
+            RuntimeError,
+            handlers.RotatingFileHandler,
+            self.path,
+            compression='zstd',
+        )
+
+
 class LogLevelTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
@@ -501,6 +1540,10 @@ class LogLevelTestCase(BaseTestCase):
         self.assertDictEqual(log._loggers, res)
 
 
+def _raise_for_frames():
+    raise RuntimeError('frames')
+
+
 class JSONFormatterTestCase(LogTestBase):
     def setUp(self):
         super().setUp()
@@ -696,6 +1739,15 @@ class JSONFormatterTestCase(LogTestBase):
         data = jsonutils.loads(self.stream.getvalue())
         self.assertNotIn('unused', data['args'])
 
+    def test_escaped_percent_before_placeholder(self):
+        test_msg = '100%%%(test)s line'
+        test_data = {'test': 'log', 'unused': 'removeme'}
+        self.log.debug(test_msg, test_data)
+
+        data = jsonutils.loads(self.stream.getvalue())
+        self.assertEqual('100%log line', data['message'])
+        self.assertEqual({'test': 'log'}, data['args'])
+
     def test_entire_dict(self):
         test_msg = 'This is a %s dict'
         test_data = {'test': 'log', 'other': 'value'}
@@ -704,6 +1756,296 @@ class JSONFormatterTestCase(LogTestBase):
         data = jsonutils.loads(self.stream.getvalue())
         self.assertEqual(test_data, data['args'])
 
+    def test_all_fields(self):
+        self.log.info('testing')
+        data = jsonutils.loads(self.stream.getvalue())
+        self.assertEqual(
+            [
+                key
+                for key in formatters.JSONLogRecord.__annotations__
+                if key != 'traceback_frames'
+            ],
+            list(data),
+        )
+
+    def _exc_record(self):
+        try:
+            _raise_for_frames()
+        except RuntimeError:
+            exc_info = sys.exc_info()
+        return logging.LogRecord(
+            'test', logging.ERROR, 'test', 0, 'testing', {}, exc_info
+        )
+
+    def test_traceback_frames(self):
+        formatter = formatters.JSONFormatter(traceback_frames=True)
+        data = jsonutils.loads(formatter.format(self._exc_record()))
+        self.assertIn('traceback', data)
+        frames = data['traceback_frames']
+        self.assertEqual(2, len(frames))
+        self.assertEqual('_exc_record', frames[0]['name'])
+        self.assertEqual(
+            {
+                'filename': __file__,
+                'lineno': _raise_for_frames.__code__.co_firstlineno + 1,
+                'name': '_raise_for_frames',
+                'line': "raise RuntimeError('frames')",
+            },
+            frames[1],
+        )
+
+    def test_traceback_frames_no_exception(self):
+        formatter = formatters.JSONFormatter(fields=['traceback_frames'])
+        record = logging.LogRecord(
+            'test', logging.INFO, 'test', 0, 'testing', {}, None
+        )
+        self.assertEqual(
+            '{"traceback_frames": null}', formatter.format(record)
+        )
+
+    def test_traceback_frames_cached(self):
+        formatter = formatters.JSONFormatter(fields=['traceback_frames'])
+        formatter.format(self._exc_record())
+        with mock.patch('linecache.getline') as getline:
+            data = jsonutils.loads(formatter.format(self._exc_record()))
+        getline.assert_not_called()
+        self.assertEqual(
+            "raise RuntimeError('frames')", data['traceback_frames'][1]['line']
+        )
+
+    def test_fields(self):
+        self.handler.setFormatter(
+            formatters.JSONFormatter(
+                fields=['extra', 'message', 'context', 'levelname']
+            )
+        )
+        ctxt = _fake_context()
+        self.log.info('testing %s', 'fields', context=ctxt, key='value')
+        data = jsonutils.loads(self.stream.getvalue())
+        # the keys are in the order of JSONLogRecord
+        self.assertEqual(
+            ['message', 'levelname', 'context', 'extra'], list(data)
+        )
+        self.assertEqual('testing fields', data['message'])
+        self.assertEqual('INFO', data['levelname'])
+        self.assertEqual(ctxt.user_id, data['context']['user'])
+        self.assertEqual('value', data['extra']['key'])
+        self.assertNotIn('context', data['extra'])
+
+    def test_unrequested_fields_not_computed(self):
+        formatter = formatters.JSONFormatter(fields=['message'])
+        try:
+            raise RuntimeError('test_exception')
+        except RuntimeError:
+            record = logging.LogRecord(
+                'test',
+                logging.ERROR,
+                'test',
+                0,
+                'testing %(a)s',
+                ({'a': 1, 'b': 2},),
+                sys.exc_info(),
+            )
+        with (
+            mock.patch.object(
+                formatters, '_get_error_summary'
+            ) as get_error_summary,
+            mock.patch.object(
+                formatters, '_update_record_with_context'
+            ) as update_record_with_context,
+            mock.patch.object(
+                formatter, 'formatException'
+            ) as format_exception,
+            mock.patch.object(formatters, '_MSG_KEY_REGEX') as msg_key_regex,
+        ):
+            self.assertEqual(
+                '{"message": "testing 1"}', formatter.format(record)
+            )
+        get_error_summary.assert_not_called()
+        update_record_with_context.assert_not_called()
+        format_exception.assert_not_called()
+        msg_key_regex.findall.assert_not_called()
+
+    def _json_record(self, msg='testing'):
+        return logging.LogRecord(
+            'test', logging.INFO, 'test', 0, msg, {}, None
+        )
+
+    def test_static_fields(self):
+        for encoder in ('stdlib', 'orjson'):
+            if encoder == 'orjson' and not formatters.orjson:
+                continue
+            formatter = formatters.JSONFormatter(encoder=encoder)
+            static = formatters.JSONFormatter(
+                encoder=encoder, static_fields=True
+            )
+            record = self._json_record()
+            text = static.format(record)
+            self.assertEqual(
+                jsonutils.loads(formatter.format(record)),
+                jsonutils.loads(text),
+            )
+            self.assertEqual(
+                ['process_name', 'process', 'hostname'],
+                list(jsonutils.loads(text))[:3],
+            )
+
+    def test_static_fields_serialized_once(self):
+        formatter = formatters.JSONFormatter(static_fields=True)
+        formatter.format(self._json_record())
+        with mock.patch.object(
+            formatter, '_dumps', wraps=formatter._dumps
+        ) as dumps:
+            formatter.format(self._json_record())
+            self.assertEqual(1, dumps.call_count)
+            # e.g. after a fork
+            record = self._json_record()
+            record.process = 1
+            data = jsonutils.loads(formatter.format(record))
+            self.assertEqual(3, dumps.call_count)
+        self.assertEqual(1, data['process'])
+
+    def test_static_fields_only(self):
+        formatter = formatters.JSONFormatter(
+            fields=['hostname', 'process'], static_fields=True
+        )
+        record = self._json_record()
+        data = jsonutils.loads(formatter.format(record))
+        self.assertEqual(
+            {'hostname': formatter.hostname, 'process': record.process}, data
+        )
+
+    def test_unknown_fields(self):
+        self.assertRaises(
+            ValueError, formatters.JSONFormatter, fields=['message', 'nope']
+        )
+
+    def _context_record(self, ctxt):
+        record = self._json_record()
+        record.context = ctxt
+        return record
+
+    def test_context_delta(self):
+        formatter = formatters.JSONFormatter(context_delta=True)
+        ctxt = _fake_context()
+        ref = {'$ref': ctxt.request_id}
+
+        def context_of(record):
+            return jsonutils.loads(formatter.format(record))['context']
+
+        record = self._context_record(ctxt)
+        self.assertEqual(ctxt.request_id, context_of(record)['request_id'])
+        self.assertEqual(ref, context_of(self._context_record(ctxt)))
+
+        ctxt.user_name = 'another'
+        self.assertEqual(
+            'another',
+            context_of(self._context_record(ctxt))['user_name'],
+        )
+        self.assertEqual(ref, context_of(self._context_record(ctxt)))
+
+        other = _fake_context()
+        self.assertNotEqual(
+            {'$ref': other.request_id},
+            context_of(self._context_record(other)),
+        )
+        self.assertEqual(ref, context_of(self._context_record(ctxt)))
+
+    def test_forget_contexts(self):
+        formatter = formatters.JSONFormatter(context_delta=True)
+        ctxt = _fake_context()
+        formatter.format(self._context_record(ctxt))
+        formatter.forget_contexts()
+        data = jsonutils.loads(formatter.format(self._context_record(ctxt)))
+        self.assertEqual(ctxt.request_id, data['context']['request_id'])
+
+    def test_context_delta_evicted(self):
+        formatter = formatters.JSONFormatter(context_delta=True)
+        first = _fake_context()
+        second = _fake_context()
+        with mock.patch.object(formatters, '_CONTEXT_DELTA_SIZE', 1):
+            for ctxt in (first, second, first):
+                data = jsonutils.loads(
+                    formatter.format(self._context_record(ctxt))
+                )
+                self.assertEqual(
+                    ctxt.request_id, data['context']['request_id']
+                )
+
+    def test_context_delta_inflated(self):
+        formatter = formatters.JSONFormatter(context_delta=True)
+        ctxt = _fake_context()
+        text = '\n'.join(
+            formatter.format(self._context_record(ctxt)) for i in range(3)
+        )
+        records = list(
+            convert_json.reformat_json(
+                io.StringIO(text), lambda record: iter([record])
+            )
+        )
+        self.assertEqual(3, len(records))
+        for record in records:
+            self.assertEqual(
+                ctxt.request_id,
+                record['context']['request_id'],  # type: ignore[index]
+            )
+
+
+class MsgpackFormatterTestCase(LogTestBase):
+    def _record(self):
+        record = logging.LogRecord(
+            'test',
+            logging.INFO,
+            'test',
+            0,
+            'This is a %(test)s line',
+            ({'test': 'log'},),
+            None,
+        )
+        record.context = _fake_context()
+        record.extra = {'key': 'value', 'obj': object()}
+        return record
+
+    def test_same_record_as_json(self):
+        record = self._record()
+        json_data = jsonutils.loads(formatters.JSONFormatter().format(record))
+        frame = formatters.MsgpackFormatter().format(record)
+        self.assertIsInstance(frame, bytes)
+        self.assertEqual(len(frame) - 4, int.from_bytes(frame[:4], 'big'))
+        data = msgpack.unpackb(frame[4:])
+        self.assertEqual(json_data, data)
+        self.assertEqual('log', data['args']['test'])
+        self.assertEqual('value', data['extra']['key'])
+        self.assertTrue(data['context'])
+
+    def test_fields(self):
+        formatter = formatters.MsgpackFormatter(fields=['message'])
+        frame = formatter.format(self._record())
+        self.assertEqual(
+            {'message': 'This is a log line'}, msgpack.unpackb(frame[4:])
+        )
+
+    def test_file_handler(self):
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        path = os.path.join(log_dir, 'test.msgpack')
+        handler = logging.FileHandler(path, mode='ab')
+        handler.terminator = b''  # type: ignore[assignment]
+        handler.setFormatter(formatters.MsgpackFormatter())
+        logger = logging.getLogger('test-msgpack')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        logger.warning('first %s', 'record')
+        logger.error('second record')
+        handler.flush()
+        with open(path, 'rb') as fh:
+            records = list(convert_json.read_msgpack(fh))
+        self.assertEqual(
+            ['first record', 'second record'],
+            [record['message'] for record in records],  # type: ignore
+        )
+
 
 def get_fake_datetime(retval):
     class FakeDateTime(datetime.datetime):
@@ -804,6 +2146,211 @@ class FluentFormatterTestCase(LogTestBase):
         self.assertEqual('ERROR', data['level'])
         self.assertTrue(data['traceback'])
 
+    def test_traceback_lines(self):
+        try:
+            raise RuntimeError('multi\nline  ')
+        except RuntimeError:
+            ei = sys.exc_info()
+        lines = traceback.format_exception(*ei)
+        expected = [
+            line for text in lines for line in text.rstrip().splitlines()
+        ]
+        formatter = formatters.FluentFormatter()
+        self.assertEqual('\n'.join(expected), formatter.formatException(ei))
+        self.assertEqual(
+            '\n'.join(lines),
+            formatter.formatException(ei, strip_newlines=False),
+        )
+
+    def test_extra_encoder(self):
+        for encoder in ('stdlib', 'orjson'):
+            if encoder == 'orjson' and not formatters.orjson:
+                continue
+            formatter = formatters.FluentFormatter(encoder=encoder)
+            record = logging.LogRecord(
+                'test', logging.INFO, 'test', 0, 'message', None, None
+            )
+            record.extra = {'key': 'value', 'list': [1], 'tuple': (1, 'a')}
+            extra = formatter.format(record)['extra']
+            self.assertEqual('value', extra['key'])
+            self.assertEqual([1], extra['list'])
+            self.assertEqual([1, 'a'], jsonutils.loads(extra['tuple']))
+
+    def test_unknown_encoder(self):
+        self.assertRaises(
+            ValueError, formatters.FluentFormatter, encoder='nope'
+        )
+
+
+def _otel_attributes(attributes):
+    return {a['key']: a['value'] for a in attributes}
+
+
+class OTelFormatterTestCase(LogTestBase):
+    def _record(self, level=logging.INFO, exc_info=None):
+        record = logging.LogRecord(
+            'test.otel', level, 'path', 12, 'hello %s', ('world',), exc_info
+        )
+        record.context = _fake_context()
+        record.extra = {'key': 'value', 'number': 3, 'list': [1.5, None]}
+        return record
+
+    def test_format(self):
+        formatter = formatters.OTelFormatter(
+            service_name='nova-api', resource_attributes={'a': True}
+        )
+        record = self._record()
+        data = jsonutils.loads(formatter.format(record))
+
+        resource_logs = data['resourceLogs']
+        self.assertEqual(1, len(resource_logs))
+        resource = _otel_attributes(resource_logs[0]['resource']['attributes'])
+        self.assertEqual({'stringValue': 'nova-api'}, resource['service.name'])
+        self.assertEqual(
+            {'intValue': str(record.process)}, resource['process.pid']
+        )
+        self.assertEqual({'boolValue': True}, resource['a'])
+        scope_logs = resource_logs[0]['scopeLogs']
+        self.assertEqual({'name': 'test.otel'}, scope_logs[0]['scope'])
+        log_record = scope_logs[0]['logRecords'][0]
+        self.assertEqual(
+            str(int(record.created * 1e9)), log_record['timeUnixNano']
+        )
+        self.assertEqual(9, log_record['severityNumber'])
+        self.assertEqual('INFO', log_record['severityText'])
+        self.assertEqual({'stringValue': 'hello world'}, log_record['body'])
+        self.assertNotIn('traceId', log_record)
+        attributes = _otel_attributes(log_record['attributes'])
+        self.assertEqual({'stringValue': 'path'}, attributes['code.filepath'])
+        self.assertEqual({'intValue': '12'}, attributes['code.lineno'])
+        self.assertEqual(
+            {'stringValue': record.context.request_id},
+            attributes['openstack.request_id'],
+        )
+        self.assertEqual(
+            {'stringValue': 'mytenant'}, attributes['openstack.project_name']
+        )
+        self.assertNotIn('openstack.domain_name', attributes)
+        self.assertEqual({'stringValue': 'value'}, attributes['key'])
+        self.assertEqual({'intValue': '3'}, attributes['number'])
+        self.assertEqual(
+            {'arrayValue': {'values': [{'doubleValue': 1.5}, {}]}},
+            attributes['list'],
+        )
+        self.assertNotIn('context', attributes)
+        self.assertNotIn('exception.type', attributes)
+
+    def test_resource_serialized_once(self):
+        formatter = formatters.OTelFormatter()
+        formatter.format(self._record())
+        with mock.patch.object(
+            formatter, '_dumps', wraps=formatter._dumps
+        ) as dumps:
+            formatter.format(self._record())
+            self.assertEqual(1, dumps.call_count)
+            # e.g. after a fork
+            record = self._record()
+            record.process = 1
+            data = jsonutils.loads(formatter.format(record))
+            self.assertEqual(3, dumps.call_count)
+        resource = _otel_attributes(
+            data['resourceLogs'][0]['resource']['attributes']
+        )
+        self.assertEqual({'intValue': '1'}, resource['process.pid'])
+
+    def test_exception(self):
+        try:
+            raise RuntimeError('boom')
+        except RuntimeError:
+            exc_info = sys.exc_info()
+        data = jsonutils.loads(
+            formatters.OTelFormatter().format(
+                self._record(logging.ERROR, exc_info)
+            )
+        )
+        log_record = data['resourceLogs'][0]['scopeLogs'][0]['logRecords'][0]
+        self.assertEqual(17, log_record['severityNumber'])
+        attributes = _otel_attributes(log_record['attributes'])
+        self.assertEqual(
+            {'stringValue': 'RuntimeError'}, attributes['exception.type']
+        )
+        self.assertEqual(
+            {'stringValue': 'boom'}, attributes['exception.message']
+        )
+        self.assertEqual(
+            {'stringValue': ''.join(traceback.format_exception(*exc_info))},
+            attributes['exception.stacktrace'],
+        )
+
+        try:
+            raise cfg.NoSuchOptError('boom')
+        except cfg.NoSuchOptError:
+            exc_info = sys.exc_info()
+        data = jsonutils.loads(
+            formatters.OTelFormatter().format(
+                self._record(logging.ERROR, exc_info)
+            )
+        )
+        log_record = data['resourceLogs'][0]['scopeLogs'][0]['logRecords'][0]
+        self.assertEqual(
+            {'stringValue': 'oslo_config.cfg.NoSuchOptError'},
+            _otel_attributes(log_record['attributes'])['exception.type'],
+        )
+
+    def test_severity_number(self):
+        for levelno, number in (
+            (handlers._TRACE, 1),
+            (logging.DEBUG, 5),
+            (logging.INFO, 9),
+            (handlers._AUDIT, 10),
+            (logging.WARNING, 13),
+            (logging.ERROR, 17),
+            (logging.CRITICAL, 21),
+            (logging.CRITICAL + 10, 24),
+        ):
+            self.assertEqual(
+                number,
+                formatters._otel_severity_number(levelno),
+                str(levelno),
+            )
+
+    def test_values(self):
+        for value, expected in (
+            (False, {'boolValue': False}),
+            (2**70, {'intValue': str(2**70)}),
+            (float('nan'), {'doubleValue': 'NaN'}),
+            (float('-inf'), {'doubleValue': '-Infinity'}),
+            (b'\x00', {'bytesValue': 'AA=='}),
+            (
+                {1: 'a'},
+                {
+                    'kvlistValue': {
+                        'values': [{'key': '1', 'value': {'stringValue': 'a'}}]
+                    }
+                },
+            ),
+            (('a',), {'arrayValue': {'values': [{'stringValue': 'a'}]}}),
+            (datetime.date(2024, 1, 2), {'stringValue': '2024-01-02'}),
+        ):
+            self.assertEqual(expected, formatters._otel_value(value))
+
+    def test_span(self):
+        span_context = mock.Mock(
+            is_valid=True, trace_id=1, span_id=2, trace_flags=1
+        )
+        span = mock.Mock()
+        span.get_span_context.return_value = span_context
+        otel_trace = mock.Mock()
+        otel_trace.get_current_span.return_value = span
+        with mock.patch.object(formatters, 'otel_trace', otel_trace):
+            data = jsonutils.loads(
+                formatters.OTelFormatter().format(self._record())
+            )
+        log_record = data['resourceLogs'][0]['scopeLogs'][0]['logRecords'][0]
+        self.assertEqual('0' * 31 + '1', log_record['traceId'])
+        self.assertEqual('0' * 15 + '2', log_record['spanId'])
+        self.assertEqual(1, log_record['flags'])
+
 
 class ContextFormatterTestCase(LogTestBase):
     def setUp(self):
@@ -1013,7 +2560,11 @@ class ContextFormatterTestCase(LogTestBase):
 
     @mock.patch(
         "datetime.datetime",
-        get_fake_datetime(datetime.datetime(2015, 12, 16, 13, 54, 26, 517893)),
+        get_fake_datetime(datetime.datetime(2015, 12, 16, 13, 54, 26)),
+    )
+    @mock.patch("time.time", new=mock.Mock(return_value=1450274066.517893))
+    @mock.patch(
+        "time.time_ns", new=mock.Mock(return_value=1450274066517893000)
     )
     @mock.patch("dateutil.tz.tzlocal", new=mock.Mock(return_value=tz.tzutc()))
     def test_rfc5424_isotime_format(self):
@@ -1059,6 +2610,68 @@ class ContextFormatterTestCase(LogTestBase):
         self.log.info(msg, arg)
         self.assertIn(arg['thing'], self.stream.getvalue())
 
+    def test_exception_prefix(self):
+        self.config(logging_exception_prefix="PFX %(name)s ")
+
+        def recurse(depth):
+            if depth:
+                recurse(depth - 1)
+            raise RuntimeError('deep')
+
+        try:
+            recurse(20)
+        except RuntimeError:
+            self.log.exception('failed')
+
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual('NOCTXT: failed: RuntimeError: deep', lines[0])
+        # The traceback text ends with a newline, hence the prefix alone
+        # on the last line.
+        self.assertEqual('PFX root ', lines[-1])
+        self.assertEqual('PFX root RuntimeError: deep', lines[-2])
+        self.assertEqual(
+            'PFX root Traceback (most recent call last):', lines[1]
+        )
+        for line in lines[1:]:
+            self.assertTrue(line.startswith('PFX root '), line)
+        self.assertGreater(len(lines), 10)
+
+    def test_format_variant_cached(self):
+        self.log.info('foo')
+        self.log.info('bar')
+        self.log.debug('baz')
+        self.assertEqual(
+            "NOCTXT: foo\nNOCTXT: bar\nNOCTXT: baz --DBG\n",
+            self.stream.getvalue(),
+        )
+        cache = self.handler.formatter._format_cache
+        key = ('NOCTXT: %(message)s', False, None)
+        self.assertEqual({key, key[:2] + ('--DBG',)}, set(cache))
+        variant = cache[key]
+        with mock.patch('logging.PercentStyle') as style:
+            self.log.info('qux')
+        style.assert_not_called()
+        self.assertIs(variant, cache[key])
+
+    def test_format_variant_override(self):
+        self.log.info('foo')
+        self.config(logging_default_format_string="NEW: %(message)s")
+        self.log.info('bar')
+        self.assertEqual("NOCTXT: foo\nNEW: bar\n", self.stream.getvalue())
+
+    def test_options_override(self):
+        self.config(
+            logging_default_format_string='%(instance)s%(message)s',
+            instance_uuid_format='[%(uuid)s] ',
+        )
+        self.log.info('foo', instance_uuid='uuid-1')
+        # the options are read when they are used, not only after a reload
+        self.config_fixture.config(instance_uuid_format='{%(uuid)s} ')
+        self.log.info('bar', instance_uuid='uuid-2')
+        self.assertEqual(
+            "[uuid-1] foo\n{uuid-2} bar\n", self.stream.getvalue()
+        )
+
 
 class ExceptionLoggingTestCase(LogTestBase):
     """Test that Exceptions are logged."""
@@ -1085,13 +2698,37 @@ class ExceptionLoggingTestCase(LogTestBase):
             message="Exception is not logged",
         )
 
+    def test_excepthook_flushes_async_handler(self):
+        target = _RecordingHandler()
+        handler = handlers.AsyncHandler([target])
+        self.addCleanup(handler.close)
+        root = log.getLogger(None).logger
+        root.addHandler(handler)
+        self.addCleanup(root.removeHandler, handler)
+        excepthook = log._create_logging_excepthook('somename')
+
+        with mock.patch.object(handler, 'flush', wraps=handler.flush) as f:
+            try:
+                raise Exception('Some error happened')
+            except Exception:
+                excepthook(*sys.exc_info())
+            f.assert_called_once_with()
+        self.assertEqual(
+            ['Unhandled error'],
+            [record.getMessage() for record in target.records],
+        )
+
     def test_excepthook_installed(self):
         log.setup(self.CONF, "test_excepthook_installed")
         self.assertTrue(sys.excepthook != sys.__excepthook__)
 
     @mock.patch(
         "datetime.datetime",
-        get_fake_datetime(datetime.datetime(2015, 12, 16, 13, 54, 26, 517893)),
+        get_fake_datetime(datetime.datetime(2015, 12, 16, 13, 54, 26)),
+    )
+    @mock.patch("time.time", new=mock.Mock(return_value=1450274066.517893))
+    @mock.patch(
+        "time.time_ns", new=mock.Mock(return_value=1450274066517893000)
     )
     @mock.patch("dateutil.tz.tzlocal", new=mock.Mock(return_value=tz.tzutc()))
     def test_rfc5424_isotime_format(self):
@@ -1776,6 +3413,175 @@ class LogConfigOptsTestCase(BaseTestCase):
             formatter = handler.formatter
             self.assertIsInstance(formatter, formatters.JSONFormatter)
 
+    def test_handlers_share_formatter(self):
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        self.CONF(['--log-dir', log_dir])
+        self.config(use_stderr=True)
+        log._setup_logging_from_conf(self.CONF, 'test', 'test')
+        logger = log._loggers[None].logger
+        self.assertEqual(2, len(logger.handlers))
+        self.assertIs(
+            logger.handlers[0].formatter, logger.handlers[1].formatter
+        )
+
+    def test_json_encoder(self):
+        self.CONF([])
+        self.config(use_stderr=True, use_json=True, json_encoder='stdlib')
+        with mock.patch.object(
+            formatters, '_get_json_encoder', wraps=formatters._get_json_encoder
+        ) as get_json_encoder:
+            log._setup_logging_from_conf(self.CONF, 'test', 'test')
+        get_json_encoder.assert_called_once_with('stdlib')
+        logger = log._loggers[None].logger
+        self.assertIsInstance(
+            logger.handlers[0].formatter, formatters.JSONFormatter
+        )
+
+    def test_json_fields(self):
+        self.CONF([])
+        self.config(use_stderr=True, use_json=True, json_fields=['message'])
+        log._setup_logging_from_conf(self.CONF, 'test', 'test')
+        logger = log._loggers[None].logger
+        formatter = logger.handlers[0].formatter
+        assert formatter is not None
+        record = logging.LogRecord(
+            'test', logging.INFO, 'test', 0, 'test message', {}, None
+        )
+        self.assertEqual(
+            '{"message": "test message"}', formatter.format(record)
+        )
+
+    def test_log_async(self):
+        self.CONF([])
+        self.config(
+            use_stderr=True,
+            log_async=True,
+            log_async_queue_size=10,
+            log_async_overflow='drop-newest',
+        )
+        log._setup_logging_from_conf(self.CONF, 'test', 'test')
+        logger = log._loggers[None].logger
+        self.assertEqual(1, len(logger.handlers))
+        handler = logger.handlers[0]
+        assert isinstance(handler, handlers.AsyncHandler)
+        self.assertEqual(10, handler.queue.maxsize)
+        self.assertEqual('drop-newest', handler.overflow)
+        self.assertEqual(1, len(handler.handlers))
+        self.assertIsInstance(handler.handlers[0], logging.StreamHandler)
+        self.assertIsInstance(
+            handler.handlers[0].formatter, formatters.ContextFormatter
+        )
+
+        with mock.patch.object(handler, 'close') as close:
+            self.config(log_async=False)
+            log._setup_logging_from_conf(self.CONF, 'test', 'test')
+            close.assert_called_once_with()
+        handler.close()
+        self.assertNotIsInstance(logger.handlers[0], handlers.AsyncHandler)
+
+    def test_json_context_delta(self):
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        stderr = io.StringIO()
+        with mock.patch('sys.stderr', stderr):
+            self.CONF(['--log-dir', log_dir])
+            self.config(
+                use_stderr=True,
+                log_color=True,
+                use_json=True,
+                json_context_delta=True,
+            )
+            log._setup_logging_from_conf(self.CONF, 'test', 'test')
+        root = log._loggers[None].logger
+        self.assertIsInstance(root.handlers[1], handlers.ColorHandler)
+        self.assertIsNot(
+            root.handlers[0].formatter, root.handlers[1].formatter
+        )
+
+        ctxt = _fake_context()
+        logger = logging.getLogger('test.context_delta')
+        logger.info('one')
+        logger.info('two')
+        for handler in root.handlers:
+            handler.flush()
+        (log_file,) = os.listdir(log_dir)
+        with open(os.path.join(log_dir, log_file)) as f:
+            # ColorHandler ends the lines with the color reset sequence
+            outputs = [f.read(), stderr.getvalue().replace('\033[00m', '')]
+        for output in outputs:
+            contexts = [
+                jsonutils.loads(line)['context']
+                for line in output.splitlines()
+            ]
+            self.assertEqual(ctxt.request_id, contexts[0]['request_id'])
+            self.assertEqual([{'$ref': ctxt.request_id}], contexts[1:])
+
+    def test_shared_formatter_renders_once(self):
+        formatter = formatters.ContextFormatter(config=self.CONF)
+        formatters._reuse_rendered_text(formatter)
+        record = logging.LogRecord(
+            'test', logging.INFO, 'test', 0, 'test message', {}, None
+        )
+        with mock.patch.object(
+            formatter, '_render', wraps=formatter._render
+        ) as render:
+            text = formatter.format(record)
+            self.assertEqual(text, formatter.format(record))
+            self.assertEqual(1, render.call_count)
+            # ColorHandler changes the record, so it has to be re-rendered
+            record.color = handlers.ColorHandler.LEVEL_COLORS[logging.INFO]
+            formatter.format(record)
+            self.assertEqual(2, render.call_count)
+            other = logging.makeLogRecord(record.__dict__)
+            formatter.format(other)
+            self.assertEqual(3, render.call_count)
+
+    def test_json_formatter_renders_once(self):
+        formatter = formatters.JSONFormatter()
+        formatters._reuse_rendered_text(formatter)
+        record = logging.LogRecord(
+            'test', logging.INFO, 'test', 0, 'test message', {}, None
+        )
+        with mock.patch.object(
+            formatter, '_render', wraps=formatter._render
+        ) as render:
+            text = formatter.format(record)
+            self.assertEqual(text, formatter.format(record))
+            self.assertEqual(1, render.call_count)
+
+    def test_setup_reuses_rendered_text(self):
+        self.CONF([])
+        self.config(use_stderr=True)
+        log._setup_logging_from_conf(self.CONF, 'test', 'test')
+        formatter = log._loggers[None].logger.handlers[0].formatter
+        assert isinstance(formatter, formatters.ContextFormatter)
+        self.assertIsNotNone(formatter._rendered)
+        self.assertIsNone(
+            formatters.ContextFormatter(config=self.CONF)._rendered
+        )
+
+    def test_handler_filter_changes_message(self):
+        def mask(record):
+            record.msg = record.msg.replace('secret', '***')
+            return True
+
+        for reuse in (False, True):
+            formatter = formatters.ContextFormatter(config=self.CONF)
+            if reuse:
+                formatters._reuse_rendered_text(formatter)
+            streams = [io.StringIO(), io.StringIO()]
+            logger = logging.getLogger(f'test.filter.{reuse}')
+            logger.propagate = False
+            for stream in streams:
+                handler = logging.StreamHandler(stream)
+                handler.setFormatter(formatter)
+                logger.addHandler(handler)
+            logger.handlers[1].addFilter(mask)
+            logger.warning('password=secret')
+            self.assertIn('password=secret', streams[0].getvalue())
+            self.assertIn('password=***', streams[1].getvalue())
+
     def test_handlers_cleanup(self):
         """Test that all old handlers get removed from log_root."""
         old_handlers = [
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Micro-benchmarks for the oslo.log formatters.
+
+Run all the benchmarks with ``tox -e benchmark`` or pass the names of the
+ones to run::
+
+    python tools/benchmark_formatters.py context-deep-traceback
+"""
+
+import argparse
+from collections.abc import Callable
+import datetime
+import logging
+import sys
+import timeit
+
+from oslo_config import cfg
+
+from oslo_log import formatters
+from oslo_log import log
+
+
+def _recurse(depth: int) -> None:
+    # NOTE: Alternate between two functions so that the interpreter does
+    # not collapse the repeated frames of the traceback.
+    if depth:
+        _recurse_again(depth - 1)
+    raise RuntimeError('deep traceback')
+
+
+def _recurse_again(depth: int) -> None:
+    if depth:
+        _recurse(depth - 1)
+    raise RuntimeError('deep traceback')
+
+
+def _exc_info(depth: int) -> formatters._SysExcInfoType:
+    try:
+        _recurse(depth)
+    except RuntimeError:
+        return sys.exc_info()
+    raise AssertionError('unreachable')
+
+
+def _conf() -> cfg.ConfigOpts:
+    conf = cfg.ConfigOpts()
+    log.register_options(conf)
+    conf([])
+    return conf
+
+
+def _record(
+    level: int = logging.INFO,
+    exc_info: formatters._SysExcInfoType | None = None,
+) -> logging.LogRecord:
+    return logging.LogRecord(
+        'benchmark', level, __file__, 1, 'message %s', ('arg',), exc_info
+    )
+
+
+def context_deep_traceback(depth: int) -> Callable[[], object]:
+    formatter = formatters.ContextFormatter(config=_conf())
+    exc_info = _exc_info(depth)
+    record = _record(logging.ERROR, exc_info)
+    # set by ContextFormatter.format() before it formats the exception
+    record.instance = ''
+
+    def run() -> object:
+        return formatter.formatException(exc_info, record=record)
+
+    return run
+
+
+def context_format(depth: int) -> Callable[[], object]:
+    formatter = formatters.ContextFormatter(config=_conf())
+
+    def run() -> object:
+        return formatter.format(_record())
+
+    return run
+
+
+def json_format(encoder: str) -> Callable[[int], Callable[[], object]]:
+    def factory(depth: int) -> Callable[[], object]:
+        formatter = formatters.JSONFormatter(encoder=encoder)
+
+        def run() -> object:
+            return formatter.format(_record())
+
+        return run
+
+    return factory
+
+
+def msgpack_format(depth: int) -> Callable[[], object]:
+    formatter = formatters.MsgpackFormatter()
+
+    def run() -> object:
+        return formatter.format(_record())
+
+    return run
+
+
+def fluent_deep_traceback(depth: int) -> Callable[[], object]:
+    formatter = formatters.FluentFormatter()
+    exc_info = _exc_info(depth)
+
+    def run() -> object:
+        return formatter.formatException(exc_info)
+
+    return run
+
+
+def fluent_extras(encoder: str) -> Callable[[int], Callable[[], object]]:
+    def factory(depth: int) -> Callable[[], object]:
+        formatter = formatters.FluentFormatter(encoder=encoder)
+        extra: dict[str, object] = {}
+        for i in range(10):
+            extra[f'str{i}'] = 'value'
+            extra[f'int{i}'] = i
+            extra[f'date{i}'] = datetime.datetime(2024, 1, 1, i)
+            extra[f'tuple{i}'] = (i, 'value')
+
+        def run() -> object:
+            record = _record()
+            record.extra = extra
+            return formatter.format(record)
+
+        return run
+
+    return factory
+
+
+def otel_format(depth: int) -> Callable[[], object]:
+    formatter = formatters.OTelFormatter()
+
+    def run() -> object:
+        return formatter.format(_record())
+
+    return run
+
+
+BENCHMARKS: dict[str, Callable[[int], Callable[[], object]]] = {
+    'context-deep-traceback': context_deep_traceback,
+    'context-format': context_format,
+    'json-format': json_format('stdlib'),
+    'json-format-orjson': json_format('orjson'),
+    'msgpack-format': msgpack_format,
+    'fluent-deep-traceback': fluent_deep_traceback,
+    'fluent-extras': fluent_extras('stdlib'),
+    'fluent-extras-orjson': fluent_extras('orjson'),
+    'otel-format': otel_format,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        'benchmarks',
+        nargs='*',
+        metavar='BENCHMARK',
+        help=f'Benchmarks to run, out of {", ".join(BENCHMARKS)}. '
+        'All of them by default.',
+    )
+    parser.add_argument(
+        '--depth',
+        type=int,
+        default=100,
+        help='Depth of the tracebacks',
+    )
+    parser.add_argument(
+        '--number', type=int, default=1000, help='Iterations per repeat'
+    )
+    parser.add_argument('--repeat', type=int, default=5, help='Repeats')
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark: {name}')
+
+    for name in args.benchmarks or BENCHMARKS:
+        try:
+            run = BENCHMARKS[name](args.depth)
+        except RuntimeError as e:
+            # an optional library is missing
+            print(f'{name}: skipped, {e}')
+            continue
+        best = min(timeit.repeat(run, number=args.number, repeat=args.repeat))
+        print(f'{name}: {best / args.number * 1e6:.1f} usec per call')
+
+
+if __name__ == '__main__':
+    main()